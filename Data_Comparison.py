@@ -1,77 +1,134 @@
 import pandas as pd
 import os
-import re
+import argparse
 import datetime
-import matplotlib.pyplot as plt
-
-start = datetime.datetime.now()
-
-ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
-oracle_source = os.path.join(ROOT_PATH, '20240221_ADDRESSES_BE_UPDATE.csv')
-datacloud_target = os.path.join(ROOT_PATH, '20240221_ADDRESSES_BE_UPDATE_S3.csv')
-# oracle_source = os.path.join(ROOT_PATH, '20240221_ADDRESSES_BE_UPDATE.csv')
-# datacloud_target = os.path.join(ROOT_PATH, '20240221_ADDRESSES_BE_UPDATE_S3.csv')
-
-delimiter = '|'
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import comparison
+import comparison_rules
+import csv_reader
+import incremental
+import instrumentation
+import out_of_core as out_of_core_comparison
+import output_sinks
+import schema
+import snapshot_cache
+import sniffing
+
+# Defaults of compare() and the command line
 primary_key = 'CS_COMPANY_ID'
-
 chunk_size = 1000000  # Adjust the chunk size as needed
+comparison_mode = 'hash'  # 'hash': compare one 64-bit hash per row, 'merge': merge both files on every column
+snapshot_cache_max_bytes = 20 * 1024 ** 3  # Least recently used files are evicted above this size
 
+REPORT_FILE = 'output.txt'
+PLOT_FILE = 'metrics_comparison_plot.png'
 
-def read_csv_with_chunks(file_path, delimiter, encoding, result_container):
-    df = pd.read_csv(file_path, delimiter=delimiter, encoding=encoding, on_bad_lines='skip', index_col=False)
-    result_container.append(df)
 
-
-def read_and_merge_csv(file_path, delimiter, encoding):
-    chunks = pd.read_csv(file_path, delimiter=delimiter, encoding=encoding, on_bad_lines='skip', index_col=False,
-                         chunksize=chunk_size, engine='python')
-    merged_df = pd.concat(chunks, ignore_index=True)
-    merged_df.sort_values(by=primary_key, inplace=True)
+@dataclass
+class ComparisonResult:
+    """
+    Outcome of compare().
+    statistics holds the comparison.compare_frames counts and file profiles (without the output frames),
+    result['name'] is a shortcut for result.statistics['name'].
+    """
+    source: str
+    target: str
+    primary_key: object
+    output_dir: str
+    encodings: tuple
+    delimiters: tuple
+    statistics: dict
+    timings: dict = field(default_factory=dict)
+    report_path: str = None
+    plot_path: str = None
+    formats: tuple = None
+    profile_path: str = None
+
+    def __getitem__(self, name):
+        return self.statistics[name]
+
+    @property
+    def source_profile(self):
+        """profiling.FileProfile of the source file."""
+        return self.statistics['profile_source']
+
+    @property
+    def target_profile(self):
+        """profiling.FileProfile of the target file."""
+        return self.statistics['profile_target']
+
+    @property
+    def output_files(self):
+        """Paths of the output files written by the comparison."""
+        return {name: output['path'] for name, output in self.statistics['outputs'].items()}
+
+
+def read_and_merge_csv(file_path, delimiter, encoding, primary_key=primary_key, chunk_size=chunk_size,
+                       use_pyarrow=False, run_profile=None, dtypes=None, **read_options):
+    run_profile = instrumentation.RunProfile() if run_profile is None else run_profile
+    with run_profile.stage('read') as stage:
+        if use_pyarrow and csv_reader.select_engine(delimiter, prefer_pyarrow=True) == 'pyarrow':
+            merged_df = csv_reader.read_csv(file_path, delimiter, encoding, prefer_pyarrow=True, **read_options)
+            if dtypes is not None:
+                merged_df = schema.downcast_integers(merged_df.astype(dtypes))
+        elif dtypes is not None:
+            # Compact dtypes (schema.infer_dtypes) are applied by the parser, chunk by chunk
+            chunks = csv_reader.read_csv(file_path, delimiter, encoding, chunksize=chunk_size, dtype=dtypes,
+                                         **read_options)
+            merged_df = schema.concat_chunks(schema.downcast_integers(chunk) for chunk in chunks)
+        else:
+            chunks = csv_reader.read_csv(file_path, delimiter, encoding, chunksize=chunk_size, **read_options)
+            merged_df = pd.concat(chunks, ignore_index=True)
+        stage['rows'] = len(merged_df)
+    with run_profile.stage('sort') as stage:
+        stage['rows'] = len(merged_df)
+        # Stable sort: records sharing a primary_key keep their file order, the out-of-core buckets rely on it
+        merged_df.sort_values(by=primary_key, inplace=True, kind='stable')
     return merged_df
 
 
-# ------------------------------------- FUNCTIONS DECLARED BY ME -------------------------------------------------------
+def is_s3_url(path):
+    # downloadcode (and boto3) is only imported for 's3://bucket/key' sources
+    return isinstance(path, str) and path.startswith('s3://')
 
-def detect_encoding2(file_path, encodings_list, num_rows=5):
+
+def read_s3_and_merge_csv(url, delimiter, encoding, primary_key=primary_key, chunk_size=chunk_size, run_profile=None,
+                          **read_options):
+    """
+    read_and_merge_csv of an 's3://bucket/key' object, parsed from its ranged GETs while they arrive
+    (downloadcode.open_s3_stream) instead of after a complete download. A stream cannot be read twice, so an
+    object the C engine cannot take after all (the substitute delimiter in its data) is downloaded to a temporary
+    file and read from there.
+    Raises:
+        csv_reader.UndecodableFile: With the url, like for a local file
+    """
+    import downloadcode
+    bucket_name, s3_key = downloadcode.split_s3_url(url)
     try:
-        with open(file_path, 'rb') as f:
-            rawdata = b''.join(f.readline() for _ in range(num_rows))
-            return next((encoding for encoding in encodings_list if
-                         all((decoded_text := rawdata.decode(encoding)) for _ in range(num_rows))), None)
-    except Exception as e:
-        print("Error occurred while detecting encoding:", e)
-        return None
+        with downloadcode.open_s3_stream(bucket_name, s3_key) as stream:
+            return read_and_merge_csv(stream, delimiter, encoding, primary_key, chunk_size, False, run_profile,
+                                      **read_options)
+    except csv_reader.UndecodableFile as e:
+        raise csv_reader.UndecodableFile(url, e.encoding, e.args[2]) from e
+    except csv_reader.SubstituteDelimiterInData:
+        print(f'{url} contains the substitute delimiter, downloading it before reading')
+    with tempfile.TemporaryDirectory(prefix='data_comparison_s3_') as download_dir:
+        local_path = os.path.join(download_dir, os.path.basename(s3_key))
+        if downloadcode.download_s3_file(bucket_name, s3_key, local_path) is None:
+            raise OSError(f'Could not download {url}')
+        return read_and_merge_csv(local_path, delimiter, encoding, primary_key, chunk_size, False, run_profile,
+                                  **read_options)
 
 
-encodings_list = ["ANSI", "ISO-8859-1", "Windows-1251", "Windows-1252", "GB2312", "Shift JIS", "EUC-KR",
-                  "ISO-8859-9", "Windows-1254", "EUC-JP", "Big5"]
-print('---------------------------------------------------------------')
+# ------------------------------------- FUNCTIONS DECLARED BY ME -------------------------------------------------------
 
+# Candidate encodings of the files, in order of preference, see sniffing.detect_encoding
+encodings_list = list(sniffing.ENCODINGS)
 
-# --------------------------------------------------------------------------
-
-# Function to get the delimiter of a file
-def get_file_delimiter(file_path, encoding, check_lines=3):
-    delimiters = [',', '\t', ';', '|*|', '|', ':', ' ', '~', '`', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '-',
-                  '_', '=', '+', '[', ']', '{', '}', '\\', '/', '<', '>', '?']
-    results = {delimiter: 0 for delimiter in delimiters}
-    with open(file_path, 'r', encoding=encoding) as file:
-        [results.update({delimiter: results[delimiter] + line.count(delimiter)}) for _ in range(check_lines) if
-         (line := file.readline())]
-    return max(results, key=results.get)
-
-# if delimiter = |*|, it converts to r'\|*\|'
-def convert_delimiter_to_raw(delimiter):
-    """
-    Convert delimiter to raw string literal character type.
-    Parameters:
-        delimiter (str): Delimiter string
-    Returns:
-        str: Raw string literal character type delimiter
-    """
-    raw_delimiter = re.escape(delimiter)
-    return rf'{raw_delimiter}'
 
 # --------------------------------------------------------------------------
 # Function to detect the extension of a file
@@ -79,207 +136,403 @@ def detect_extension(file_path):
     _, extension = os.path.splitext(file_path)
     return extension.lower()
 
-# 3m x 3m
-# ------------------------------------- FUNCTIONS DECLARED BY ME -------------------------------------------------------
-
-extension1 = detect_extension(oracle_source)
-extension2 = detect_extension(datacloud_target)
-
-encoding1 = detect_encoding2(oracle_source, encodings_list)
-encoding2 = detect_encoding2(datacloud_target, encodings_list)
-
-delimiter1 = get_file_delimiter(oracle_source, encoding1)
-delimiter2 = get_file_delimiter(datacloud_target, encoding2)
-
-if (delimiter1 != delimiter2):
-    print('Delimiters of both files dont match')
-    print('Delimiter of Oracle Source: ', delimiter1)
-    print('Delimiter of Datacloud Target: ', delimiter2)
-else:
-    print('Delimiters Matched. i.e. Delimiter = ', delimiter1)
-
-if encoding1 != encoding2:
-    print('Encodings of both files do not match')
-    print('Encoding of Oracle Source: ', encoding1)
-    print('Encoding of Datacloud Target: ', encoding2)
-else:
-    print('Encodings Matched. i.e. Encoding =', encoding1)
-
-print('---------------------------------------------------------------')
 
-# GIL --> Global interpreter lock
-
-delimiter1 = convert_delimiter_to_raw(delimiter1)
-delimiter2 = convert_delimiter_to_raw(delimiter2)
-
-df1 = read_and_merge_csv(oracle_source, delimiter1, encoding1)
-df2 = read_and_merge_csv(datacloud_target, delimiter2, encoding2)
-
-num_records_oracle_source = len(df1)
-num_records_datacloud_target = len(df2)
-
-# Get the number of unique records for the given primary_key in each file
-num_unique_records_oracle_source = df1[primary_key].nunique()
-num_unique_records_datacloud_target = df2[primary_key].nunique()
-
-col1 = list(df1.columns)
-col2 = list(df2.columns)
-
-# Get the number of matching and unmatching records in both files
-matching_records = pd.merge(df1, df2, on=col1, how='inner')
-num_matching_records = len(matching_records)
-unmatching_records_in_oracle_source = pd.concat([df1, matching_records]).drop_duplicates(keep=False)
-unmatching_records_in_datacloud_target = pd.concat([df2, matching_records]).drop_duplicates(keep=False)
-num_unmatching_records = len(unmatching_records_in_oracle_source) + len(unmatching_records_in_datacloud_target)
-
-# sample contains total unmatching records
-sample = pd.merge(unmatching_records_in_oracle_source, unmatching_records_in_datacloud_target, on=[primary_key],
-                  how='inner')
-
-# Finding records from unmatching_records_in_oracle_source for not matching primary key in df1
-oracle_only_records = unmatching_records_in_oracle_source[
-    ~unmatching_records_in_oracle_source[primary_key].isin(sample[primary_key])]
-
-# Finding records from unmatching_records_in_datacloud_target for not matching primary key in df2
-datacloud_only_records = unmatching_records_in_datacloud_target[
-    ~unmatching_records_in_datacloud_target[primary_key].isin(sample[primary_key])]
-
-# Difference Data
-matching_for_safenumber_oracle_source = unmatching_records_in_oracle_source[
-    unmatching_records_in_oracle_source[primary_key].isin(sample[primary_key])]
-matching_for_safenumber_datacloud_target = unmatching_records_in_datacloud_target[
-    unmatching_records_in_datacloud_target[primary_key].isin(sample[primary_key])]
-data_mismatch_records = pd.merge(matching_for_safenumber_oracle_source, matching_for_safenumber_datacloud_target,
-                                 on=[primary_key], how='inner')
-
-column_details = df1.columns
-data_mismatch_records = data_mismatch_records.fillna('')
+# --------------------------------------------------------------------------
+# Encoding to read a file with after csv_reader.UndecodableFile, the same for the in-memory and partitioned paths
+def fallback_encoding(error):
+    # The sample decoded, a part of the file outside of it does not; every byte is valid in the fallback
+    if error.encoding == sniffing.FALLBACK_ENCODING:
+        raise error
+    print(f'{error.file_path} is not {error.encoding} throughout, reading it as {sniffing.FALLBACK_ENCODING}')
+    return sniffing.FALLBACK_ENCODING
 
-unmatched_data = pd.DataFrame(columns=df1.columns)
 
-for index, data in data_mismatch_records.iterrows():
-    for column_name in column_details:
-        if column_name == primary_key:
-            unmatched_data.at[index, column_name] = data[column_name]
-        elif data[column_name + '_x'] != data[column_name + '_y']:
-            updated_column_value = str(data[column_name + '_x']) + ' -> ' + str(data[column_name + '_y'])
-            unmatched_data.at[index, column_name] = updated_column_value
+# --------------------------------------------------------------------------
+# Function to detect the format of a file and read it sorted on primary_key
+def ingest_file(file_path, load=True, primary_key=primary_key, chunk_size=chunk_size, use_pyarrow=False,
+                cache_dir=None, compact_dtypes=False, run_profile=None):
+    """
+    Detect the format of a file (sniffing.sniff_file) and, with load=True, read it sorted on primary_key.
+    The format is detected once here and handed on to everything else that needs it.
+    Parameters:
+        file_path (str): Path of the file, or an 's3://bucket/key' url that is parsed while it downloads
+            (read_s3_and_merge_csv)
+        load (bool): Read the file, the out-of-core path reads the files itself
+        primary_key (str or list): Key column(s) the file is sorted on
+        chunk_size (int): Rows read at once
+        use_pyarrow (bool): Parse single character delimited files with pyarrow (whole file at once, no chunks)
+        cache_dir (str): Keep the parsed, key-sorted file here for later runs (needs pyarrow), None disables it
+        compact_dtypes (bool): Read text columns as categoricals / pyarrow strings and narrow integer columns, see
+            schema.infer_dtypes
+        run_profile (RunProfile): Receives the stages of this file ('cache load', 'detect', 'read', 'sort',
+            'cache store') with the file path
+    Returns:
+        dict: 'encoding', 'delimiter', 'format' (all of sniff_file), 'df' (None without load) and 'timings',
+            seconds per stage
+    """
+    # Stages of this file only, for its timings; in the same mode as the run (tracemalloc peaks)
+    file_profile = instrumentation.RunProfile(None if run_profile is None else run_profile.mode)
+
+    def ingested(file_format, df):
+        if run_profile is not None:
+            run_profile.merge(file_profile, file=file_path)
+        return {'encoding': file_format['encoding'], 'delimiter': file_format['delimiter'], 'format': file_format,
+                'df': df, 'timings': file_profile.timings()}
+
+    use_cache = load and cache_dir and snapshot_cache.PYARROW_AVAILABLE
+    if use_cache:
+        with file_profile.stage('cache load') as stage:
+            fingerprint = snapshot_cache.file_fingerprint(file_path)
+            read_settings = {'primary_key': primary_key, 'chunk_size': chunk_size, 'use_pyarrow': use_pyarrow,
+                             'sniffer': sniffing.SNIFFER_VERSION, 'compact_dtypes': compact_dtypes}
+            df, cached = snapshot_cache.load(cache_dir, fingerprint, read_settings)
+            stage['rows'] = None if df is None else len(df)
+        if df is not None:
+            return ingested(cached['format'], df)
+
+    with file_profile.stage('detect'):
+        if is_s3_url(file_path):
+            import downloadcode
+            file_format = downloadcode.sniff_s3_file(*downloadcode.split_s3_url(file_path), encodings_list)
         else:
-            unmatched_data.at[index, column_name] = data[column_name + '_x']
-
-# Saving the output to a csv file
-unmatched_data.to_csv(os.path.join(ROOT_PATH, 'unmatched_data.csv'), index=False)
-oracle_only_records.to_csv(os.path.join(ROOT_PATH, 'oracle_only_records.csv'), index=False)
-datacloud_only_records.to_csv(os.path.join(ROOT_PATH, 'datacloud_only_records.csv'), index=False)
-
-print(f'Total Processing time - {datetime.datetime.now() - start}')
-
-# Get the number of primary_key which are present/not present in both files
-present_in_both = df1[df1[primary_key].isin(df2[primary_key])]
-not_present_in_both = df1[~df1[primary_key].isin(df2[primary_key])]
-
-# For a primary_key which is present in both files, if other values are not matching,
-# generate a result showing which column is not matching
-mismatched_records = matching_records[matching_records[df1.columns] != matching_records[df2.columns]]
-mismatched_columns = mismatched_records.columns[mismatched_records.isnull().any()].tolist()
-
-# Create a bar plot
-labels = ['oracle_record_count', 'datacloud_record_count', 'oracle_unique_records', 'datacloud_unique_records',
-          'matched_records', 'unmatched_records'][::-1]
-values = [num_records_oracle_source, num_records_datacloud_target, num_unique_records_oracle_source,
-          num_unique_records_datacloud_target, num_matching_records, num_unmatching_records][::-1]
-
-# Set a larger figure size to avoid text trimming
-plt.figure(figsize=(10, 6))
-
-plt.barh(labels, values)
-plt.xlabel('Metrics')
-plt.ylabel('Count')
-
-# Display the number inside each bar
-for i, v in enumerate(values):
-    plt.text(v, i, str(v), ha='left', va='center')
-
-plt.title('Comparison of Metrics')
+            file_format = sniffing.sniff_file(file_path, encodings_list)
+        dtypes = schema.infer_dtypes(file_path, file_format, primary_key) if load and compact_dtypes else None
+
+    def read(encoding):
+        if is_s3_url(file_path):
+            return read_s3_and_merge_csv(file_path, file_format['delimiter'], encoding, primary_key, chunk_size,
+                                         file_profile, **sniffing.read_options(file_format))
+        return read_and_merge_csv(file_path, file_format['delimiter'], encoding, primary_key, chunk_size,
+                                  use_pyarrow, file_profile, dtypes, **sniffing.read_options(file_format))
+
+    df = None
+    if load:
+        try:
+            df = read(file_format['encoding'])
+        except csv_reader.UndecodableFile as e:
+            file_format['encoding'] = fallback_encoding(e)
+            df = read(file_format['encoding'])
+
+    if use_cache:
+        with file_profile.stage('cache store') as stage:
+            stage['rows'] = len(df)
+            snapshot_cache.store(cache_dir, fingerprint, read_settings, df, file_format, snapshot_cache_max_bytes)
+    return ingested(file_format, df)
 
-# Adjust layout to prevent text trimming
-plt.tight_layout()
-
-# Save the plot to a file
-plot_output_file_path = os.path.join(ROOT_PATH, 'metrics_comparison_plot.png')
-plt.savefig(plot_output_file_path)
+# 3m x 3m
+# ------------------------------------- FUNCTIONS DECLARED BY ME -------------------------------------------------------
 
-# Show the plot
-plt.show()
 
-output_file_path = 'output.txt'
+def compare(source, target, key=primary_key, output_dir='.', chunk_size=chunk_size, mode=comparison_mode,
+            workers=1, out_of_core=False, use_pyarrow=False, cache_dir=None, index_dir=None, compact_dtypes=False,
+            output_format='csv', max_output_rows=None, rules=None, engine='pandas', plot=False, show_plot=False,
+            profile_mode=None, verbose=True):
+    """
+    Compare an Oracle source extract with its Datacloud target.
+    The unmatched data, oracle only and datacloud only csv files, the scenario report (output.txt), the run profile
+    (run_profile.json, see instrumentation.RunProfile) and, when asked for, the metrics plot are written to
+    output_dir.
+    Parameters:
+        source (str): Path of the Oracle source file, or an 's3://bucket/key' url: the object is parsed from
+            concurrent ranged GETs while it downloads, without a local copy. S3 sources are compared in memory,
+            without cache_dir or compact_dtypes.
+        target (str): Path of the Datacloud target file, or an 's3://bucket/key' url
+        key (str or list): Primary key column, or a list of columns for a composite key (e.g.
+            ['CS_COMPANY_ID', 'ADDRESS_TYPE']). Records that still share a key are paired in file order for the
+            column level diff, see comparison.split_unmatched_records.
+        output_dir (str): Directory the output files are written to, created if missing
+        chunk_size (int): Rows read at once
+        mode (str): 'hash' or 'merge', see comparison.classify_records
+        workers (int): Processes reading, key partitioning and comparing the files in parallel, more than 1 implies
+            partitioning (see out_of_core.compare_files)
+        out_of_core (bool): Partition both files on disk by key and compare them chunk_size rows at a time
+        use_pyarrow (bool): Parse single character delimited files with pyarrow (whole file at once, no chunks)
+        cache_dir (str): Keep parsed, key-sorted files here for later runs (needs pyarrow), None disables it
+        index_dir (str): Keep a row hash index of this pair here and only compare the keys that changed since the
+            previous run (see incremental.compare_incremental), None disables it. Not with out_of_core / workers.
+        compact_dtypes (bool): Load text columns as categoricals / pyarrow strings and narrow integer columns
+            (see schema.infer_dtypes), both files end up with identical dtypes. The out-of-core path only holds
+            one bucket at a time and reads with the default dtypes.
+        output_format (str): 'csv', 'csv.gz', 'csv.zst' (needs zstandard) or 'parquet' (needs pyarrow) output files
+        max_output_rows (int): Records written per output file, None for all. The counts in output.txt always
+            cover every record.
+        rules (dict or str): Per column comparison rules (numeric tolerances, date formats, trimmed / case folded
+            strings, see comparison_rules.check_rules) or the path of a .json / .yaml file with them. Needs the
+            'hash' mode, not with index_dir.
+        engine (str): 'pandas' or 'duckdb': classify the records in an in-process DuckDB database (multi-threaded,
+            spills to disk, needs duckdb and the 'hash' mode), see comparison.ENGINES. The outputs are the same.
+        plot (bool): Save the metrics plot to output_dir (imports matplotlib)
+        show_plot (bool): Also display the plot
+        profile_mode (str): None, 'cprofile' (also write run_profile.prof, the files are then ingested one after
+            the other so the profile sees them) or 'tracemalloc' (Python allocation peaks per stage)
+        verbose (bool): Print progress messages
+    Returns:
+        ComparisonResult
+    """
+    start = datetime.datetime.now()
+    log = print if verbose else lambda *args, **kwargs: None
+    # A one column list is the plain key
+    key = key if isinstance(key, str) or len(key) > 1 else key[0]
+    os.makedirs(output_dir, exist_ok=True)
+    output_sinks.check_format(output_format)
+    comparison.check_engine(engine, mode)
+    run_profile = instrumentation.RunProfile(profile_mode).start()
+
+    partitioned = out_of_core or workers > 1
+    if (partitioned or cache_dir or compact_dtypes) and any(map(is_s3_url, (source, target))):
+        raise ValueError('S3 sources are compared in memory, without out_of_core, workers > 1, cache_dir or '
+                         'compact_dtypes')
+    if partitioned and index_dir:
+        raise ValueError('index_dir (incremental comparison) cannot be combined with out_of_core or workers > 1')
+    rules = comparison_rules.load_rules(rules) if isinstance(rules, str) else comparison_rules.check_rules(rules)
+    if rules and index_dir:
+        raise ValueError('index_dir (incremental comparison) cannot be combined with comparison rules')
+    if rules and mode != 'hash':
+        raise ValueError("Comparison rules need the 'hash' mode")
+    ingestion_start = time.perf_counter()
+
+    def ingest(file_path):
+        return ingest_file(file_path, not partitioned, key, chunk_size, use_pyarrow, cache_dir, compact_dtypes,
+                           run_profile)
+
+    # Source and target are ingested at the same time, the C parser releases the GIL while it tokenizes so parsing
+    # one file overlaps with the other and ingestion takes about as long as the slower file
+    if profile_mode == 'cprofile':
+        # cProfile only sees the thread it was enabled in
+        source_file, target_file = map(ingest, [source, target])
+    else:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_file, target_file = executor.map(ingest, [source, target])
+    ingestion_time = time.perf_counter() - ingestion_start
+
+    encoding1, encoding2 = source_file['encoding'], target_file['encoding']
+    delimiter1, delimiter2 = source_file['delimiter'], target_file['delimiter']
+
+    log('---------------------------------------------------------------')
+    if (delimiter1 != delimiter2):
+        log('Delimiters of both files dont match')
+        log('Delimiter of Oracle Source: ', delimiter1)
+        log('Delimiter of Datacloud Target: ', delimiter2)
+    else:
+        log('Delimiters Matched. i.e. Delimiter = ', delimiter1)
+
+    if encoding1 != encoding2:
+        log('Encodings of both files do not match')
+        log('Encoding of Oracle Source: ', encoding1)
+        log('Encoding of Datacloud Target: ', encoding2)
+    else:
+        log('Encodings Matched. i.e. Encoding =', encoding1)
+
+    for file_name, ingested in [('Oracle Source', source_file), ('Datacloud Target', target_file)]:
+        log(f'{file_name} ingestion time: ' + ', '.join(f'{step} {seconds:.2f}s'
+                                                        for step, seconds in ingested['timings'].items()))
+    log(f'Ingestion time (both files in parallel): {ingestion_time:.2f}s')
+    if cache_dir and not snapshot_cache.PYARROW_AVAILABLE:
+        log('Snapshot cache disabled, it needs pyarrow')
+
+    log('---------------------------------------------------------------')
+
+    comparison_start = time.perf_counter()
+    if partitioned:
+        # Partitioning, the bucket comparisons and the output files all happen inside, possibly in other processes
+        with run_profile.stage('out-of-core comparison') as stage:
+            while True:
+                try:
+                    statistics = out_of_core_comparison.compare_files(
+                        (source, delimiter1, encoding1, sniffing.read_options(source_file['format'])),
+                        (target, delimiter2, encoding2, sniffing.read_options(target_file['format'])), key,
+                        output_dir, chunk_size, mode, workers=workers, output_format=output_format,
+                        max_output_rows=max_output_rows, rules=rules, engine=engine)
+                    break
+                except csv_reader.UndecodableFile as e:
+                    # The files are only read here, the comparison starts over with the file in the fallback
+                    if e.file_path not in (source, target):
+                        raise
+                    if e.file_path == source:
+                        encoding1 = fallback_encoding(e)
+                    if e.file_path == target:
+                        encoding2 = fallback_encoding(e)
+            stage['rows'] = statistics['profile_source'].num_records + statistics['profile_target'].num_records
+    else:
+        if compact_dtypes:
+            with run_profile.stage('harmonize dtypes'):
+                source_file['df'], target_file['df'] = schema.harmonize(source_file['df'], target_file['df'])
+        # Matching, oracle only / datacloud only records and the column level diff of records whose primary_key is
+        # in both files with different values
+        if index_dir:
+            statistics, delta = incremental.compare_incremental(source_file['df'], target_file['df'], key,
+                                                                index_dir, mode, run_profile, engine)
+            log('Incremental comparison: ' + ('no usable index of a previous run, compared all keys' if delta['full']
+                                              else f"{delta['num_changed_keys']} of {delta['num_keys']} keys changed "
+                                                   f"since the previous run"))
+        else:
+            statistics = comparison.compare_frames(source_file['df'], target_file['df'], key, mode,
+                                                   run_profile=run_profile, rules=rules, engine=engine)
+        statistics['outputs'] = comparison.write_outputs(statistics, output_dir, run_profile, output_format,
+                                                         max_output_rows, key)
+        for name in comparison.OUTPUT_FILES:
+            del statistics[name]
+    comparison_time = time.perf_counter() - comparison_start
+
+    for file_name, profile in [('Oracle Source', statistics['profile_source']),
+                               ('Datacloud Target', statistics['profile_target'])]:
+        if profile.num_records > profile.num_unique_keys:
+            log(f'{file_name}: {profile.num_records - profile.num_unique_keys} records share their '
+                f'{comparison.key_name(key)} with an earlier record, changed records of those keys are paired in '
+                f'file order')
+
+    result = ComparisonResult(source, target, key, output_dir, (encoding1, encoding2), (delimiter1, delimiter2),
+                              statistics, {'ingestion': ingestion_time, 'comparison': comparison_time},
+                              formats=(source_file['format'], target_file['format']))
+    if plot or show_plot:
+        result.plot_path = os.path.join(output_dir, PLOT_FILE)
+        with run_profile.stage('plot'):
+            plot_metrics(statistics, result.plot_path, show=show_plot)
+    result.report_path = os.path.join(output_dir, REPORT_FILE)
+    write_report(result.report_path, statistics, key, result.encodings, run_profile, rules)
+
+    log(f'Total Processing time - {datetime.datetime.now() - start}')
+    result.profile_path = run_profile.write(output_dir, source=source, target=target, primary_key=key, mode=mode)
+    return result
+
+
+def plot_metrics(statistics, plot_output_file_path, show=False):
+    """Save a bar plot of the record counts, matplotlib is only imported here."""
+    import matplotlib.pyplot as plt
+
+    source, target = statistics['profile_source'], statistics['profile_target']
+    # Create a bar plot
+    labels = ['oracle_record_count', 'datacloud_record_count', 'oracle_unique_records', 'datacloud_unique_records',
+              'matched_records', 'unmatched_records'][::-1]
+    values = [source.num_records, target.num_records, source.num_unique_keys, target.num_unique_keys,
+              statistics['num_matching_records'], statistics['num_unmatching_records']][::-1]
+
+    # Set a larger figure size to avoid text trimming
+    plt.figure(figsize=(10, 6))
+
+    plt.barh(labels, values)
+    plt.xlabel('Metrics')
+    plt.ylabel('Count')
+
+    # Display the number inside each bar
+    for i, v in enumerate(values):
+        plt.text(v, i, str(v), ha='left', va='center')
+
+    plt.title('Comparison of Metrics')
+
+    # Adjust layout to prevent text trimming
+    plt.tight_layout()
+
+    # Save the plot to a file
+    plt.savefig(plot_output_file_path)
+
+    # Show the plot
+    if show:
+        plt.show()
+    plt.close()
+
+
+def write_report(output_file_path, result, primary_key, encodings, run_profile=None, rules=None):
+    """
+    Write the summary and scenarios 1-20 of a comparison to output_file_path.
+    Every scenario only reads the statistics and profiles already in result, the report is built in memory and
+    written in one go.
+    Parameters:
+        output_file_path (str): Path of the report (output.txt)
+        result (dict): Statistics of comparison.compare_frames or out_of_core.compare_files
+        primary_key (str or list): Key column(s)
+        encodings (tuple): Detected encodings of the source and target file
+        run_profile (RunProfile): Records a stage per scenario (named after its function) and the write
+        rules (dict): Comparison rules of the run, scenario 5 checks the format of every date column among them
+    """
+    run_profile = instrumentation.RunProfile() if run_profile is None else run_profile
+    source, target = result['profile_source'], result['profile_target']
+    primary_key = comparison.key_name(primary_key)
+    summary = (
+        f"Number of records in oracle: {source.num_records}\n"
+        f"Number of records in datacloud: {target.num_records}\n"
+        f"Number of unique records in oracle: {source.num_unique_keys}\n"
+        f"Number of unique records in datacloud: {target.num_unique_keys}\n"
+        f"Number of matched records: {result['num_matching_records']}\n"
+        f"Number of unmatched records: {result['num_unmatching_records']}\n"
+        f"oracle only records: {result['num_oracle_only_records']}\n"
+        f"datacloud only records: {result['num_datacloud_only_records']}\n"
+        f"Number of {primary_key} present in both files: {result['num_present_in_both']}\n"
+        f"Number of {primary_key} not present in both files: {result['num_not_present_in_both']}\n"
+        f"Mismatched columns for {primary_key} present in both files: {result['mismatched_columns']}\n")
+    scenarios = [
+        (num_records_in_source_match_num_rec_in_target1, source, target),
+        (compare_column_names_and_order, source.columns, target.columns),
+        (compare_data_types_between_dataframes2, source.dtypes, target.dtypes),
+        (check_datetime_format_match, source, target, rules),
+        (compare_null_values_between_dataframes, source, target),
+        (compare_encodings_between_files, *encodings),
+        (confirm_data_order_similarity, source, target, result['frames_equal']),
+        (check_duplicate_records, source, target),
+        (unique_records_in_source, source),
+        (unique_records_in_target, target),
+        (check_duplicate_records_in_source, source),
+        (check_duplicate_records_in_target, target),
+        (total_matched_records, result),
+        (print_unmatched_records, result),
+        (print_oracle_only_records, result),
+        (print_datacloud_only_records, result),
+    ]
+    sections = [summary]
+    for scenario, *args in scenarios:
+        with run_profile.stage(scenario.__name__):
+            sections.append(scenario(*args))
+    sections.append(capped_output_files(result.get('outputs', {})))
+    with run_profile.stage('report write'):
+        with open(output_file_path, 'w') as output_file:
+            output_file.write(''.join(sections))
+
+
+# Output files that only hold the first max_output_rows records, the counts of the report cover all of them
+def capped_output_files(outputs):
+    capped = {name: output for name, output in outputs.items() if output['written'] < output['rows']}
+    if not capped:
+        return ''
+    output = '\nOutput files hold the first records only, the counts above cover all records:\n'
+    for name, summary in capped.items():
+        output += f"{os.path.basename(summary['path'])}: {summary['written']} of {summary['rows']} records\n"
+    return output
 
-with open(output_file_path, 'w') as output_file:
-    print(f"Number of records in oracle: {num_records_oracle_source}", file=output_file)
-    print(f"Number of records in datacloud: {num_records_datacloud_target}", file=output_file)
-    print(f"Number of unique records in oracle: {num_unique_records_oracle_source}", file=output_file)
-    print(f"Number of unique records in datacloud: {num_unique_records_datacloud_target}", file=output_file)
-    print(f"Number of matched records: {num_matching_records}", file=output_file)
-    print(f"Number of unmatched records: {num_unmatching_records}", file=output_file)
-    print(f"oracle only records: {len(oracle_only_records)}", file=output_file)
-    print(f"datacloud only records: {len(datacloud_only_records)}", file=output_file)
-    print(f"Number of {primary_key} present in both files: {len(present_in_both)}", file=output_file)
-    print(f"Number of {primary_key} not present in both files: {len(not_present_in_both)}", file=output_file)
-    print(f"Mismatched columns for {primary_key} present in both files: {mismatched_columns}", file=output_file)
 
 # ----------------------------------------------SCENARIOS--------------------------------------------------------------
-print()
+# Every scenario returns its section of the report, source and target are the profiling.FileProfile of both files
+
 
 # ============================================== SCENARIO 1 ===========================================================
 # 1.Verify that the number of records in the Oracle file matches the number of records in the cloud file.
-
-# print(df1.shape, df2.shape)
-num_rows_df1, num_cols_df1 = df1.shape
-num_rows_df2, num_cols_df2 = df2.shape
-
-
-def num_records_in_source_match_num_rec_in_target1(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario1: num_records_in_source_match_num_rec_in_target1\n')
-        output_file.write(
-            f"num records in oracle = num records in datacloud S3 = {num_cols_df1}\n" if num_rows_df1 == num_rows_df2 else f"num records in oracle: {num_rows_df1}\nnum records in Datacloud: {num_rows_df2}\n")
-
-
-num_records_in_source_match_num_rec_in_target1(output_file_path)
+def num_records_in_source_match_num_rec_in_target1(source, target):
+    num_rows_df1, num_cols_df1 = source.num_records, len(source.columns)
+    num_rows_df2 = target.num_records
+    output = '\nScenario1: num_records_in_source_match_num_rec_in_target1\n'
+    output += f"num records in oracle = num records in datacloud S3 = {num_cols_df1}\n" if num_rows_df1 == num_rows_df2 else f"num records in oracle: {num_rows_df1}\nnum records in Datacloud: {num_rows_df2}\n"
+    return output
 
 
 # ============================================== SCENARIO 2 ===========================================================
 # 2.Validate that the column names in both files are identical and in the same order.
-def compare_column_names_and_order(output_file_path, col1, col2):
-    with open(output_file_path, 'a') as output_file:
-        output = "\nScenario2: Comparing Column Names and Order:\n"
-        output += (
-            'Column names are identical but not in the same order\n' if col1 != col2 and sorted(col1) == sorted(col2)
-            else 'Column names are not identical\n' if col1 != col2
-            else 'Column names are identical & in the same order\n')
-        output_file.write(output)
+def compare_column_names_and_order(col1, col2):
+    output = "\nScenario2: Comparing Column Names and Order:\n"
+    output += (
+        'Column names are identical but not in the same order\n' if col1 != col2 and sorted(col1) == sorted(col2)
+        else 'Column names are not identical\n' if col1 != col2
+        else 'Column names are identical & in the same order\n')
+    return output
 
 
-compare_column_names_and_order(output_file_path, col1, col2)
-
 # ============================================== SCENARIO 3 ===========================================================
 # 3.Confirm that the data types of all the columns in both files match.
-type1 = list(df1.dtypes)
-type2 = list(df2.dtypes)
-
-
-def compare_data_types_between_dataframes2(output_file_path, type1, type2):
-    datetime_col_idx_df1 = next((index for index, dtype in enumerate(type1) if dtype == 'datetime64[ns]'), -1)
-    datetime_col_idx_df2 = next((index for index, dtype in enumerate(type2) if dtype == 'datetime64[ns]'), -1)
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario 3: Comparing Data Types Between DataFrames\n')
-        output_file.write('Data types of all columns in both files matched successfully\n' if sorted(type1) == sorted(
-            type2) else 'Data types of Columns in both files don\'t match\n' if len(type1) == len(
-            type2) else 'Number of columns in both files don\'t match, Hence can\'t compare data types\n')
-    return datetime_col_idx_df1, datetime_col_idx_df2
-
-
-datetime_col_idx_df1, datetime_col_idx_df2 = compare_data_types_between_dataframes2(output_file_path, type1, type2)
+def compare_data_types_between_dataframes2(type1, type2):
+    output = '\nScenario 3: Comparing Data Types Between DataFrames\n'
+    # Compared as names, categorical and string dtypes do not order against numpy dtypes
+    output += 'Data types of all columns in both files matched successfully\n' if sorted(map(str, type1)) == sorted(
+        map(str, type2)) else 'Data types of Columns in both files don\'t match\n' if len(type1) == len(
+        type2) else 'Number of columns in both files don\'t match, Hence can\'t compare data types\n'
+    return output
 
 
 # ============================================== SCENARIO 4 ===========================================================
@@ -288,45 +541,41 @@ datetime_col_idx_df1, datetime_col_idx_df2 = compare_data_types_between_datafram
 
 
 # ============================================== SCENARIO 5 ===========================================================
-def check_datetime_format_match(df1, df2, datetime_col_idx_df1, datetime_col_idx_df2, output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write(
-            "\nScenario 5: Verify that any date or timestamp values in both files are in the same format.\n")
-
-        if datetime_col_idx_df1 == -1 or datetime_col_idx_df2 == -1:
-            output_file.write("Dataframes dont contain Datetime column\n")
-            return None, None
-        datetime_col_df1, datetime_col_df2 = df1.iloc[:, datetime_col_idx_df1], df2.iloc[:, datetime_col_idx_df2]
-        datetime_col_df1, datetime_col_df2 = pd.to_datetime(datetime_col_df1, errors='coerce'), pd.to_datetime(
-            datetime_col_df2, errors='coerce')
-        formatt_df1, formatt_df2 = datetime_col_df1.dt.strftime('').iloc[0], datetime_col_df2.dt.strftime('').iloc[0]
-        format_match = formatt_df1 == formatt_df2
-        output_file.write(f"Both files datetime formats: {formatt_df1}\n" if format_match else f"Formats don't match.\n")
-        output_file.write(f"Datetime format for df1: {formatt_df1}\n")
-        output_file.write(f"Datetime format for df2: {formatt_df2}\n")
-    return formatt_df1, formatt_df2
-
-
-format_df1, format_df2 = check_datetime_format_match(df1, df2, datetime_col_idx_df1, datetime_col_idx_df2,
-                                                     output_file_path)
+# The files are sorted on primary_key, the format is taken from the first record of each file
+def check_datetime_format_match(source, target, rules=None):
+    output = "\nScenario 5: Verify that any date or timestamp values in both files are in the same format.\n"
+    # Date columns of the comparison rules are read as text, each one gets the rule format its value parses with
+    date_rules = {column_name: rule for column_name, rule in (rules or {}).items() if rule['type'] == 'date'}
+    for column_name, rule in date_rules.items():
+        formatt_df1 = comparison_rules.date_format(source.first_record, column_name, rule)
+        formatt_df2 = comparison_rules.date_format(target.first_record, column_name, rule)
+        output += f"{column_name}: both files datetime format {formatt_df1}\n" if formatt_df1 == formatt_df2 \
+            else f"{column_name}: formats don't match, df1 {formatt_df1}, df2 {formatt_df2}\n"
+    if date_rules:
+        return output
+    if source.datetime_column == -1 or target.datetime_column == -1:
+        return output + "Dataframes dont contain Datetime column\n"
+    formatt_df1, formatt_df2 = source.datetime_format, target.datetime_format
+    format_match = formatt_df1 == formatt_df2
+    output += f"Both files datetime formats: {formatt_df1}\n" if format_match else f"Formats don't match.\n"
+    output += f"Datetime format for df1: {formatt_df1}\n"
+    output += f"Datetime format for df2: {formatt_df2}\n"
+    return output
 
 
 # ============================================== SCENARIO 6 ===========================================================
 # 6.Check for any null values in both files, and ensure that they match.
-def compare_null_values_between_dataframes(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario6 : Check for any null values in both files, and ensure that they match.\n')
-        null_count_df1 = df1.isnull().sum()  # count of null values
-        null_count_df2 = df2.isnull().sum()
-        if null_count_df1.equals(null_count_df2):
-            output_file.write('Null values in both files match successfully!\n')
-        else:
-            output_file.write('Null values in both files don\'t match\n')
-            output_file.write(f'Null count in df1:\n{null_count_df1}\n\n')
-            output_file.write(f'Null count in df2:\n{null_count_df2}\n')
-
-
-compare_null_values_between_dataframes(output_file_path)
+def compare_null_values_between_dataframes(source, target):
+    output = '\nScenario6 : Check for any null values in both files, and ensure that they match.\n'
+    null_count_df1 = source.null_count  # count of null values
+    null_count_df2 = target.null_count
+    if null_count_df1.equals(null_count_df2):
+        output += 'Null values in both files match successfully!\n'
+    else:
+        output += 'Null values in both files don\'t match\n'
+        output += f'Null count in df1:\n{null_count_df1}\n\n'
+        output += f'Null count in df2:\n{null_count_df2}\n'
+    return output
 
 
 # ============================================== SCENARIO 7 ===========================================================
@@ -339,30 +588,23 @@ compare_null_values_between_dataframes(output_file_path)
 
 # ============================================== SCENARIO 9 ===========================================================
 # 9.Check for any differences in the encoding between the two files.
-def compare_encodings_between_files(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario9 compare_encodings_between_files:\n')
-        encoding_df1, encoding_df2 = detect_encoding2(oracle_source, encodings_list), detect_encoding2(datacloud_target,
-                                                                                                       encodings_list)
-        output_file.write(
-            f'Encoding for both files is same, i.e.: {encoding_df2}\n' if encoding_df1 == encoding_df2 else 'Both files have different encodings\n')
-
-
-compare_encodings_between_files(output_file_path)
+# The encodings were detected once when the files were ingested
+def compare_encodings_between_files(encoding_df1, encoding_df2):
+    output = '\nScenario9 compare_encodings_between_files:\n'
+    output += f'Encoding for both files is same, i.e.: {encoding_df2}\n' if encoding_df1 == encoding_df2 else 'Both files have different encodings\n'
+    return output
 
 
 # ============================================== SCENARIO 10 ===========================================================
 # 10.Confirm that the data in both files is sorted in the same order, if applicable.
+def confirm_data_order_similarity(source, target, frames_equal):
+    num_rows_df1, num_cols_df1 = source.num_records, len(source.columns)
+    num_rows_df2, num_cols_df2 = target.num_records, len(target.columns)
+    output = '\nScenario10: confirm_data_order_similarity.\n'
+    output += ((
+                   "The data in both files is sorted in the same order.\n" if num_rows_df1 == num_rows_df2 and num_cols_df1 == num_rows_df2 and frames_equal else "The data in both files is not sorted in the same order.\n") if num_rows_df1 == num_rows_df2 and num_cols_df1 == num_rows_df2 else 'Both files differ in size, hence can\'t compare the order\n' + f'Shape of oracle source: {(num_rows_df1, num_cols_df1)}\n' + f'Shape of datacloud target: {(num_rows_df2, num_cols_df2)}\n')
+    return output
 
-def confirm_data_order_similarity(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario10: confirm_data_order_similarity.\n')
-        output_file.write((
-                              "The data in both files is sorted in the same order.\n" if num_rows_df1 == num_rows_df2 and num_cols_df1 == num_rows_df2 and df1.equals(
-                                  df2) else "The data in both files is not sorted in the same order.\n") if num_rows_df1 == num_rows_df2 and num_cols_df1 == num_rows_df2 else 'Both files differ in size, hence can\'t compare the order\n' + f'Shape of oracle source: {df1.shape}\n' + f'Shape of datacloud target: {df2.shape}\n')
-
-
-confirm_data_order_similarity(output_file_path)
 
 # ============================================== SCENARIO 11 ===========================================================
 # 11.Test both files with a significant amount of data.
@@ -370,101 +612,113 @@ confirm_data_order_similarity(output_file_path)
 
 # ============================================== SCENARIO 12 ===========================================================
 # 12. Verify if there any duplicates present in the data due to change in the generation process.
-num_dup_df1 = df1.duplicated().sum()
-num_dup_df2 = df2.duplicated().sum()
-
-
-def check_duplicate_records(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario12 check_duplicate_records:\n')
-        output_file.write(f"Count of duplicate records in df1: {num_dup_df1}\n")
-        output_file.write(f"Count of duplicate records in df2: {num_dup_df2}\n")
-
-
-check_duplicate_records(output_file_path)
+def check_duplicate_records(source, target):
+    output = '\nScenario12 check_duplicate_records:\n'
+    output += f"Count of duplicate records in df1: {source.num_duplicates}\n"
+    output += f"Count of duplicate records in df2: {target.num_duplicates}\n"
+    return output
 
 
 # ============================================== SCENARIO 13 ===========================================================
 # 13. verify unique records in source
-def unique_records_in_source(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario13: unique records in source\n')
-        output_file.write(f'Unique records in oracle source: {num_unique_records_oracle_source}\n')
-
-
-unique_records_in_source(output_file_path)
+def unique_records_in_source(source):
+    output = '\nScenario13: unique records in source\n'
+    output += f'Unique records in oracle source: {source.num_unique_keys}\n'
+    return output
 
 
 # ============================================== SCENARIO 14 ===========================================================
 # 14. verify unique records in target
-def unique_records_in_target(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario14: Unique records in target\n')
-        output_file.write(f'Unique records in datacloud target: {num_unique_records_datacloud_target}\n')
-
-
-unique_records_in_target(output_file_path)
+def unique_records_in_target(target):
+    output = '\nScenario14: Unique records in target\n'
+    output += f'Unique records in datacloud target: {target.num_unique_keys}\n'
+    return output
 
 
 # ============================================== SCENARIO 15 ===========================================================
 # 15.Duplicates in Source
-def check_duplicate_records_in_source(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario15: check_duplicate_records_in_source\n')
-        output_file.write(
-            f'There are {num_dup_df1} duplicates in oracle source\n' if num_dup_df1 > 0 else f'There are No Duplicates in oracle source, i.e. {num_dup_df1}\n')
-
-
-check_duplicate_records_in_source(output_file_path)
+def check_duplicate_records_in_source(source):
+    num_dup_df1 = source.num_duplicates
+    output = '\nScenario15: check_duplicate_records_in_source\n'
+    output += f'There are {num_dup_df1} duplicates in oracle source\n' if num_dup_df1 > 0 else f'There are No Duplicates in oracle source, i.e. {num_dup_df1}\n'
+    return output
 
 
 # ============================================== SCENARIO 16 ===========================================================
 # 16. Duplicates in Target
-def check_duplicate_records_in_target(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write('\nScenario16: check_duplicate_records_in_target\n')
-        output_file.write(
-            f'There are {num_dup_df2} duplicates in Datacloud target\n' if num_dup_df2 > 0 else f'There are No Duplicates in Datacloud Target, i.e. {num_dup_df2}\n')
-
-
-check_duplicate_records_in_target(output_file_path)
+def check_duplicate_records_in_target(target):
+    num_dup_df2 = target.num_duplicates
+    output = '\nScenario16: check_duplicate_records_in_target\n'
+    output += f'There are {num_dup_df2} duplicates in Datacloud target\n' if num_dup_df2 > 0 else f'There are No Duplicates in Datacloud Target, i.e. {num_dup_df2}\n'
+    return output
 
 
 # ============================================== SCENARIO 17 ===========================================================
 # 17.Total matched records
-def total_matched_records(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write(f"\n17: Matched records len: {len(matching_records)}\n")
-
-
-total_matched_records(output_file_path)
+def total_matched_records(result):
+    return f"\n17: Matched records len: {result['num_matching_records']}\n"
 
 
 # ============================================== SCENARIO 18 ===========================================================
 # 18.Total unmatched records
-def print_unmatched_records(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write("\n18: Unmatched records len: {}\n".format(len(unmatched_data)))
-
-
-print_unmatched_records(output_file_path)
+def print_unmatched_records(result):
+    return "\n18: Unmatched records len: {}\n".format(result['num_unmatched_data'])
 
 
 # ============================================== SCENARIO 19 ===========================================================
 # 19.Records present in Source only
-def print_oracle_only_records(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write("\n19: Oracle only records len: {}\n".format(len(oracle_only_records)))
-
-
-print_oracle_only_records(output_file_path)
+def print_oracle_only_records(result):
+    return "\n19: Oracle only records len: {}\n".format(result['num_oracle_only_records'])
 
 
 # ============================================== SCENARIO 20 ===========================================================
 # 20.Records present in target only
-def print_datacloud_only_records(output_file_path):
-    with open(output_file_path, 'a') as output_file:
-        output_file.write("\n20: datacloud_only_records len {}\n".format(len(datacloud_only_records)))
-
-
-print_datacloud_only_records(output_file_path)
+def print_datacloud_only_records(result):
+    return "\n20: datacloud_only_records len {}\n".format(result['num_datacloud_only_records'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare an Oracle source extract with its Datacloud target')
+    parser.add_argument('source', help='Oracle source file or s3://bucket/key url')
+    parser.add_argument('target', help='Datacloud target file or s3://bucket/key url')
+    parser.add_argument('--key', nargs='+', default=[primary_key],
+                        help=f'primary key column, several columns for a composite key (default {primary_key})')
+    parser.add_argument('--output-dir', default='.', help='directory the csv files and output.txt are written to')
+    parser.add_argument('--chunk-size', type=int, default=chunk_size, help='rows read at once')
+    parser.add_argument('--mode', choices=comparison.COMPARISON_MODES, default=comparison_mode,
+                        help="'hash' compares one 64-bit hash per row, 'merge' merges both files on every column")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='read, split by primary_key and compare both files in this many processes')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='compare the files bucket by bucket instead of loading them into memory')
+    parser.add_argument('--pyarrow', action='store_true',
+                        help='parse single character delimited files with pyarrow (whole file at once)')
+    parser.add_argument('--cache-dir', help='cache parsed files in this directory, unchanged files are not parsed again')
+    parser.add_argument('--index-dir',
+                        help='keep a row hash index of the pair here and only compare keys changed since the last run')
+    parser.add_argument('--compact-dtypes', action='store_true',
+                        help='load text columns as categoricals / pyarrow strings to cut memory')
+    parser.add_argument('--output-format', choices=output_sinks.OUTPUT_FORMATS, default='csv',
+                        help='format of the unmatched / oracle only / datacloud only files')
+    parser.add_argument('--max-output-rows', type=int,
+                        help='write at most this many records per output file, output.txt still counts all of them')
+    parser.add_argument('--rules', help='json or yaml file of per column comparison rules (tolerances, date formats, '
+                                         'string normalization)')
+    parser.add_argument('--engine', choices=comparison.ENGINES, default='pandas',
+                        help='classify the records with pandas or in an in-process DuckDB database (same outputs)')
+    parser.add_argument('--plot', action='store_true', help='save the metrics plot to the output directory')
+    parser.add_argument('--show-plot', action='store_true', help='save and display the metrics plot')
+    parser.add_argument('--profile', choices=instrumentation.PROFILE_MODES,
+                        help='also profile the run with cProfile (run_profile.prof) or tracemalloc')
+    args = parser.parse_args(argv)
+
+    compare(args.source, args.target, key=args.key, output_dir=args.output_dir, chunk_size=args.chunk_size,
+            mode=args.mode, workers=args.workers, out_of_core=args.out_of_core, use_pyarrow=args.pyarrow,
+            cache_dir=args.cache_dir, index_dir=args.index_dir, compact_dtypes=args.compact_dtypes, plot=args.plot,
+            show_plot=args.show_plot, output_format=args.output_format, max_output_rows=args.max_output_rows,
+            rules=args.rules, engine=args.engine, profile_mode=args.profile)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+
+import pandas as pd
+
+import Data_Comparison
+import comparison
+
+# Memory a comparison takes per byte of input, both files parsed into object columns plus the sorted copies,
+# hashes and output frames. Pairs can give their own figure with 'memory_mb' in the manifest.
+MEMORY_PER_INPUT_BYTE = 8
+
+# Options of a manifest pair that are passed on to Data_Comparison.compare
+COMPARE_OPTIONS = ('key', 'chunk_size', 'mode', 'workers', 'out_of_core', 'use_pyarrow', 'cache_dir', 'index_dir',
+                   'compact_dtypes', 'output_format', 'max_output_rows', 'rules', 'engine', 'plot',
+                   'profile_mode')
+
+SUMMARY_FILE = 'summary.csv'
+
+
+def parse_size(size):
+    """Parse a memory size such as 4096, '512M' or '8G' into bytes."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def load_manifest(manifest_path):
+    """
+    Read a YAML or JSON manifest of file pairs.
+    The manifest is either a list of pairs or a mapping with 'pairs' and optional 'defaults' (options applied to
+    every pair). A pair has 'source', 'target' and optionally 'name', 'memory_mb' and any of COMPARE_OPTIONS.
+    Relative paths are relative to the manifest.
+    Parameters:
+        manifest_path (str): Path of the .yaml/.yml or .json file
+    Returns:
+        list: One dict per pair with 'name', 'source', 'target', 'memory_mb' (or None) and 'options'
+    """
+    with open(manifest_path) as manifest_file:
+        if os.path.splitext(manifest_path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError('YAML manifests need PyYAML (pip install pyyaml), or use a JSON manifest')
+            manifest = yaml.safe_load(manifest_file)
+        else:
+            manifest = json.load(manifest_file)
+
+    if isinstance(manifest, list):
+        manifest = {'pairs': manifest}
+    defaults = manifest.get('defaults') or {}
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    pairs, names = [], set()
+    for number, entry in enumerate(manifest.get('pairs') or [], start=1):
+        entry = {**defaults, **entry}
+        if 'source' not in entry or 'target' not in entry:
+            raise ValueError(f'Pair {number} of {manifest_path} needs a source and a target')
+        unknown = entry.keys() - set(COMPARE_OPTIONS) - {'name', 'source', 'target', 'memory_mb'}
+        if unknown:
+            raise ValueError(f'Pair {number} of {manifest_path} has unknown options: {sorted(unknown)}')
+        name = str(entry.get('name') or os.path.splitext(os.path.basename(entry['source']))[0])
+        if name in names:
+            raise ValueError(f'Pair name {name!r} is used twice in {manifest_path}, give the pairs a name')
+        names.add(name)
+        options = {option: entry[option] for option in COMPARE_OPTIONS if option in entry}
+        if options.get('cache_dir'):
+            options['cache_dir'] = os.path.join(base_dir, options['cache_dir'])
+        # Rules are inline or the path of a rules file
+        if isinstance(options.get('rules'), str):
+            options['rules'] = os.path.join(base_dir, options['rules'])
+        if options.get('index_dir'):
+            # Every pair keeps its own index, the same index_dir can be given in the defaults
+            options['index_dir'] = os.path.join(base_dir, options['index_dir'], name)
+        pairs.append({'name': name, 'source': os.path.join(base_dir, entry['source']),
+                      'target': os.path.join(base_dir, entry['target']), 'memory_mb': entry.get('memory_mb'),
+                      'options': options})
+    return pairs
+
+
+def estimate_memory(pair):
+    """Bytes of memory the comparison of a pair is expected to need."""
+    if pair['memory_mb'] is not None:
+        return int(pair['memory_mb'] * 1024 ** 2)
+    input_bytes = sum(os.path.getsize(path) for path in (pair['source'], pair['target']) if os.path.exists(path))
+    return input_bytes * MEMORY_PER_INPUT_BYTE
+
+
+def estimate_cpus(pair):
+    """CPUs the comparison of a pair keeps busy."""
+    return max(1, int(pair['options'].get('workers', 1)))
+
+
+def run_pair(pair, output_dir):
+    """
+    Compare one pair into output_dir/<name>; runs in a worker process.
+    Returns:
+        dict: Summary row of the pair, 'status' is 'ok' or 'failed' (with the error)
+    """
+    row = {'name': pair['name'], 'source': pair['source'], 'target': pair['target'],
+           'key': comparison.key_name(pair['options'].get('key', Data_Comparison.primary_key))}
+    started = time.perf_counter()
+    try:
+        result = Data_Comparison.compare(pair['source'], pair['target'],
+                                         output_dir=os.path.join(output_dir, pair['name']), verbose=False,
+                                         **pair['options'])
+    except Exception as e:
+        row.update({'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+    else:
+        row.update({'status': 'ok', 'error': '',
+                    'records_source': result.source_profile.num_records,
+                    'records_target': result.target_profile.num_records,
+                    'matched': result['num_matching_records'], 'unmatched': result['num_unmatching_records'],
+                    'unmatched_data': result['num_unmatched_data'],
+                    'oracle_only': result['num_oracle_only_records'],
+                    'datacloud_only': result['num_datacloud_only_records'],
+                    'ingestion_seconds': round(result.timings['ingestion'], 3),
+                    'comparison_seconds': round(result.timings['comparison'], 3)})
+    row['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def _run_pair_process(pair, output_dir, connection):
+    # Body of the process of a pair, the summary row goes back to run_batch through the pipe
+    connection.send(run_pair(pair, output_dir))
+    connection.close()
+
+
+def _process_error(exitcode):
+    if exitcode is not None and exitcode < 0:
+        return f'worker process was killed by signal {-exitcode}'
+    return f'worker process exited with code {exitcode} without a result'
+
+
+def run_batch(pairs, output_dir, memory_budget, cpus=None, verbose=True):
+    """
+    Compare many pairs concurrently without going over a memory and CPU budget.
+    Pairs are started largest (by estimated memory) first, which packs the budget better than manifest order: the
+    big pairs do not end up running alone at the end while the small ones fill the gaps next to them. A pair that
+    does not fit in the whole budget on its own is run when nothing else is running.
+    Every pair runs in a process of its own, so the memory it used is returned when it finishes, and a process
+    that dies (e.g. killed for running out of memory) only fails its own pair; the summary is always written.
+    Parameters:
+        pairs (list): Pairs as returned by load_manifest
+        output_dir (str): Each pair writes to output_dir/<name>, the summary is written to output_dir
+        memory_budget (int): Bytes the running pairs together may use
+        cpus (int): CPUs the running pairs together may use, defaults to the number of CPUs
+        verbose (bool): Print a line when a pair starts and finishes
+    Returns:
+        DataFrame: The summary, one row per pair in manifest order
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    cpus = cpus or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    for pair in pairs:
+        pair['estimated_memory'] = estimate_memory(pair)
+        pair['cpus'] = min(estimate_cpus(pair), cpus)
+    pending = sorted(pairs, key=lambda pair: pair['estimated_memory'], reverse=True)
+
+    batch_start = time.perf_counter()
+    # Process sentinel -> (process, receiving end of its pipe, pair)
+    rows, running, memory_used, cpus_used = {}, {}, 0, 0
+    try:
+        while pending or running:
+            for pair in list(pending):
+                fits = (memory_used + pair['estimated_memory'] <= memory_budget and cpus_used + pair['cpus'] <= cpus)
+                if fits or not running:
+                    pending.remove(pair)
+                    log(f"Starting {pair['name']} (estimated memory {pair['estimated_memory'] / 1024 ** 2:.0f} MB, "
+                        f"{pair['cpus']} cpu)")
+                    receiver, sender = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=_run_pair_process, args=(pair, output_dir, sender),
+                                                      name=f"compare-{pair['name']}")
+                    process.start()
+                    sender.close()
+                    running[process.sentinel] = (process, receiver, pair)
+                    memory_used += pair['estimated_memory']
+                    cpus_used += pair['cpus']
+
+            for sentinel in multiprocessing.connection.wait(list(running)):
+                process, receiver, pair = running.pop(sentinel)
+                process.join()
+                memory_used -= pair['estimated_memory']
+                cpus_used -= pair['cpus']
+                try:
+                    row = receiver.recv()
+                except EOFError:
+                    # The process died before it sent its row (killed for running out of memory, os._exit, ...)
+                    row = {'name': pair['name'], 'source': pair['source'], 'target': pair['target'],
+                           'status': 'failed', 'error': _process_error(process.exitcode)}
+                finally:
+                    receiver.close()
+                row['estimated_memory_mb'] = round(pair['estimated_memory'] / 1024 ** 2)
+                rows[pair['name']] = row
+                log(f"Finished {pair['name']}: {row['status']} in {row.get('elapsed_seconds', 0):.2f}s"
+                    + (f" ({row['error']})" if row['error'] else ''))
+    finally:
+        # Interrupted batches still get a summary, pairs without a row are marked as not finished
+        for process, receiver, pair in running.values():
+            process.terminate()
+            process.join()
+            receiver.close()
+        for pair in pairs:
+            rows.setdefault(pair['name'], {'name': pair['name'], 'source': pair['source'], 'target': pair['target'],
+                                           'status': 'failed', 'error': 'not finished'})
+        summary = pd.DataFrame([rows[pair['name']] for pair in pairs])
+        summary.to_csv(os.path.join(output_dir, SUMMARY_FILE), index=False)
+    log(f'Batch of {len(pairs)} pairs finished in {time.perf_counter() - batch_start:.2f}s, '
+        f"{(summary['status'] != 'ok').sum() if len(summary) else 0} failed")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare every source/target pair listed in a manifest')
+    parser.add_argument('manifest', help='YAML or JSON list of pairs (source, target, key and options)')
+    parser.add_argument('--output-dir', default='.', help='each pair writes to a sub directory named after it')
+    parser.add_argument('--memory-budget', default='4G', help='memory the running pairs may use together, e.g. 8G')
+    parser.add_argument('--cpus', type=int, default=None, help='CPUs the running pairs may use together')
+    args = parser.parse_args(argv)
+
+    summary = run_batch(load_manifest(args.manifest), args.output_dir, parse_size(args.memory_budget), args.cpus)
+    print(summary.to_string(index=False))
+    return 0 if (summary['status'] == 'ok').all() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
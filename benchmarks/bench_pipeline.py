@@ -0,0 +1,189 @@
+"""
+Benchmark of the full Data_Comparison flow on generated source/target pairs (see generate_data.py).
+Every comparison runs in its own process through the command line, so the peak memory of one run does not carry
+over into the next. The stages of its run_profile.json are summed per stage and printed as rows/sec, seconds and
+peak RSS, and the counts in output.txt are checked against the changes the generator made. --results appends
+the numbers to a csv, --baseline compares the totals with an earlier label of that csv to track regressions.
+Options not known here are passed on to Data_Comparison.py.
+
+    python benchmarks/bench_pipeline.py --rows 10k 1m --delimiter '|' '|*|' --results bench.csv --label after
+    python benchmarks/bench_pipeline.py --rows 3m --compact-dtypes --results bench.csv --baseline before
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import generate_data  # noqa: E402
+
+DATA_COMPARISON = os.path.join(os.path.dirname(BENCHMARK_DIR), 'Data_Comparison.py')
+
+# Stages reported one by one, every other stage of run_profile.json is a report scenario
+PIPELINE_STAGES = ['cache load', 'detect', 'read', 'sort', 'cache store', 'harmonize dtypes', 'match', 'anti-join',
+                   'column diff', 'file profiles', 'out-of-core comparison', 'output write', 'plot', 'report write']
+
+RESULT_COLUMNS = ['label', 'timestamp', 'rows', 'delimiter', 'options', 'stage', 'stage_rows', 'wall_seconds',
+                  'cpu_seconds', 'rows_per_second', 'peak_rss_mb', 'counts']
+
+
+def prepare_pair(data_dir, rows, delimiter, seed):
+    """Generate the pair once, later runs with the same arguments reuse the files."""
+    name = f"{rows}_{'multi' if len(delimiter) > 1 else 'single'}_{seed}"
+    pair_dir = os.path.join(data_dir, name)
+    pair_path = os.path.join(pair_dir, generate_data.PAIR_FILE)
+    if os.path.exists(pair_path):
+        with open(pair_path) as pair_file:
+            pair = json.load(pair_file)
+        if pair['delimiter'] == delimiter:
+            return pair
+    print(f'Generating {rows} rows with {delimiter!r} in {pair_dir}')
+    return generate_data.generate_pair(pair_dir, rows, delimiter, seed=seed)
+
+
+def expected_counts(pair):
+    """Report counts the changes of the generator lead to, a duplicated record matches twice."""
+    return {'oracle only records': pair['deleted'], 'datacloud only records': pair['inserted'],
+            'Number of matched records': pair['rows'] - pair['deleted'] - pair['edited'] + pair['duplicated'],
+            'Number of unmatched records': pair['deleted'] + pair['inserted'] + 2 * pair['edited']}
+
+
+def check_counts(pair, report_path):
+    """Return 'ok' when output.txt has the expected counts, otherwise the counts that differ."""
+    with open(report_path) as report_file:
+        report = report_file.read()
+    wrong = []
+    for line, expected in expected_counts(pair).items():
+        found = re.search(rf'^{line}: (\d+)$', report, re.MULTILINE)
+        if found is None or int(found.group(1)) != expected:
+            wrong.append(f"{line} {found.group(1) if found else '?'} != {expected}")
+    return 'ok' if not wrong else '; '.join(wrong)
+
+
+def summarize_stages(profile):
+    """
+    Sum the stages of a run profile per stage, report scenarios as one 'scenarios' stage, plus a total.
+    The CPU time includes the worker processes, the peak memory is the larger of the run's own and its workers'.
+    """
+    stages = {}
+    for record in profile['stages']:
+        name = record['stage'] if record['stage'] in PIPELINE_STAGES else 'scenarios'
+        stage = stages.setdefault(name, {'stage_rows': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                         'peak_rss_bytes': 0})
+        stage['stage_rows'] += record['rows'] or 0
+        stage['wall_seconds'] += record['wall_seconds']
+        stage['cpu_seconds'] += record['cpu_seconds'] + (record.get('children_cpu_seconds') or 0)
+        stage['peak_rss_bytes'] = max(stage['peak_rss_bytes'], record.get('peak_rss_bytes') or 0,
+                                      record.get('peak_children_rss_bytes') or 0)
+    order = PIPELINE_STAGES + ['scenarios']
+    stages = dict(sorted(stages.items(), key=lambda item: order.index(item[0])))
+    stages['total'] = {'stage_rows': 0, 'wall_seconds': profile['total_wall_seconds'],
+                       'cpu_seconds': profile['total_cpu_seconds'] + (profile.get('total_children_cpu_seconds') or 0),
+                       'peak_rss_bytes': max(profile['peak_rss_bytes'] or 0,
+                                             profile.get('peak_children_rss_bytes') or 0)}
+    return stages
+
+
+def run_benchmark(pair, output_dir, options):
+    """
+    Compare a generated pair with the command line in a new process.
+    Returns:
+        dict: stage -> 'stage_rows', 'wall_seconds', 'cpu_seconds' and 'peak_rss_bytes' (see summarize_stages)
+        str: check_counts result
+    """
+    command = [sys.executable, DATA_COMPARISON, pair['source'], pair['target'], '--output-dir', output_dir, *options]
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                               env={**os.environ, 'MPLBACKEND': 'Agg'})
+    if completed.returncode:
+        raise RuntimeError(f'{" ".join(command)} failed:\n{completed.stderr}')
+    with open(os.path.join(output_dir, 'run_profile.json')) as profile_file:
+        profile = json.load(profile_file)
+    return summarize_stages(profile), check_counts(pair, os.path.join(output_dir, 'output.txt'))
+
+
+def print_stages(stages, counts):
+    print(f'{"stage":<24}{"rows":>12}{"seconds":>10}{"cpu":>10}{"rows/sec":>14}{"peak RSS MB":>13}')
+    for name, stage in stages.items():
+        rows_per_second = stage['stage_rows'] / stage['wall_seconds'] if stage['wall_seconds'] else 0
+        print(f"{name:<24}{stage['stage_rows']:>12}{stage['wall_seconds']:>10.3f}{stage['cpu_seconds']:>10.3f}"
+              f"{rows_per_second:>14,.0f}{stage['peak_rss_bytes'] / 1024 ** 2:>13.0f}")
+    print(f'counts: {counts}\n')
+
+
+def append_results(results_path, rows):
+    new_file = not os.path.exists(results_path)
+    with open(results_path, 'a', newline='') as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=RESULT_COLUMNS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def compare_to_baseline(results_path, label, baseline):
+    """Print the total seconds and peak RSS of label against baseline for every configuration both ran."""
+    results = pd.read_csv(results_path, keep_default_na=False)
+    totals = results[results['stage'] == 'total'].groupby(['label', 'rows', 'delimiter', 'options'])[
+        ['wall_seconds', 'peak_rss_mb']].min()
+    if label not in totals.index.get_level_values(0) or baseline not in totals.index.get_level_values(0):
+        print(f'No results of both {label!r} and {baseline!r} in {results_path}')
+        return
+    merged = totals.loc[label].join(totals.loc[baseline], how='inner', lsuffix='', rsuffix='_baseline')
+    if merged.empty:
+        print(f'{label!r} and {baseline!r} have no rows, delimiter and options in common')
+        return
+    merged['speedup'] = merged['wall_seconds_baseline'] / merged['wall_seconds']
+    merged['memory_ratio'] = merged['peak_rss_mb'] / merged['peak_rss_mb_baseline']
+    print(f'{label} against {baseline}:')
+    print(merged.to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', nargs='+', default=['10k'], help='source sizes, e.g. 10k 1m 10m')
+    parser.add_argument('--delimiter', nargs='+', default=['|'], help="delimiters, e.g. '|' '|*|'")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated pairs')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per configuration')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'data_comparison_bench'),
+                        help='generated pairs are kept here and reused')
+    parser.add_argument('--results', help='append the results to this csv file')
+    parser.add_argument('--label', default=datetime.datetime.now().strftime('%Y%m%d-%H%M%S'),
+                        help='label of this run in the results file, e.g. a commit')
+    parser.add_argument('--baseline', help='label in the results file to compare the totals with')
+    args, options = parser.parse_known_args()
+
+    result_rows = []
+    timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+    for rows in map(generate_data.parse_rows, args.rows):
+        for delimiter in args.delimiter:
+            pair = prepare_pair(args.data_dir, rows, delimiter, args.seed)
+            for run in range(args.repeat):
+                with tempfile.TemporaryDirectory(prefix='bench_output_') as output_dir:
+                    stages, counts = run_benchmark(pair, output_dir, options)
+                print(f"{rows} rows, delimiter {delimiter!r}, options {' '.join(options) or '-'}, run {run + 1}")
+                print_stages(stages, counts)
+                for name, stage in stages.items():
+                    result_rows.append({
+                        'label': args.label, 'timestamp': timestamp, 'rows': rows, 'delimiter': delimiter,
+                        'options': ' '.join(options), 'stage': name, 'stage_rows': stage['stage_rows'],
+                        'wall_seconds': round(stage['wall_seconds'], 4), 'cpu_seconds': round(stage['cpu_seconds'], 4),
+                        'rows_per_second': round(stage['stage_rows'] / stage['wall_seconds'])
+                        if stage['wall_seconds'] else 0,
+                        'peak_rss_mb': round(stage['peak_rss_bytes'] / 1024 ** 2, 1), 'counts': counts})
+
+    if args.results:
+        append_results(args.results, result_rows)
+        if args.baseline:
+            compare_to_baseline(args.results, args.label, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
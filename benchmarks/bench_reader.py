@@ -0,0 +1,86 @@
+"""
+Benchmark of csv_reader against the python-engine path read_and_merge_csv used before.
+Writes a synthetic ADDRESSES-like extract with a single character ('|') and a multi-character ('|*|') delimiter
+and prints rows/sec for every reader.
+
+    python benchmarks/bench_reader.py --rows 500000
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_reader  # noqa: E402
+
+COLUMNS = ['CS_COMPANY_ID', 'BUSINESS_NAME', 'COMPANY_REGISTRATION_NUMBER', 'ADDRESS1', 'ADDRESS2', 'ADDRESS3',
+           'ADDRESS4', 'ADDRESS5', 'ADDRESS_TYPE']
+
+
+def write_sample_file(file_path, delimiter, num_rows):
+    with open(file_path, 'w', encoding='ISO-8859-1') as file:
+        file.write(delimiter.join(COLUMNS) + '\n')
+        for i in range(num_rows):
+            row = [f'BE{i:08d}', f'COMPANY {i} NV', str(200000000 + i), 'DIESTSESTEENWEG', str(i % 300), '',
+                   str(1000 + i % 9000), 'LUBBEEK', str(1 + i % 2)]
+            file.write(delimiter.join(row) + '\n')
+
+
+def read_python_engine(file_path, delimiter, encoding):
+    return pd.read_csv(file_path, delimiter=re.escape(delimiter), encoding=encoding, on_bad_lines='skip',
+                       index_col=False, engine='python')
+
+
+def read_c_engine(file_path, delimiter, encoding):
+    return csv_reader.read_csv(file_path, delimiter, encoding)
+
+
+def read_pyarrow_engine(file_path, delimiter, encoding):
+    return csv_reader.read_csv(file_path, delimiter, encoding, prefer_pyarrow=True)
+
+
+def engine_label(reader, delimiter):
+    if reader is read_python_engine:
+        return 'python'
+    engine = csv_reader.select_engine(delimiter, prefer_pyarrow=reader is read_pyarrow_engine)
+    return 'c*' if engine == 'python' else engine
+
+
+def time_reader(reader, file_path, delimiter, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = reader(file_path, delimiter, 'ISO-8859-1')
+        best = min(best, time.perf_counter() - started)
+    return len(df), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='rows in the synthetic file')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per reader, the best one is reported')
+    args = parser.parse_args()
+
+    readers = [('python engine (before)', read_python_engine), ('csv_reader', read_c_engine)]
+    if csv_reader.PYARROW_AVAILABLE:
+        readers.append(('csv_reader pyarrow', read_pyarrow_engine))
+
+    print(f'{"delimiter":<10}{"reader":<26}{"engine":<10}{"rows":>10}{"seconds":>10}{"rows/sec":>14}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for delimiter in ['|', '|*|']:
+            file_path = os.path.join(tmp_dir, 'sample.csv')
+            write_sample_file(file_path, delimiter, args.rows)
+            for name, reader in readers:
+                engine = engine_label(reader, delimiter)
+                rows, seconds = time_reader(reader, file_path, delimiter, args.repeat)
+                print(f'{delimiter:<10}{name:<26}{engine:<10}{rows:>10}{seconds:>10.3f}{rows / seconds:>14,.0f}')
+    print('c* = multi-character delimiter translated to a single byte and parsed by the C engine')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Generate a synthetic Oracle source / Datacloud target pair for benchmarks.
+The source is an ADDRESSES-like extract with a few BALANCESHEET-like columns, the target is the same extract with
+controlled rates of deleted, inserted, edited and duplicated records. Rows are written in blocks, so 10M row
+files are generated in bounded memory. The counts of every change are saved next to the files (pair.json),
+so the comparison results can be checked against them.
+
+    python benchmarks/generate_data.py --rows 1m --delimiter '|*|' --output-dir /tmp/bench_1m
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['CS_COMPANY_ID', 'BUSINESS_NAME', 'COMPANY_REGISTRATION_NUMBER', 'ADDRESS1', 'ADDRESS2', 'ADDRESS3',
+           'ADDRESS4', 'ADDRESS5', 'ADDRESS_TYPE', 'CURRENCY', 'CONSOLIDATED_ACCOUNTS', 'REVENUE', 'PROFIT_AFTER_TAX']
+
+NAMES = np.array(['PROVINCIALE BRABANCONNE', 'GEMEENTE MACHELEN', 'VERLINDEN EN STOK', 'DUSAR, MICHAËL',
+                  'BRAEMS FABIENNE', 'JOHAN VAN DRIESUM BEHEER', 'CAFÉ DE KROON', 'BOULANGERIE FRANÇOIS',
+                  'DE SMET & ZONEN', 'INTERCOMMUNALE LEIEDAL'], dtype=object)
+LEGAL_FORMS = np.array(['NV', 'BV', 'BVBA', 'VZW', 'SA', 'SRL', 'CV', ''], dtype=object)
+STREETS = np.array(['DIESTSESTEENWEG', 'WOLUWESTRAAT', 'ONDERNEMERSSTRAAT', 'DOKTER EDUARD MOREAUXLAAN',
+                    'KERKSTRAAT', 'STATIONSSTRAAT', 'RUE DE LA GARE', 'CHAUSSÉE DE WAVRE'], dtype=object)
+CITIES = np.array(['LUBBEEK', 'MACHELEN (BRAB.)', 'LIER', 'OOSTENDE', 'GENT', 'LIÈGE', 'NAMUR', 'BRUGGE'],
+                  dtype=object)
+CURRENCIES = np.array(['EUR', 'USD', 'GBP'], dtype=object)
+FLAGS = np.array(['N', 'Y'], dtype=object)
+
+# Every file is written as ISO-8859-1, like the real extracts
+ENCODING = 'ISO-8859-1'
+
+BLOCK_ROWS = 200000
+PAIR_FILE = 'pair.json'
+
+
+def parse_rows(rows):
+    """Parse a row count such as 10000, '10k', '1m' or '3M'."""
+    if isinstance(rows, int):
+        return rows
+    rows = str(rows).strip().lower().replace('_', '')
+    multiplier = {'k': 10 ** 3, 'm': 10 ** 6}.get(rows[-1:], 1)
+    return int(float(rows.rstrip('km')) * multiplier)
+
+
+def make_records(keys, rng, null_rate):
+    """Build the records of a block of numeric keys, every column as text, '' for nulls."""
+    size = len(keys)
+    records = {
+        'CS_COMPANY_ID': pd.Series(keys).map('BE{:08d}'.format).to_numpy(dtype=object),
+        'BUSINESS_NAME': NAMES[rng.integers(len(NAMES), size=size)] + ' ' + keys.astype(str) + ' '
+                         + LEGAL_FORMS[rng.integers(len(LEGAL_FORMS), size=size)],
+        'COMPANY_REGISTRATION_NUMBER': (200000000 + keys).astype(str).astype(object),
+        'ADDRESS1': STREETS[rng.integers(len(STREETS), size=size)],
+        'ADDRESS2': rng.integers(1, 300, size=size).astype(str).astype(object),
+        'ADDRESS3': np.full(size, '', dtype=object),
+        'ADDRESS4': rng.integers(1000, 9999, size=size).astype(str).astype(object),
+        'ADDRESS5': CITIES[rng.integers(len(CITIES), size=size)],
+        'ADDRESS_TYPE': rng.integers(1, 3, size=size).astype(str).astype(object),
+        'CURRENCY': CURRENCIES[rng.choice(len(CURRENCIES), size=size, p=[0.9, 0.07, 0.03])],
+        'CONSOLIDATED_ACCOUNTS': FLAGS[rng.integers(len(FLAGS), size=size)],
+        'REVENUE': rng.integers(0, 10 ** 7, size=size).astype(str).astype(object),
+        'PROFIT_AFTER_TAX': rng.integers(-10 ** 6, 10 ** 6, size=size).astype(str).astype(object),
+    }
+    # Address and financial columns are often empty in the real extracts, the key and name never are
+    for column_name in COLUMNS[3:]:
+        records[column_name][rng.random(size) < null_rate] = ''
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def edit_records(records, rng):
+    """Change one non-key column of every record, the edited value never equals the original one."""
+    records = records.copy()
+    columns = rng.integers(1, len(COLUMNS), size=len(records))
+    for position, column_name in enumerate(COLUMNS):
+        edited = columns == position
+        if edited.any():
+            records.loc[edited, column_name] = records.loc[edited, column_name] + '7'
+    return records
+
+
+def write_block(file_obj, records, delimiter):
+    lines = records[COLUMNS[0]].str.cat([records[column_name] for column_name in COLUMNS[1:]], sep=delimiter)
+    file_obj.write('\n'.join(lines) + '\n')
+
+
+def generate_pair(output_dir, rows, delimiter='|', insert_rate=0.01, delete_rate=0.01, edit_rate=0.05,
+                  duplicate_rate=0.001, null_rate=0.2, seed=0, block_rows=BLOCK_ROWS):
+    """
+    Write source.csv and target.csv to output_dir.
+    Every source record is, independently and at most one of them, deleted from the target (delete_rate), edited
+    in one column (edit_rate) or written twice to the target (duplicate_rate). insert_rate * rows records with new
+    keys are added to the target. Records are shuffled within each block, like the unsorted real extracts.
+    Parameters:
+        output_dir (str): Directory of the pair, created if missing
+        rows (int): Records in the source
+        delimiter (str): '|', '|*|' or any other delimiter
+        insert_rate, delete_rate, edit_rate, duplicate_rate (float): Share of the source records
+        null_rate (float): Share of empty values in the nullable columns
+        seed (int): Seed of the random generator, the same arguments always give the same files
+        block_rows (int): Rows generated and written at once
+    Returns:
+        dict: The arguments, the file paths and the number of 'deleted', 'inserted', 'edited' and 'duplicated'
+            records, also saved as output_dir/pair.json
+    """
+    if delete_rate + edit_rate + duplicate_rate > 1:
+        raise ValueError('delete_rate + edit_rate + duplicate_rate must not exceed 1')
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pair = {'rows': rows, 'delimiter': delimiter, 'insert_rate': insert_rate, 'delete_rate': delete_rate,
+            'edit_rate': edit_rate, 'duplicate_rate': duplicate_rate, 'null_rate': null_rate, 'seed': seed,
+            'source': os.path.join(output_dir, 'source.csv'), 'target': os.path.join(output_dir, 'target.csv'),
+            'deleted': 0, 'inserted': 0, 'edited': 0, 'duplicated': 0}
+    num_inserts = int(round(rows * insert_rate))
+
+    with open(pair['source'], 'w', encoding=ENCODING, newline='') as source_file, \
+            open(pair['target'], 'w', encoding=ENCODING, newline='') as target_file:
+        source_file.write(delimiter.join(COLUMNS) + '\n')
+        target_file.write(delimiter.join(COLUMNS) + '\n')
+        for start in range(0, max(rows, num_inserts), block_rows):
+            keys = np.arange(start, min(start + block_rows, rows))
+            records = make_records(keys, rng, null_rate)
+            change = rng.random(len(records))
+            deleted = change < delete_rate
+            edited = (change >= delete_rate) & (change < delete_rate + edit_rate)
+            duplicated = (change >= delete_rate + edit_rate) & (change < delete_rate + edit_rate + duplicate_rate)
+
+            insert_keys = np.arange(rows + start, rows + min(start + block_rows, num_inserts))
+            target = pd.concat([records[~deleted & ~edited], edit_records(records[edited], rng), records[duplicated],
+                                make_records(insert_keys, rng, null_rate)], ignore_index=True)
+
+            write_block(source_file, records.sample(frac=1, random_state=rng), delimiter)
+            write_block(target_file, target.sample(frac=1, random_state=rng), delimiter)
+            pair['deleted'] += int(deleted.sum())
+            pair['edited'] += int(edited.sum())
+            pair['duplicated'] += int(duplicated.sum())
+            pair['inserted'] += len(insert_keys)
+
+    with open(os.path.join(output_dir, PAIR_FILE), 'w') as pair_file:
+        json.dump(pair, pair_file, indent=2)
+    return pair
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10k', help='records in the source, e.g. 10k, 1m, 10m')
+    parser.add_argument('--delimiter', default='|', help="delimiter of both files, e.g. '|' or '|*|'")
+    parser.add_argument('--insert-rate', type=float, default=0.01, help='share of records added to the target')
+    parser.add_argument('--delete-rate', type=float, default=0.01, help='share of records missing in the target')
+    parser.add_argument('--edit-rate', type=float, default=0.05, help='share of records with one changed column')
+    parser.add_argument('--duplicate-rate', type=float, default=0.001, help='share of records written twice')
+    parser.add_argument('--null-rate', type=float, default=0.2, help='share of empty values in nullable columns')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--output-dir', required=True, help='directory source.csv and target.csv are written to')
+    args = parser.parse_args()
+
+    pair = generate_pair(args.output_dir, parse_rows(args.rows), args.delimiter, args.insert_rate,
+                         args.delete_rate, args.edit_rate, args.duplicate_rate, args.null_rate, args.seed)
+    print(f"{pair['source']}: {pair['rows']} records")
+    print(f"{pair['target']}: {pair['deleted']} deleted, {pair['edited']} edited, {pair['duplicated']} duplicated, "
+          f"{pair['inserted']} inserted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import comparison_rules
+import duckdb_engine
+import instrumentation
+import output_sinks
+import profiling
+
+COMPARISON_MODES = ('hash', 'merge')
+
+# Column of the running number of records that share a key, only while records are paired
+OCCURRENCE = '__occurrence'
+ROW = '__row'
+
+# Output frames of compare_frames and the file each one is saved to
+OUTPUT_FILES = {
+    'unmatched_data': 'unmatched_data.csv',
+    'unmatched_changes': 'unmatched_data_long.csv',
+    'oracle_only_records': 'oracle_only_records.csv',
+    'datacloud_only_records': 'datacloud_only_records.csv',
+}
+
+
+def key_columns(primary_key):
+    """Columns of a key given as one column name or as a list of columns (a composite key)."""
+    return [primary_key] if isinstance(primary_key, str) else list(primary_key)
+
+
+def typed_output_columns(primary_key):
+    """
+    Columns of the output files that keep their dtype in parquet, output name -> columns (output_sinks.OutputSink).
+    Only the key of unmatched_data: its other columns hold 'old -> new' text in the chunks where they changed and
+    the plain values elsewhere. Every column of the other outputs keeps its dtype.
+    """
+    return {'unmatched_data': key_columns(primary_key)}
+
+
+def key_name(primary_key):
+    """Name of a key in the report, e.g. 'CS_COMPANY_ID' or 'CS_COMPANY_ID+ADDRESS_TYPE'."""
+    return '+'.join(key_columns(primary_key))
+
+
+def key_codes(df1, df2, primary_key):
+    """
+    One value per record that identifies its key, for membership tests and counts on the key alone.
+    A single key column is used as it is, the columns of a composite key are hashed to one 64-bit value per record
+    (row_hashes, so key values a merge considers equal also get the same code).
+    Returns:
+        Series, Series: Codes of df1 and df2
+    """
+    columns = key_columns(primary_key)
+    if len(columns) == 1:
+        return df1[columns[0]], df2[columns[0]]
+    return row_hashes(df1[columns], df2[columns])
+
+
+def build_unmatched_data(data_mismatch_records, columns, primary_key, rules=None):
+    """
+    Build the column level difference of records present in both files with different values.
+    Every column is compared in one vectorized operation and the 'old -> new' strings are only built for the
+    cells that differ.
+    Parameters:
+        data_mismatch_records (DataFrame): Records paired on primary_key with the '_x' (source) and '_y' (target)
+            suffixes
+        columns (list): Columns of the source file, in output order
+        primary_key (str or list): Column(s) the records were paired on
+        rules (dict): comparison_rules of the columns compared on their typed values instead of their text
+    Returns:
+        DataFrame: Wide result, one row per record, changed cells as 'old -> new'
+        DataFrame: Long result, one row per changed cell with the key column(s), column, old and new value
+        ndarray: True for the records with at least one changed cell
+    """
+    rules = rules or {}
+    keys = key_columns(primary_key)
+    unmatched_columns = {}
+    positions, column_names, old_values, new_values = [], [], [], []
+    changed = np.zeros(len(data_mismatch_records), dtype=bool)
+    raw_records, data_mismatch_records = data_mismatch_records, data_mismatch_records.fillna('')
+
+    for column_name in columns:
+        if column_name in keys:
+            # Key values stay as they are, incremental.py finds the records of a key in the saved outputs by them
+            unmatched_columns[column_name] = raw_records[column_name]
+            continue
+        if column_name + '_x' not in data_mismatch_records:
+            unmatched_columns[column_name] = data_mismatch_records.get(column_name)
+            continue
+        old, new = data_mismatch_records[column_name + '_x'], data_mismatch_records[column_name + '_y']
+        if column_name in rules:
+            mismatch = ~comparison_rules.equal(raw_records[column_name + '_x'], raw_records[column_name + '_y'],
+                                               rules[column_name])
+        else:
+            mismatch = (old != new).to_numpy()
+        changed |= mismatch
+        if not mismatch.any():
+            unmatched_columns[column_name] = old
+            continue
+        changed_old, changed_new = old[mismatch], new[mismatch]
+        values = old.astype(object)
+        values[mismatch] = changed_old.astype(str) + ' -> ' + changed_new.astype(str)
+        unmatched_columns[column_name] = values
+
+        positions.append(np.flatnonzero(mismatch))
+        column_names.append(np.full(mismatch.sum(), column_name, dtype=object))
+        old_values.append(changed_old.to_numpy(dtype=object))
+        new_values.append(changed_new.to_numpy(dtype=object))
+
+    unmatched_data = pd.DataFrame(unmatched_columns, index=data_mismatch_records.index, columns=columns)
+
+    if positions:
+        positions = np.concatenate(positions)
+        # Group the changes per record, columns stay in file order within a record
+        order = np.argsort(positions, kind='stable')
+        positions = positions[order]
+        unmatched_changes = pd.DataFrame({
+            **{key: raw_records[key].to_numpy()[positions] for key in keys},
+            'column': np.concatenate(column_names)[order],
+            'old': np.concatenate(old_values)[order],
+            'new': np.concatenate(new_values)[order],
+        })
+    else:
+        unmatched_changes = pd.DataFrame(columns=[*keys, 'column', 'old', 'new'])
+    return unmatched_data, unmatched_changes, changed
+
+
+def row_hashes(df1, df2):
+    """
+    Hash every row of both frames to one 64-bit value.
+    Columns whose dtype differs between the frames are cast to a common dtype first, so that values a merge
+    would consider equal (e.g. 5 and 5.0) also hash equal. Target columns in another order than the source ones are
+    hashed in the source order, like a merge on every column.
+    Parameters:
+        df1 (DataFrame): Source records
+        df2 (DataFrame): Target records, same columns as df1
+    Returns:
+        Series, Series: uint64 hash per row, indexed like df1 and df2
+    """
+    if not df1.columns.equals(df2.columns) and set(df1.columns) == set(df2.columns):
+        df2 = df2[df1.columns]
+    casts = {}
+    for column_name in df1.columns.intersection(df2.columns):
+        dtype1, dtype2 = df1[column_name].dtype, df2[column_name].dtype
+        if dtype1 != dtype2:
+            casts[column_name] = np.result_type(dtype1, dtype2) if dtype1.kind in 'biuf' and dtype2.kind in 'biuf' \
+                else object
+    # categorize only pays off for columns with many repeated values, keys and names are mostly unique
+    hashes1 = pd.util.hash_pandas_object(df1.astype({k: v for k, v in casts.items() if k in df1}) if casts else df1,
+                                         index=False, categorize=False)
+    hashes2 = pd.util.hash_pandas_object(df2.astype({k: v for k, v in casts.items() if k in df2}) if casts else df2,
+                                         index=False, categorize=False)
+    return hashes1, hashes2
+
+
+def classify_records(df1, df2, mode='hash', hashes=None):
+    """
+    Find the records present with identical values in both files and the records of each file that are not.
+    'merge' joins both frames on every column. 'hash' reduces every row to a 64-bit hash and works on those
+    hashes only, the full rows are sliced out of df1/df2 once at the end.
+    Both modes return the same counts and unmatched records:
+        - every exact copy of a row in the other file is a match (n source x m target copies give n*m matches)
+        - a row is unmatched when it has no exact copy in the other file and is not duplicated in its own file
+    Parameters:
+        df1 (DataFrame): Source records
+        df2 (DataFrame): Target records
+        mode (str): 'hash' or 'merge'
+        hashes (tuple): row_hashes(df1, df2) when the caller already computed them, 'hash' mode only
+    Returns:
+        DataFrame: Matching records ('merge': the merged rows, 'hash': the source rows that have a match)
+        int: Number of matching records
+        DataFrame: Unmatched records of the source
+        DataFrame: Unmatched records of the target
+    """
+    if mode not in COMPARISON_MODES:
+        raise ValueError(f'Unknown comparison mode {mode!r}, expected one of {COMPARISON_MODES}')
+
+    if mode == 'merge':
+        matching_records = pd.merge(df1, df2, on=list(df1.columns), how='inner')
+        unmatching_records_in_source = pd.concat([df1, matching_records]).drop_duplicates(keep=False)
+        unmatching_records_in_target = pd.concat([df2, matching_records]).drop_duplicates(keep=False)
+        return matching_records, len(matching_records), unmatching_records_in_source, unmatching_records_in_target
+
+    hashes1, hashes2 = row_hashes(df1, df2) if hashes is None else hashes
+    in_target = hashes1.isin(hashes2).to_numpy()
+    in_source = hashes2.isin(hashes1).to_numpy()
+    duplicated1 = hashes1.duplicated(keep=False).to_numpy()
+    duplicated2 = hashes2.duplicated(keep=False).to_numpy()
+
+    # Inner merge on all columns pairs every source copy of a row with every target copy
+    if duplicated1[in_target].any() or duplicated2[in_source].any():
+        num_matching_records = int((hashes1[in_target].value_counts() * hashes2[in_source].value_counts()).sum())
+    else:
+        num_matching_records = int(in_target.sum())
+
+    unmatched1 = ~in_target & ~duplicated1
+    unmatched2 = ~in_source & ~duplicated2
+    return df1[in_target], num_matching_records, df1[unmatched1], df2[unmatched2]
+
+
+def split_unmatched_records(unmatching_records_in_source, unmatching_records_in_target, primary_key):
+    """
+    Split the unmatched records into records whose primary_key is only in one file and records whose primary_key
+    is in both files with different values. Only the latter are paired for the column level diff.
+    Records that share a key are paired in file order (the frames are stably sorted on the key): the n-th source
+    record of a key with the n-th target record of that key. The pairs grow linearly with the records, where a
+    merge on the key alone would pair every source record with every target record of a duplicated key. Records
+    left over because one file has more records of a key have no counterpart and count as only present in their
+    file.
+    Parameters:
+        unmatching_records_in_source (DataFrame): Unmatched records of the source
+        unmatching_records_in_target (DataFrame): Unmatched records of the target
+        primary_key (str or list): Key column(s)
+    Returns:
+        DataFrame: Records of the source without a counterpart in the target
+        DataFrame: Records of the target without a counterpart in the source
+        DataFrame: Changed records paired on primary_key, '_x' source and '_y' target suffixes
+    """
+    keys = key_columns(primary_key)
+    codes1, codes2 = key_codes(unmatching_records_in_source, unmatching_records_in_target, primary_key)
+    changed_in_source = codes1.isin(codes2).to_numpy()
+    changed_in_target = codes2.isin(codes1).to_numpy()
+    changed1 = unmatching_records_in_source[changed_in_source]
+    changed2 = unmatching_records_in_target[changed_in_target]
+
+    # Running number of every record within its key, the pairs are the (key, number) both files have
+    changed1 = changed1.assign(**{OCCURRENCE: changed1.groupby(keys, sort=False, dropna=False).cumcount(),
+                                  ROW: np.arange(len(changed1))})
+    changed2 = changed2.assign(**{OCCURRENCE: changed2.groupby(keys, sort=False, dropna=False).cumcount(),
+                                  ROW: np.arange(len(changed2))})
+    data_mismatch_records = pd.merge(changed1, changed2, on=[*keys, OCCURRENCE], how='inner')
+
+    only_in_source, only_in_target = ~changed_in_source, ~changed_in_target
+    only_in_source[np.flatnonzero(changed_in_source)] = ~np.isin(np.arange(len(changed1)),
+                                                                 data_mismatch_records[ROW + '_x'].to_numpy())
+    only_in_target[np.flatnonzero(changed_in_target)] = ~np.isin(np.arange(len(changed2)),
+                                                                 data_mismatch_records[ROW + '_y'].to_numpy())
+    return (unmatching_records_in_source[only_in_source], unmatching_records_in_target[only_in_target],
+            data_mismatch_records.drop(columns=[OCCURRENCE, ROW + '_x', ROW + '_y']))
+
+
+def pair_records(df1, df2, primary_key, positions1, positions2):
+    """
+    Merge the records at positions1 of df1 with the records at positions2 of df2 pair by pair, into the same frame
+    split_unmatched_records builds ('_x' source and '_y' target suffixes).
+    """
+    numbers = np.arange(len(positions1))
+    return pd.merge(df1.iloc[positions1].assign(**{OCCURRENCE: numbers}),
+                    df2.iloc[positions2].assign(**{OCCURRENCE: numbers}),
+                    on=[*key_columns(primary_key), OCCURRENCE], how='inner').drop(columns=OCCURRENCE)
+
+
+def match_hashes(df1, df2, mode='hash', hashes=None, rules=None):
+    """Row hashes the records are matched on, with the rule columns in their normal form; None in 'merge' mode."""
+    if rules:
+        return row_hashes(comparison_rules.normalize_frame(df1, rules), comparison_rules.normalize_frame(df2, rules))
+    if hashes is None and mode == 'hash':
+        return row_hashes(df1, df2)
+    return hashes
+
+
+def classify_with_pandas(df1, df2, primary_key, mode, hashes, codes, rules, run_profile):
+    """
+    Classification engine of pandas (ENGINES): classify_records, then split_unmatched_records.
+    Parameters:
+        df1, df2 (DataFrame): Source and target records sorted on primary_key
+        primary_key (str or list): Key column(s)
+        mode (str): 'hash' or 'merge'
+        hashes (tuple): row_hashes(df1, df2) when the caller already computed them
+        codes (tuple): key_codes(df1, df2, primary_key)
+        rules (dict): Column -> comparison rule, the rule columns are matched in their normal form
+        run_profile (RunProfile): Records the 'match' and 'anti-join' stages
+    Returns:
+        dict: 'hashes' (match_hashes, None in 'merge' mode), 'num_matching_records', 'num_unmatching_records',
+            'matching_columns', 'oracle_only_records', 'datacloud_only_records' and 'data_mismatch_records' (the
+            changed records paired on primary_key, see split_unmatched_records)
+    """
+    with run_profile.stage('match') as stage:
+        stage['rows'] = len(df1) + len(df2)
+        hashes = match_hashes(df1, df2, mode, hashes, rules)
+        matching_records, num_matching_records, unmatching_records_in_source, unmatching_records_in_target = \
+            classify_records(df1, df2, mode, hashes)
+    num_unmatching_records = len(unmatching_records_in_source) + len(unmatching_records_in_target)
+    with run_profile.stage('anti-join') as stage:
+        stage['rows'] = num_unmatching_records
+        oracle_only_records, datacloud_only_records, data_mismatch_records = split_unmatched_records(
+            unmatching_records_in_source, unmatching_records_in_target, primary_key)
+    return {'hashes': hashes, 'num_matching_records': num_matching_records,
+            'num_unmatching_records': num_unmatching_records, 'matching_columns': list(matching_records.columns),
+            'oracle_only_records': oracle_only_records, 'datacloud_only_records': datacloud_only_records,
+            'data_mismatch_records': data_mismatch_records}
+
+
+def classify_with_duckdb(df1, df2, primary_key, mode, hashes, codes, rules, run_profile):
+    """
+    Classification engine of DuckDB (ENGINES): the row hashes and key codes are classified in an in-process
+    database (duckdb_engine.classify), the records are then sliced out of the frames by position. 'hash' mode
+    only. Parameters and result as for classify_with_pandas.
+    """
+    with run_profile.stage('match') as stage:
+        stage['rows'] = len(df1) + len(df2)
+        hashes = match_hashes(df1, df2, mode, hashes, rules)
+        classified = duckdb_engine.classify(*hashes, *codes)
+    with run_profile.stage('anti-join') as stage:
+        stage['rows'] = classified['num_unmatching_records']
+        data_mismatch_records = pair_records(df1, df2, primary_key, classified['pairs_source'],
+                                             classified['pairs_target'])
+    return {'hashes': hashes, 'num_matching_records': classified['num_matching_records'],
+            'num_unmatching_records': classified['num_unmatching_records'], 'matching_columns': list(df1.columns),
+            'oracle_only_records': df1.iloc[classified['only_source']],
+            'datacloud_only_records': df2.iloc[classified['only_target']],
+            'data_mismatch_records': data_mismatch_records}
+
+
+# Engines that classify the records (matched, oracle only, datacloud only, changed pairs): the classify function
+# (classify_with_pandas's signature and result), the modes it supports and, for engines that need an optional
+# package, a check whether it is installed. Every engine gives the same outputs, the column level diff and the
+# file profiles are pandas in all of them.
+ENGINES = {
+    'pandas': {'classify': classify_with_pandas, 'modes': COMPARISON_MODES, 'available': None},
+    'duckdb': {'classify': classify_with_duckdb, 'modes': ('hash',), 'available': duckdb_engine.available},
+}
+
+
+def check_engine(engine, mode='hash'):
+    """Raise when engine is unknown, cannot run in mode or its package is not installed."""
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine!r}, expected one of {tuple(ENGINES)}')
+    if mode not in ENGINES[engine]['modes']:
+        raise ValueError(f'The {engine} engine needs one of the modes {ENGINES[engine]["modes"]}')
+    if ENGINES[engine]['available'] is not None and not ENGINES[engine]['available']():
+        raise ValueError(f'The {engine} engine needs the {engine} package')
+
+
+def profile_frames(df1, df2, primary_key, hashes=None, codes=None):
+    """
+    Profile both frames (profiling.profile_frame), reusing their row hashes for the duplicate counts when given.
+    Parameters:
+        codes (tuple): key_codes(df1, df2, primary_key) when the caller already computed them
+    Returns:
+        FileProfile, FileProfile: Profiles of df1 and df2
+    """
+    codes1, codes2 = key_codes(df1, df2, primary_key) if codes is None else codes
+    # Hashes of columns cast to a common dtype can collide where the original values do not (large integers as
+    # float), only count duplicates on hashes of uncast columns
+    uncast = hashes is not None and all(df1[column_name].dtype == df2[column_name].dtype
+                                        for column_name in df1.columns.intersection(df2.columns))
+    return (profiling.profile_frame(df1, codes1, hashes[0] if uncast else None),
+            profiling.profile_frame(df2, codes2, hashes[1] if uncast else None))
+
+
+def frames_equal(df1, df2, hashes=None):
+    """DataFrame.equals, settled on the row hashes (when given) without comparing every cell if they differ."""
+    return df1.shape == df2.shape and (hashes is None or np.array_equal(hashes[0].to_numpy(),
+                                                                        hashes[1].to_numpy())) and df1.equals(df2)
+
+
+def compare_frames(df1, df2, primary_key, mode='hash', hashes=None, run_profile=None, rules=None, engine='pandas'):
+    """
+    Compare the records of two frames sorted on primary_key and collect the statistics the report is built from.
+    Each frame is profiled once (see profiling.profile_frame); in 'hash' mode the row hashes of the comparison are
+    reused for the duplicate counts and to skip the full DataFrame.equals scan when the frames cannot be equal.
+    With rules, the rule columns are hashed in their normal form (comparison_rules.normalize), so e.g. 100 and
+    100.0 or two spellings of a date match right away. Paired records (split_unmatched_records) that then only
+    differ within the numeric tolerances count as matches too.
+    Parameters:
+        df1 (DataFrame): Oracle source records
+        df2 (DataFrame): Datacloud target records
+        primary_key (str or list): Key column, or the columns of a composite key
+        mode (str): 'hash' or 'merge', see classify_records
+        hashes (tuple): row_hashes(df1, df2) when the caller already computed them
+        run_profile (RunProfile): Records the 'match', 'anti-join', 'column diff' and 'file profiles' stages
+        rules (dict): Column -> comparison rule (comparison_rules.check_rules), 'hash' mode only
+        engine (str): Engine that classifies the records, 'pandas' or 'duckdb' ('hash' mode only), see ENGINES
+    Returns:
+        dict: Counts of the comparison, 'profile_source' and 'profile_target' (profiling.FileProfile) plus the
+            output frames named in OUTPUT_FILES
+    """
+    run_profile = instrumentation.RunProfile() if run_profile is None else run_profile
+    if rules and mode != 'hash':
+        raise ValueError("Comparison rules need the 'hash' mode")
+    comparison_rules.check_columns(rules, df1.columns, df2.columns)
+    check_engine(engine, mode)
+    # Get the number of primary_key which are present/not present in both files; the key codes are computed once
+    # and also give the unique key counts of the profiles (and the keys of the engines)
+    codes = key_codes(df1, df2, primary_key)
+    key_in_target = codes[0].isin(codes[1]).to_numpy()
+
+    classified = ENGINES[engine]['classify'](df1, df2, primary_key, mode, hashes, codes, rules, run_profile)
+    hashes = classified['hashes']
+    num_matching_records = classified['num_matching_records']
+    num_unmatching_records = classified['num_unmatching_records']
+    oracle_only_records = classified['oracle_only_records']
+    datacloud_only_records = classified['datacloud_only_records']
+    data_mismatch_records = classified['data_mismatch_records']
+    with run_profile.stage('column diff') as stage:
+        stage['rows'] = len(data_mismatch_records)
+        # Categorical / pyarrow string columns (schema.py) of the few changed records go back to objects
+        data_mismatch_records = data_mismatch_records.astype(
+            {column_name: object for column_name, dtype in data_mismatch_records.dtypes.items()
+             if isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype))})
+        unmatched_data, unmatched_changes, changed = build_unmatched_data(data_mismatch_records, df1.columns,
+                                                                          primary_key, rules)
+        if rules:
+            tolerated = ~changed
+            num_tolerated = int(tolerated.sum())
+            if num_tolerated:
+                unmatched_data = unmatched_data[~tolerated]
+                num_matching_records += num_tolerated
+                num_unmatching_records -= 2 * num_tolerated
+
+    # Masking the matching records with their own comparison leaves every cell null, so this has always been every
+    # column of the matching records (as soon as there is one), without scanning the frame for it
+    mismatched_columns = classified['matching_columns'] if num_matching_records else []
+
+    with run_profile.stage('file profiles') as stage:
+        stage['rows'] = len(df1) + len(df2)
+        # Hashes of normalized values count records as duplicates that only match under the rules
+        profile_source, profile_target = profile_frames(df1, df2, primary_key, None if rules else hashes, codes)
+        equal = frames_equal(df1, df2, hashes)
+
+    return {
+        'profile_source': profile_source,
+        'profile_target': profile_target,
+        'num_matching_records': num_matching_records,
+        'num_unmatching_records': num_unmatching_records,
+        'num_unmatched_data': len(unmatched_data),
+        'num_oracle_only_records': len(oracle_only_records),
+        'num_datacloud_only_records': len(datacloud_only_records),
+        'num_present_in_both': int(key_in_target.sum()),
+        'num_not_present_in_both': int((~key_in_target).sum()),
+        'mismatched_columns': mismatched_columns,
+        'frames_equal': equal,
+        'unmatched_data': unmatched_data,
+        'unmatched_changes': unmatched_changes,
+        'oracle_only_records': oracle_only_records,
+        'datacloud_only_records': datacloud_only_records,
+    }
+
+
+def write_outputs(result, output_dir, run_profile=None, output_format='csv', max_rows=None, primary_key=None):
+    """
+    Save the output frames of a compare_frames result in output_dir.
+    Parameters:
+        output_format (str): 'csv', 'csv.gz', 'csv.zst' or 'parquet', see output_sinks
+        max_rows (int): Records written per output file, None for all
+        primary_key (str or list): Key the result was compared on, the other unmatched_data columns are written as
+            text to parquet (typed_output_columns)
+    Returns:
+        dict: name -> output_sinks.OutputSink.summary() ('path', 'rows' and 'written')
+    """
+    run_profile = instrumentation.RunProfile() if run_profile is None else run_profile
+    sinks = output_sinks.open_sinks(output_dir, OUTPUT_FILES, output_format, max_rows,
+                                    None if primary_key is None else typed_output_columns(primary_key))
+    for name, sink in sinks.items():
+        with run_profile.stage('output write', file=os.path.basename(sink.path)) as stage, sink:
+            stage['rows'] = len(result[name])
+            sink.write(result[name])
+    return {name: sink.summary() for name, sink in sinks.items()}
@@ -0,0 +1,138 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+RULE_TYPES = ('numeric', 'date', 'string')
+
+# Options of every rule type and their defaults
+RULE_OPTIONS = {
+    'numeric': {'atol': 0.0, 'rtol': 0.0},
+    'date': {'formats': None, 'ignore_time': False},
+    'string': {'strip': True, 'casefold': False},
+}
+
+# Tried in this order for date columns without formats of their own, the first format that parses a value wins
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y%m%d', '%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S']
+
+
+def check_rules(rules):
+    """
+    Validate comparison rules and fill in the defaults.
+    Rules map a column to a dict with a 'type' and its options, e.g.
+        {'REVENUE': {'type': 'numeric', 'atol': 0.5},
+         'FINANCIAL_YEAR': {'type': 'date', 'formats': ['%d-%m-%Y', '%Y-%m-%d']},
+         'BUSINESS_NAME': {'type': 'string', 'casefold': True}}
+    Returns:
+        dict: column -> rule with every option
+    """
+    checked = {}
+    for column_name, rule in (rules or {}).items():
+        rule_type = rule.get('type') if isinstance(rule, dict) else None
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f'Rule of {column_name!r} needs a type, one of {RULE_TYPES}')
+        unknown = rule.keys() - {'type'} - RULE_OPTIONS[rule_type].keys()
+        if unknown:
+            raise ValueError(f'Unknown options for the {rule_type} rule of {column_name!r}: {sorted(unknown)}')
+        checked[column_name] = {'type': rule_type, **RULE_OPTIONS[rule_type], **rule}
+        if rule_type == 'numeric' and (checked[column_name]['atol'] < 0 or checked[column_name]['rtol'] < 0):
+            raise ValueError(f'Tolerances of {column_name!r} must not be negative')
+    return checked
+
+
+def check_columns(rules, source_columns, target_columns):
+    """Raise when a rule names a column that is not in both files, e.g. a typo that would compare exactly."""
+    for file_name, columns in [('source', source_columns), ('target', target_columns)]:
+        unknown = [column_name for column_name in rules or {} if column_name not in columns]
+        if unknown:
+            raise ValueError(f'Rules name columns the {file_name} file does not have: {unknown}')
+
+
+def load_rules(rules_path):
+    """Read comparison rules from a .json or .yaml/.yml file, see check_rules."""
+    with open(rules_path) as rules_file:
+        if os.path.splitext(rules_path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            return check_rules(yaml.safe_load(rules_file))
+        return check_rules(json.load(rules_file))
+
+
+def _text(values):
+    # Nulls stay None, every other value becomes its text
+    return values.astype(object).map(str, na_action='ignore').where(values.notna(), None)
+
+
+def to_numbers(values):
+    """float64 values of a column, NaN for nulls and for values that are not numbers."""
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype(np.float64)
+    return pd.to_numeric(_text(values).str.strip(), errors='coerce').astype(np.float64)
+
+
+def to_dates(values, rule):
+    """datetime64 values of a column parsed with the formats of the rule, NaT where none of them fits."""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        dates = values
+    else:
+        text = _text(values).str.strip()
+        dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        for date_format in rule['formats'] or DATE_FORMATS:
+            missing = (dates.isna() & text.notna()).to_numpy()
+            if not missing.any():
+                break
+            dates[missing] = pd.to_datetime(text[missing], format=date_format, errors='coerce')
+    return dates.dt.normalize() if rule['ignore_time'] else dates
+
+
+def normalize(values, rule):
+    """
+    Normal form of a column under its rule: values the rule considers equal get the same normal form, except
+    for numeric tolerances, which equal() applies on top. Values a numeric or date rule cannot parse keep their
+    text, so they only equal the same text.
+    """
+    if rule['type'] == 'string':
+        text = _text(values)
+        if rule['strip']:
+            text = text.str.strip()
+        if rule['casefold']:
+            text = text.str.casefold()
+        return text
+    parsed = to_numbers(values) if rule['type'] == 'numeric' else to_dates(values, rule)
+    if parsed.notna().sum() == values.notna().sum():
+        return parsed
+    return parsed.astype(object).where(parsed.notna() | values.isna(), _text(values))
+
+
+def normalize_frame(df, rules):
+    """Copy of df with the rule columns in their normal form, for the row hashes."""
+    columns = [column_name for column_name in rules if column_name in df]
+    if not columns:
+        return df
+    return df.assign(**{column_name: normalize(df[column_name], rules[column_name]) for column_name in columns})
+
+
+def equal(old, new, rule):
+    """
+    Compare two aligned columns under a rule, vectorized on the parsed values.
+    Returns:
+        ndarray: True where the values are equal under the rule (both null counts as equal)
+    """
+    old_normal, new_normal = normalize(old, rule), normalize(new, rule)
+    both_null = (old_normal.isna() & new_normal.isna()).to_numpy()
+    same = np.asarray(old_normal.to_numpy() == new_normal.to_numpy(), dtype=bool) | both_null
+    if rule['type'] == 'numeric' and (rule['atol'] or rule['rtol']):
+        same |= np.isclose(to_numbers(old).to_numpy(), to_numbers(new).to_numpy(), rtol=rule['rtol'],
+                           atol=rule['atol'])
+    return same
+
+
+def date_format(record, column_name, rule):
+    """Format of the rule (or DATE_FORMATS) the value of a one row frame parses with, None without one."""
+    if column_name not in record or not len(record) or pd.isna(record[column_name].iloc[0]):
+        return None
+    value = str(record[column_name].iloc[0]).strip()
+    for candidate in rule['formats'] or DATE_FORMATS:
+        if not pd.isna(pd.to_datetime(value, format=candidate, errors='coerce')):
+            return candidate
+    return None
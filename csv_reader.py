@@ -0,0 +1,363 @@
+import codecs
+import contextlib
+import csv
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Byte the multi-character delimiter is translated to before handing the stream to the C engine.
+# 0x1F is the ASCII "unit separator" and does not occur in the extracts we receive.
+SUBSTITUTE_DELIMITER = '\x1f'
+
+# Encodings in which every ASCII character is encoded as the same single byte and never appears inside
+# a multi-byte sequence, so the delimiter can be replaced on the raw bytes without decoding first.
+ASCII_SAFE_ENCODINGS = {'ascii', 'utf_8', 'utf_8_sig', 'latin_1', 'iso8859_1', 'iso8859_2', 'iso8859_9',
+                        'iso8859_15', 'cp1250', 'cp1251', 'cp1252', 'cp1254'}
+
+BLOCK_SIZE = 1 << 20
+
+# Bytes read at a time while looking for the start of the next line
+LINE_SEARCH_SIZE = 64 * 1024
+
+
+class SubstituteDelimiterInData(Exception):
+    """Raised when the substitute delimiter already occurs in the file being translated."""
+
+
+class UndecodableFile(UnicodeError):
+    """
+    Raised when a part of a file does not decode in the encoding it is read with, e.g. a file detected as UTF-8
+    from its first block with a Latin-1 byte further on. Names the file, so a caller that reads several files
+    (possibly in other processes) knows which one to read again in another encoding.
+    """
+
+    def __init__(self, file_path, encoding, reason=''):
+        super().__init__(file_path, encoding, reason)
+        self.file_path, self.encoding = file_path, encoding
+
+    def __str__(self):
+        return f'{self.file_path} is not {self.encoding} throughout: {self.args[2]}'
+
+
+class DelimiterTranslatingReader(io.RawIOBase):
+    """
+    Binary stream that replaces a multi-character delimiter with a single byte while the file is read.
+    Parameters:
+        file_obj: File object opened in binary mode
+        delimiter (bytes): Multi-character delimiter as encoded in the file
+        substitute (bytes): Single byte written in place of every delimiter
+    """
+
+    def __init__(self, file_obj, delimiter, substitute=SUBSTITUTE_DELIMITER.encode('ascii')):
+        super().__init__()
+        self._file = file_obj
+        self._delimiter = delimiter
+        self._substitute = substitute
+        self._carry = b''
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        block = self._file.read(BLOCK_SIZE)
+        if not block:
+            data, self._carry = self._carry, b''
+            return data
+        if self._substitute in block:
+            raise SubstituteDelimiterInData(f'{self._substitute!r} found in data, cannot translate delimiter')
+        data = (self._carry + block).replace(self._delimiter, self._substitute)
+        # Hold back a trailing partial delimiter, it is completed by the start of the next block
+        keep = next((size for size in range(min(len(self._delimiter) - 1, len(data)), 0, -1)
+                     if data.endswith(self._delimiter[:size])), 0)
+        self._carry = data[len(data) - keep:]
+        return data[:len(data) - keep]
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            self._buffer = self._fill()
+            if not self._buffer and not self._carry:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Binary stream of the bytes start to end of a file, e.g. a part of the file from line_ranges.
+    Parameters:
+        file_obj: File object opened in binary mode, it is moved to start
+        start (int): Offset of the first byte
+        end (int): Offset after the last byte
+    """
+
+    def __init__(self, file_obj, start, end):
+        super().__init__()
+        self._file = file_obj
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        size = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= size
+        return size
+
+
+def splits_on_newline(encoding):
+    """Return True if every newline byte of a file in this encoding ends a line, i.e. not UTF-16 or UTF-32."""
+    try:
+        name = codecs.lookup(encoding or 'utf-8').name
+    except LookupError:
+        return False
+    return not name.startswith(('utf-16', 'utf-32'))
+
+
+def _line_start(file_obj, offset):
+    # Offset of the first line that starts at or after offset
+    if offset == 0:
+        return 0
+    file_obj.seek(offset - 1)
+    while True:
+        block = file_obj.read(LINE_SEARCH_SIZE)
+        if not block:
+            return file_obj.tell()
+        newline = block.find(b'\n')
+        if newline >= 0:
+            return file_obj.tell() - len(block) + newline + 1
+
+
+def line_starts(file_path, offsets):
+    """Offset of the first line that starts at or after each of offsets, the file size past the last line."""
+    with open(file_path, 'rb') as file_obj:
+        return [_line_start(file_obj, offset) for offset in offsets]
+
+
+def line_ranges(file_path, num_ranges):
+    """
+    Split a file into byte ranges of about the same size that start at the start of a line, for
+    read_csv(byte_range=...). Only valid when newlines cannot be part of a value (no quoting) and
+    splits_on_newline(encoding).
+    Returns:
+        list: (start, end) offsets in file order, fewer than num_ranges when the file has fewer lines
+    """
+    size = os.path.getsize(file_path)
+    starts = sorted(set(line_starts(file_path, [size * number // num_ranges for number in range(num_ranges)]))
+                    | {size})
+    return [(start, end) for start, end in zip(starts[:-1], starts[1:])]
+
+
+def is_ascii_safe(encoding):
+    """Return True if a delimiter can be replaced on the raw bytes of a file in this encoding."""
+    try:
+        name = codecs.lookup(encoding or 'utf-8').name.replace('-', '_')
+    except LookupError:
+        return False
+    return name in ASCII_SAFE_ENCODINGS
+
+
+def select_engine(delimiter, chunksize=None, prefer_pyarrow=False):
+    """
+    Pick the fastest pandas parser that can handle the delimiter.
+    Parameters:
+        delimiter (str): Literal delimiter of the file (not regex escaped)
+        chunksize (int): Chunk size requested by the caller, the pyarrow engine does not support chunks
+        prefer_pyarrow (bool): Use the multi-threaded pyarrow engine when it is installed
+    Returns:
+        str: 'pyarrow', 'c' or 'python'
+    """
+    if len(delimiter) != 1:
+        return 'python'
+    if prefer_pyarrow and PYARROW_AVAILABLE and chunksize is None:
+        return 'pyarrow'
+    return 'c'
+
+
+def read_csv(file_path, delimiter, encoding, chunksize=None, prefer_pyarrow=False, byte_range=None, **kwargs):
+    """
+    Read a delimited file with the C (or pyarrow) engine wherever possible.
+    Single character delimiters go straight to the C engine. Multi-character delimiters such as '|*|' are
+    translated to a single byte in one pass over the file and then parsed by the C engine as well. The python
+    engine is only used when the translation is not possible (non ASCII-safe encoding or the substitute byte
+    is already part of the data).
+    Parameters:
+        file_path (str): Path of the file, or a file object opened in binary mode (e.g. a streamed S3 object)
+        delimiter (str): Literal delimiter of the file (not regex escaped)
+        encoding (str): Encoding of the file
+        chunksize (int): Return an iterator of DataFrames of this many rows
+        prefer_pyarrow (bool): Use the pyarrow engine for single character delimiters when installed
+        byte_range (tuple): (start, end) offsets of the part of file_path to read, see line_ranges. A range
+            after the header has no header of its own, read it with header=None and the names of the columns.
+    Returns:
+        DataFrame, or an iterator of DataFrames when chunksize is given
+    Raises:
+        UndecodableFile: A part of the file does not decode in encoding (with chunksize, while the chunks are read)
+    """
+    try:
+        if byte_range is None:
+            result = _read_csv(file_path, delimiter, encoding, chunksize, prefer_pyarrow, kwargs)
+        else:
+            result = _read_range(file_path, byte_range, delimiter, encoding, chunksize, kwargs)
+    except UnicodeDecodeError as e:
+        raise UndecodableFile(file_path, encoding, str(e)) from e
+    return result if chunksize is None else _iter_decoded(result, file_path, encoding)
+
+
+def _iter_decoded(chunks, file_path, encoding):
+    # The C parser decodes block by block, so a chunked read only meets a bad byte while the chunks are consumed
+    try:
+        yield from chunks
+    except UnicodeDecodeError as e:
+        raise UndecodableFile(file_path, encoding, str(e)) from e
+
+
+def _read_csv(file_path, delimiter, encoding, chunksize, prefer_pyarrow, kwargs, translate=True):
+    # The regex separator of the python engine treats quote characters as data, keep it that way
+    kwargs.setdefault('quoting', csv.QUOTE_NONE)
+    options = dict(encoding=encoding, on_bad_lines='skip', index_col=False, chunksize=chunksize, **kwargs)
+    # The pyarrow path may read the file twice, which a stream cannot do
+    engine = select_engine(delimiter, chunksize, prefer_pyarrow and isinstance(file_path, (str, os.PathLike)))
+    if engine == 'pyarrow' and not kwargs.keys() - {'quoting'}:
+        return _read_pyarrow(file_path, delimiter, encoding, kwargs['quoting'])
+    if engine != 'python':
+        return pd.read_csv(file_path, sep=delimiter, engine='c', **options)
+
+    if translate and is_ascii_safe(encoding):
+        try:
+            return _read_translated(file_path, delimiter, encoding, options)
+        except SubstituteDelimiterInData:
+            # Part of a stream is consumed by now, it cannot be read again by the python engine
+            if hasattr(file_path, 'read'):
+                raise
+    return pd.read_csv(file_path, sep=re.escape(delimiter), engine='python', **options)
+
+
+@contextlib.contextmanager
+def _open_binary(file_path):
+    # Streams are read where they are, the caller keeps ownership and closes them
+    if hasattr(file_path, 'read'):
+        yield file_path
+    else:
+        with open(file_path, 'rb') as file_obj:
+            yield file_obj
+
+
+def _read_translated(file_path, delimiter, encoding, options):
+    if options.get('chunksize') is not None:
+        return _iter_translated(file_path, delimiter, encoding, options)
+    with _open_binary(file_path) as file_obj:
+        stream = io.BufferedReader(DelimiterTranslatingReader(file_obj, delimiter.encode(encoding or 'utf-8')),
+                                   buffer_size=BLOCK_SIZE)
+        return pd.read_csv(stream, sep=SUBSTITUTE_DELIMITER, engine='c', **options)
+
+
+def _iter_translated(file_path, delimiter, encoding, options):
+    # The substitute byte only shows up while the chunks are consumed, long after read_csv returned the iterator,
+    # so the fallback to the python engine happens here
+    num_rows = 0
+    try:
+        # The file has to stay open while the caller consumes the chunks
+        with _open_binary(file_path) as file_obj:
+            stream = io.BufferedReader(DelimiterTranslatingReader(file_obj, delimiter.encode(encoding or 'utf-8')),
+                                       buffer_size=BLOCK_SIZE)
+            with pd.read_csv(stream, sep=SUBSTITUTE_DELIMITER, engine='c', **options) as reader:
+                for chunk in reader:
+                    num_rows += len(chunk)
+                    yield chunk
+    except SubstituteDelimiterInData:
+        # Part of a stream is consumed by now, it cannot be read again by the python engine
+        if hasattr(file_path, 'read'):
+            raise
+        # Start over with the python engine and skip the rows the caller already has
+        with pd.read_csv(file_path, sep=re.escape(delimiter), engine='python', **options) as reader:
+            yield from _skip_rows(reader, num_rows)
+
+
+def _skip_rows(chunks, num_rows):
+    # Chunks of a second read of a file without its first num_rows rows
+    for chunk in chunks:
+        if num_rows >= len(chunk):
+            num_rows -= len(chunk)
+            continue
+        yield chunk.iloc[num_rows:]
+        num_rows = 0
+
+
+@contextlib.contextmanager
+def _open_range(file_path, byte_range):
+    with open(file_path, 'rb') as file_obj:
+        yield io.BufferedReader(RangeReader(file_obj, *byte_range), buffer_size=BLOCK_SIZE)
+
+
+def _read_range(file_path, byte_range, delimiter, encoding, chunksize, kwargs):
+    # The range is a stream, which the translation cannot hand to the python engine; unlike a stream of the caller
+    # it can be opened again though, so the python engine gets a fresh one
+    if chunksize is not None:
+        return _iter_range(file_path, byte_range, delimiter, encoding, chunksize, kwargs)
+    try:
+        with _open_range(file_path, byte_range) as stream:
+            return _read_csv(stream, delimiter, encoding, None, False, kwargs)
+    except SubstituteDelimiterInData:
+        with _open_range(file_path, byte_range) as stream:
+            return _read_csv(stream, delimiter, encoding, None, False, kwargs, translate=False)
+
+
+def _iter_range(file_path, byte_range, delimiter, encoding, chunksize, kwargs):
+    num_rows = 0
+    try:
+        with _open_range(file_path, byte_range) as stream:
+            for chunk in _read_csv(stream, delimiter, encoding, chunksize, False, kwargs):
+                num_rows += len(chunk)
+                yield chunk
+    except SubstituteDelimiterInData:
+        with _open_range(file_path, byte_range) as stream:
+            yield from _skip_rows(_read_csv(stream, delimiter, encoding, chunksize, False, kwargs, translate=False),
+                                  num_rows)
+
+
+def _read_pyarrow(file_path, delimiter, encoding, quoting=csv.QUOTE_NONE):
+    # pandas' own pyarrow engine cannot switch quoting off, so the reader is driven directly and the result is
+    # brought back to what the C engine returns for the same file
+    read_options = pa_csv.ReadOptions(encoding=encoding or 'utf8', block_size=BLOCK_SIZE * 16)
+    parse_options = pa_csv.ParseOptions(delimiter=delimiter, quote_char=False if quoting == csv.QUOTE_NONE else '"',
+                                        invalid_row_handler=lambda row: 'skip')
+    convert_options = pa_csv.ConvertOptions(null_values=sorted(STR_NA_VALUES), strings_can_be_null=True)
+    table = pa_csv.read_csv(file_path, read_options, parse_options, convert_options)
+
+    # The C engine never parses dates on its own, read those columns again as plain text
+    temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal:
+        convert_options.column_types = {name: pa.string() for name in temporal}
+        table = pa_csv.read_csv(file_path, read_options, parse_options, convert_options)
+
+    return table_to_pandas(table)
+
+
+def table_to_pandas(table):
+    """Convert a pyarrow table to the DataFrame the C engine returns for the same data (NaN for nulls)."""
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_null(field.type):
+            # The C engine returns all-empty columns as float NaN, or as object when there are no rows at all
+            df[field.name] = df[field.name].astype('float64' if table.num_rows else object)
+        elif df[field.name].dtype == object and df[field.name].isna().any():
+            df[field.name] = df[field.name].where(df[field.name].notna(), np.nan)
+    return df
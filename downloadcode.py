@@ -1,20 +1,225 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+import csv_reader
+import sniffing
+
+S3_URL_PREFIX = 's3://'
+
+PART_SIZE = 8 * 1024 ** 2  # Bytes per ranged GET
+PARTS_IN_FLIGHT = 8  # Concurrent ranged GETs per object
+OBJECTS_IN_FLIGHT = 4  # Objects downloaded at the same time
+# Every ranged GET in flight needs its own connection from the shared pool
+MAX_POOL_CONNECTIONS = PARTS_IN_FLIGHT * OBJECTS_IN_FLIGHT
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the S3 client shared by all downloads.
+    boto3 clients are thread-safe, sharing one keeps its connection pool (and TLS sessions) warm instead of setting
+    up a new client and new connections for every file. It is created on first use, so it picks up the
+    credentials and endpoint (or a moto mock) active at that time.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = boto3.client('s3', config=Config(max_pool_connections=MAX_POOL_CONNECTIONS,
+                                                       retries={'max_attempts': 5, 'mode': 'adaptive'}))
+        return _client
+
+
+def reset_client():
+    """Forget the shared client, the next download creates a new one (e.g. after switching credentials)."""
+    global _client
+    with _client_lock:
+        _client = None
+
 
-def download_s3_file(bucket_name, s3_key, local_path):
+def split_s3_url(url):
+    """Bucket name and key of an 's3://bucket/key' url."""
+    bucket_name, _, s3_key = url[len(S3_URL_PREFIX):].partition('/')
+    return bucket_name, s3_key
+
+
+def _throughput(s3_key, num_bytes, seconds):
+    return {'s3_key': s3_key, 'bytes': num_bytes, 'seconds': seconds,
+            'mb_per_second': num_bytes / 1024 ** 2 / seconds if seconds else 0.0}
+
+
+def download_s3_file(bucket_name, s3_key, local_path, client=None, part_size=PART_SIZE,
+                     max_concurrency=PARTS_IN_FLIGHT):
     """
     Download a file from Amazon S3 to the local machine.
+    Objects larger than part_size are fetched with concurrent ranged GETs of part_size bytes.
 
     Parameters:
         bucket_name (str): The name of the S3 bucket.
         s3_key (str): The key of the file within the bucket.
         local_path (str): The local path where the file will be saved.
+        client: S3 client to use, defaults to the shared client
+        part_size (int): Bytes per ranged GET
+        max_concurrency (int): Ranged GETs in flight for this object
+    Returns:
+        dict: 's3_key', 'bytes', 'seconds' and 'mb_per_second', None when the download failed
     """
-    s3 = boto3.client('s3')
+    s3 = client or get_client()
+    transfer_config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                     max_concurrency=max_concurrency, use_threads=max_concurrency > 1)
+    started = time.perf_counter()
     try:
-        s3.download_file(bucket_name, s3_key, local_path)
-        print(f"File downloaded successfully: {local_path}")
+        s3.download_file(bucket_name, s3_key, local_path, Config=transfer_config)
     except Exception as e:
         print(f"Error downloading file: {e}")
+        return None
+    stats = _throughput(s3_key, os.path.getsize(local_path), time.perf_counter() - started)
+    print(f"File downloaded successfully: {local_path} "
+          f"({stats['bytes'] / 1024 ** 2:.1f} MB in {stats['seconds']:.2f}s, {stats['mb_per_second']:.1f} MB/s)")
+    return stats
+
+
+def download_files(s3_links, client=None, max_objects=OBJECTS_IN_FLIGHT, part_size=PART_SIZE,
+                   max_concurrency=PARTS_IN_FLIGHT):
+    """
+    Download several objects at the same time, each one with concurrent ranged GETs.
+    Parameters:
+        s3_links (list): dicts with 'bucket_name', 's3_key' and 'local_path'
+        client: S3 client to use, defaults to the shared client
+        max_objects (int): Objects in flight
+        part_size (int): Bytes per ranged GET
+        max_concurrency (int): Ranged GETs in flight per object
+    Returns:
+        list: download_s3_file result of every link, in the order of s3_links
+    """
+    s3 = client or get_client()
+    with ThreadPoolExecutor(max_workers=max_objects) as executor:
+        return list(executor.map(lambda link: download_s3_file(link['bucket_name'], link['s3_key'],
+                                                                link['local_path'], s3, part_size, max_concurrency),
+                                 s3_links))
+
+
+class S3ObjectReader(io.RawIOBase):
+    """
+    Binary stream over an S3 object that keeps several ranged GETs in flight ahead of the reader.
+    Parts are returned in order, so the stream can be handed to pandas / csv_reader.read_csv as if it was a local
+    file and parsing starts as soon as the first part arrives.
+    Parameters:
+        bucket_name (str): The name of the S3 bucket
+        s3_key (str): The key of the object within the bucket
+        client: S3 client to use, defaults to the shared client
+        part_size (int): Bytes per ranged GET
+        parts_in_flight (int): Parts fetched ahead of the reader
+    """
+
+    def __init__(self, bucket_name, s3_key, client=None, part_size=PART_SIZE, parts_in_flight=PARTS_IN_FLIGHT):
+        super().__init__()
+        self._client = client or get_client()
+        self._bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.size = self._client.head_object(Bucket=bucket_name, Key=s3_key)['ContentLength']
+        self._part_size = part_size
+        self._parts_in_flight = parts_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=parts_in_flight)
+        self._pending = []
+        self._next_offset = 0
+        self._buffer = memoryview(b'')
+        self.bytes_read = 0
+        self._started = time.perf_counter()
+        self._schedule()
+
+    def readable(self):
+        return True
+
+    def _get_range(self, start, end):
+        response = self._client.get_object(Bucket=self._bucket_name, Key=self.s3_key, Range=f'bytes={start}-{end}')
+        return response['Body'].read()
+
+    def _schedule(self):
+        while len(self._pending) < self._parts_in_flight and self._next_offset < self.size:
+            end = min(self._next_offset + self._part_size, self.size) - 1
+            self._pending.append(self._executor.submit(self._get_range, self._next_offset, end))
+            self._next_offset = end + 1
+
+    def readinto(self, buffer):
+        if not self._buffer:
+            if not self._pending:
+                return 0
+            self._buffer = memoryview(self._pending.pop(0).result())
+            self._schedule()
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.bytes_read += size
+        return size
+
+    def throughput(self):
+        """Bytes read so far, seconds since the stream was opened and MB/s."""
+        return _throughput(self.s3_key, self.bytes_read, time.perf_counter() - self._started)
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._pending = []
+        super().close()
+
+
+def open_s3_stream(bucket_name, s3_key, client=None, part_size=PART_SIZE, parts_in_flight=PARTS_IN_FLIGHT):
+    """Open an S3 object as a buffered binary stream, see S3ObjectReader."""
+    return io.BufferedReader(S3ObjectReader(bucket_name, s3_key, client, part_size, parts_in_flight),
+                             buffer_size=csv_reader.BLOCK_SIZE)
+
+
+def read_s3_csv(bucket_name, s3_key, delimiter, encoding, client=None, part_size=PART_SIZE,
+                parts_in_flight=PARTS_IN_FLIGHT, **kwargs):
+    """
+    Parse an S3 object with csv_reader.read_csv straight from the ranged GETs, without a local copy.
+    Parameters:
+        bucket_name (str): The name of the S3 bucket
+        s3_key (str): The key of the object within the bucket
+        delimiter (str): Literal delimiter of the file
+        encoding (str): Encoding of the file
+        client: S3 client to use, defaults to the shared client
+        part_size (int): Bytes per ranged GET
+        parts_in_flight (int): Parts fetched ahead of the parser
+        **kwargs: Passed on to csv_reader.read_csv (chunksize is not supported, the stream is closed on return)
+    Returns:
+        DataFrame: Parsed records
+        dict: Throughput of the object ('s3_key', 'bytes', 'seconds', 'mb_per_second')
+    """
+    with open_s3_stream(bucket_name, s3_key, client, part_size, parts_in_flight) as stream:
+        df = csv_reader.read_csv(stream, delimiter, encoding, **kwargs)
+        return df, stream.raw.throughput()
+
+
+def read_s3_sample(bucket_name, s3_key, client=None, block_size=sniffing.SAMPLE_BLOCK_SIZE):
+    """Sample of an S3 object for the format detection (sniffing.sample_blocks), three ranged GETs at most."""
+    s3 = client or get_client()
+    size = s3.head_object(Bucket=bucket_name, Key=s3_key)['ContentLength']
+
+    def read_block(offset, length):
+        if not length:
+            return b''
+        return s3.get_object(Bucket=bucket_name, Key=s3_key,
+                             Range=f'bytes={offset}-{offset + length - 1}')['Body'].read()
+
+    return sniffing.sample_blocks(read_block, size, block_size)
+
+
+def sniff_s3_file(bucket_name, s3_key, encodings=sniffing.ENCODINGS, client=None):
+    """Detect the format of an S3 object like sniffing.sniff_file does for a local file."""
+    return sniffing.sniff_sample(read_s3_sample(bucket_name, s3_key, client), encodings)
+
 
 def main():
     # Add your S3 file download links here
@@ -32,8 +237,12 @@ def main():
         # Add more files if needed
     ]
 
-    for link in s3_links:
-        download_s3_file(link['bucket_name'], link['s3_key'], link['local_path'])
+    started = time.perf_counter()
+    results = download_files(s3_links)
+    num_bytes = sum(stats['bytes'] for stats in results if stats)
+    seconds = time.perf_counter() - started
+    print(f"Downloaded {sum(1 for stats in results if stats)}/{len(s3_links)} files, "
+          f"{num_bytes / 1024 ** 2:.1f} MB in {seconds:.2f}s ({num_bytes / 1024 ** 2 / seconds:.1f} MB/s)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+import importlib.util
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# DuckDB spills to disk above this much memory (e.g. '4GB'), None keeps its default of 80% of the RAM
+MEMORY_LIMIT = None
+
+# Threads of every DuckDB query, None uses all cores
+THREADS = None
+
+# Classification of the records of both files, the same rules as comparison.classify_records and
+# comparison.split_unmatched_records: a record is unmatched when its row hash is not in the other file and not
+# duplicated in its own one, unmatched records whose key is in both files are paired in file order per key
+CLASSIFY_SQL = """
+CREATE TEMP TABLE counts_source AS SELECT hash, count(*) AS n FROM source_rows GROUP BY hash;
+CREATE TEMP TABLE counts_target AS SELECT hash, count(*) AS n FROM target_rows GROUP BY hash;
+CREATE TEMP TABLE unmatched_source AS
+    SELECT row, key FROM source_rows JOIN counts_source USING (hash)
+    WHERE n = 1 AND hash NOT IN (SELECT hash FROM counts_target);
+CREATE TEMP TABLE unmatched_target AS
+    SELECT row, key FROM target_rows JOIN counts_target USING (hash)
+    WHERE n = 1 AND hash NOT IN (SELECT hash FROM counts_source);
+CREATE TEMP TABLE pairs AS
+    WITH changed_source AS (
+        SELECT row, key, row_number() OVER (PARTITION BY key ORDER BY row) AS occurrence
+        FROM unmatched_source SEMI JOIN unmatched_target USING (key)),
+    changed_target AS (
+        SELECT row, key, row_number() OVER (PARTITION BY key ORDER BY row) AS occurrence
+        FROM unmatched_target SEMI JOIN unmatched_source USING (key))
+    SELECT changed_source.row AS row_source, changed_target.row AS row_target
+    FROM changed_source JOIN changed_target USING (key, occurrence);
+"""
+
+
+def available():
+    """Whether the duckdb package is installed, without importing it."""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def connect(spill_dir):
+    """In-process DuckDB database that spills to spill_dir, duckdb is only imported here."""
+    import duckdb
+    config = {'temp_directory': spill_dir}
+    if MEMORY_LIMIT is not None:
+        config['memory_limit'] = MEMORY_LIMIT
+    if THREADS is not None:
+        config['threads'] = THREADS
+    return duckdb.connect(config=config)
+
+
+def key_numbers(codes1, codes2):
+    """Number the keys of both files (comparison.key_codes) so that equal keys, nulls included, get one number."""
+    numbers, _ = pd.factorize(pd.concat([codes1, codes2], ignore_index=True), use_na_sentinel=False)
+    return numbers[:len(codes1)], numbers[len(codes1):]
+
+
+def classify(hashes1, hashes2, codes1, codes2, spill_dir=None):
+    """
+    Classify the records of both files in DuckDB, multi-threaded and spilling to disk when the hash tables do not
+    fit in memory. Only the row number, row hash and key number of every record go into the database, the records
+    themselves stay in the frames; positions come back sorted, so slicing the frames with them keeps the key order.
+    Parameters:
+        hashes1, hashes2 (Series): comparison.row_hashes of both files
+        codes1, codes2 (Series): comparison.key_codes of both files
+        spill_dir (str): Directory for the spill files, defaults to the system temp directory
+    Returns:
+        dict: 'num_matching_records', 'num_unmatching_records', 'only_source' and 'only_target' (positions of the
+            records without a counterpart) and 'pairs_source' / 'pairs_target' (positions of the paired records,
+            in source order)
+    """
+    keys1, keys2 = key_numbers(codes1, codes2)
+    with tempfile.TemporaryDirectory(prefix='data_comparison_duckdb_', dir=spill_dir) as work_dir:
+        connection = connect(work_dir)
+        try:
+            connection.register('source_rows', pd.DataFrame({'row': np.arange(len(hashes1)),
+                                                             'hash': hashes1.to_numpy(), 'key': keys1}))
+            connection.register('target_rows', pd.DataFrame({'row': np.arange(len(hashes2)),
+                                                             'hash': hashes2.to_numpy(), 'key': keys2}))
+            connection.execute(CLASSIFY_SQL)
+            # n source and m target copies of a row give n*m matches, like an inner merge on every column
+            num_matching_records, = connection.execute(
+                'SELECT coalesce(sum(s.n * t.n), 0) FROM counts_source s JOIN counts_target t USING (hash)').fetchone()
+            num_unmatching_records, = connection.execute(
+                'SELECT (SELECT count(*) FROM unmatched_source) + (SELECT count(*) FROM unmatched_target)').fetchone()
+            pairs = connection.execute('SELECT row_source, row_target FROM pairs ORDER BY row_source').fetchnumpy()
+            only_source = connection.execute(
+                'SELECT row FROM unmatched_source WHERE row NOT IN (SELECT row_source FROM pairs) ORDER BY row'
+            ).fetchnumpy()['row']
+            only_target = connection.execute(
+                'SELECT row FROM unmatched_target WHERE row NOT IN (SELECT row_target FROM pairs) ORDER BY row'
+            ).fetchnumpy()['row']
+        finally:
+            connection.close()
+    return {'num_matching_records': int(num_matching_records), 'num_unmatching_records': int(num_unmatching_records),
+            'only_source': np.asarray(only_source, dtype=np.int64),
+            'only_target': np.asarray(only_target, dtype=np.int64),
+            'pairs_source': np.asarray(pairs['row_source'], dtype=np.int64),
+            'pairs_target': np.asarray(pairs['row_target'], dtype=np.int64)}
@@ -0,0 +1,168 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import comparison
+
+STATE_FILE = 'delta_index.pkl'
+
+# Bumped whenever the state layout or the row hashes change, older states then trigger a full comparison
+STATE_VERSION = 3
+
+# Column of the key codes in a row index
+KEY = 'key'
+
+
+def row_index(codes, hashes):
+    """Compact index of a file: one (key code, 64-bit row hash) pair per record, see comparison.key_codes."""
+    return pd.DataFrame({KEY: codes.to_numpy(), 'hash': hashes.to_numpy()})
+
+
+def output_key_codes(output, df1, df2, primary_key):
+    """
+    comparison.key_codes of the records of a saved output frame, equal to the codes the same key gets in df1 and
+    df2: the key columns go back to the dtypes both files have in common (the changed records are compared as
+    objects) and are hashed like the files themselves.
+    """
+    columns = comparison.key_columns(primary_key)
+    common = pd.concat([df1[columns].iloc[:0], df2[columns].iloc[:0]])
+    codes, _ = comparison.key_codes(output[columns].astype(common.dtypes.to_dict()), common, primary_key)
+    return codes
+
+
+def changed_keys(previous, current):
+    """
+    Return the keys whose records were added, removed or changed between two row indexes of the same file.
+    Records are compared as (key, occurrence, hash), occurrence being the position of the record within its key:
+    a record that is duplicated once more or once less, or records of a key that swapped places (which pairs them
+    differently, see comparison.split_unmatched_records), also mark their key as changed.
+    """
+    def numbered(index):
+        return index.assign(occurrence=index.groupby(KEY, dropna=False, sort=False).cumcount())
+
+    merged = numbered(previous).merge(numbered(current), how='outer', on=[KEY, 'hash', 'occurrence'],
+                                      indicator=True)
+    return merged.loc[merged['_merge'] != 'both', KEY].unique()
+
+
+def count_records(keys1, hashes1, keys2, hashes2):
+    """
+    Compute the counts of comparison.compare_frames from the keys and row hashes of the records alone.
+    Used for the keys that did not change since the previous run, their output records are reused as they are.
+    Returns:
+        dict: 'num_matching_records', 'num_unmatching_records', 'num_unmatched_data', 'num_oracle_only_records',
+            'num_datacloud_only_records', 'num_present_in_both' and 'num_not_present_in_both'
+    """
+    in_target = hashes1.isin(hashes2).to_numpy()
+    in_source = hashes2.isin(hashes1).to_numpy()
+    duplicated1 = hashes1.duplicated(keep=False).to_numpy()
+    duplicated2 = hashes2.duplicated(keep=False).to_numpy()
+    if duplicated1[in_target].any() or duplicated2[in_source].any():
+        num_matching_records = int((hashes1[in_target].value_counts() * hashes2[in_source].value_counts()).sum())
+    else:
+        num_matching_records = int(in_target.sum())
+
+    unmatched_keys1 = keys1[~in_target & ~duplicated1]
+    unmatched_keys2 = keys2[~in_source & ~duplicated2]
+    # Changed records are paired per key (comparison.split_unmatched_records), n source and m target records with
+    # a key give min(n, m) pairs and the rest has no counterpart
+    key_counts = pd.concat([unmatched_keys1.value_counts(dropna=False), unmatched_keys2.value_counts(dropna=False)],
+                           axis=1)
+    num_unmatched_data = int(key_counts.fillna(0).min(axis=1).sum())
+    key_in_target = keys1.isin(keys2).to_numpy()
+    return {
+        'num_matching_records': num_matching_records,
+        'num_unmatching_records': len(unmatched_keys1) + len(unmatched_keys2),
+        'num_unmatched_data': num_unmatched_data,
+        'num_oracle_only_records': len(unmatched_keys1) - num_unmatched_data,
+        'num_datacloud_only_records': len(unmatched_keys2) - num_unmatched_data,
+        'num_present_in_both': int(key_in_target.sum()),
+        'num_not_present_in_both': int((~key_in_target).sum()),
+    }
+
+
+def load_state(index_dir):
+    """Return the state saved by the previous run in index_dir, None when there is none."""
+    state_path = os.path.join(index_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+    state = pd.read_pickle(state_path)
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def store_state(index_dir, state):
+    """Save the state atomically, an interrupted run leaves the previous state in place."""
+    os.makedirs(index_dir, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=index_dir, suffix='.tmp')
+    os.close(file_descriptor)
+    try:
+        pd.to_pickle({**state, 'version': STATE_VERSION}, temp_path)
+        os.replace(temp_path, os.path.join(index_dir, STATE_FILE))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def compare_incremental(df1, df2, primary_key, index_dir, mode='hash', run_profile=None, engine='pandas'):
+    """
+    Compare two frames sorted on primary_key, redoing only the keys that changed since the previous run.
+    index_dir keeps a row hash index of both files and the output records of the previous run. Keys whose records
+    have the same hashes in both files as last time keep their previous outcome: their counts come from the hashes
+    (count_records) and their output records from the previous run. Only the records of added, removed or changed
+    keys go through comparison.compare_frames, so the comparison itself scales with the churn instead of the file
+    size. Without a usable index (first run, other key, mode, columns or dtypes) everything is compared.
+    Parameters:
+        df1 (DataFrame): Oracle source records
+        df2 (DataFrame): Datacloud target records
+        primary_key (str or list): Key column(s)
+        index_dir (str): Directory of the index, one per file pair
+        mode (str): 'hash' or 'merge', see comparison.classify_records
+        run_profile (RunProfile): Records the stages of comparison.compare_frames
+        engine (str): Engine of comparison.compare_frames, the outputs do not depend on it
+    Returns:
+        dict: Same as comparison.compare_frames
+        dict: 'num_changed_keys', 'num_keys' and 'full' (True when everything was compared)
+    """
+    hashes1, hashes2 = comparison.row_hashes(df1, df2)
+    signature = {'primary_key': primary_key, 'mode': mode, 'columns_source': list(df1.columns),
+                 'columns_target': list(df2.columns), 'dtypes_source': [str(dtype) for dtype in df1.dtypes],
+                 'dtypes_target': [str(dtype) for dtype in df2.dtypes]}
+    codes1, codes2 = comparison.key_codes(df1, df2, primary_key)
+    index1, index2 = row_index(codes1, hashes1), row_index(codes2, hashes2)
+    num_keys = len(pd.concat([index1[KEY], index2[KEY]]).unique())
+    state = load_state(index_dir)
+
+    if state is None or state['signature'] != signature:
+        result = comparison.compare_frames(df1, df2, primary_key, mode, (hashes1, hashes2), run_profile,
+                                           engine=engine)
+        delta = {'num_changed_keys': num_keys, 'num_keys': num_keys, 'full': True}
+    else:
+        changed = np.concatenate([changed_keys(state['index_source'], index1),
+                                  changed_keys(state['index_target'], index2)])
+        changed1 = codes1.isin(changed).to_numpy()
+        changed2 = codes2.isin(changed).to_numpy()
+        result = comparison.compare_frames(df1[changed1], df2[changed2], primary_key, mode,
+                                           run_profile=run_profile, engine=engine)
+
+        unchanged = count_records(codes1[~changed1], hashes1[~changed1], codes2[~changed2], hashes2[~changed2])
+        for name, count in unchanged.items():
+            result[name] += count
+        # A key and all of its records are either changed or not, so both parts hold whole keys; sorting the
+        # concatenation on the key gives the order of a full comparison
+        for name in comparison.OUTPUT_FILES:
+            previous = state['outputs'][name]
+            previous = previous[~output_key_codes(previous, df1, df2, primary_key).isin(changed).to_numpy()]
+            result[name] = pd.concat([previous, result[name]]).sort_values(by=primary_key, kind='stable')
+
+        # Per-file statistics and the overall comparison always cover the whole files
+        result['profile_source'], result['profile_target'] = comparison.profile_frames(df1, df2, primary_key,
+                                                                                       (hashes1, hashes2))
+        result['mismatched_columns'] = list(df1.columns) if result['num_matching_records'] else []
+        result['frames_equal'] = comparison.frames_equal(df1, df2, (hashes1, hashes2))
+        delta = {'num_changed_keys': len(pd.unique(changed)), 'num_keys': num_keys, 'full': False}
+
+    store_state(index_dir, {'signature': signature, 'index_source': index1, 'index_target': index2,
+                            'outputs': {name: result[name] for name in comparison.OUTPUT_FILES}})
+    return result, delta
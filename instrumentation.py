@@ -0,0 +1,178 @@
+import cProfile
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_FILE = 'run_profile.json'
+CPROFILE_FILE = 'run_profile.prof'
+
+# Optional, more expensive modes on top of the stage records
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+
+def current_rss():
+    """Resident set size of this process in bytes, None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _max_rss(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_rss():
+    """Highest resident set size of this process so far in bytes, None where it cannot be read."""
+    if resource is not None:
+        return _max_rss(resource.RUSAGE_SELF)
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss)
+    return None
+
+
+def peak_children_rss():
+    """
+    Highest resident set size of any finished child process (e.g. the out-of-core workers, once their pool is shut
+    down) in bytes, None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    return _max_rss(resource.RUSAGE_CHILDREN)
+
+
+def children_cpu_time():
+    """CPU seconds of the finished child processes, None where it cannot be read."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RunProfile:
+    """
+    Wall time, CPU time, memory and row counts of every stage of a comparison run.
+    Each stage() adds one record:
+        - 'stage': name of the stage, plus any attributes given (e.g. 'file')
+        - 'rows': rows the stage worked on, set by the caller where it means something
+        - 'wall_seconds' and 'cpu_seconds': CPU time of the whole process, so stages running in parallel threads
+          (the ingestion of both files) each count the CPU time of both
+        - 'rss_bytes': resident set size at the end of the stage
+        - 'peak_rss_bytes': peak resident set size of the process at the end of the stage and
+          'peak_rss_growth_bytes' how much the stage raised it, the stage that sets the peak of the run stands out
+        - 'children_cpu_seconds' and 'peak_children_rss_bytes': CPU time and peak resident set size of the child
+          processes that finished during the stage (the out-of-core workers), not part of the figures above
+        - 'traced_peak_bytes': peak of the Python allocations during the stage, tracemalloc mode only
+    Parameters:
+        mode (str): None, 'cprofile' (profile every function call of the thread that started the run) or
+            'tracemalloc' (trace the Python allocations of every stage, slows the run down considerably)
+    """
+
+    def __init__(self, mode=None):
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}')
+        self.mode = mode
+        self.stages = []
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._children_cpu_started = children_cpu_time()
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    def start(self):
+        """Start the optional cProfile / tracemalloc mode."""
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        """Record the stage run inside the with block, the yielded record takes the 'rows' of the stage."""
+        record = {'stage': name, **attributes, 'rows': None}
+        if self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        peak_before = peak_rss()
+        started, cpu_started, children_cpu_started = time.perf_counter(), time.process_time(), children_cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - started
+            record['cpu_seconds'] = time.process_time() - cpu_started
+            record['rss_bytes'] = current_rss()
+            record['peak_rss_bytes'] = peak_rss()
+            if peak_before is not None and record['peak_rss_bytes'] is not None:
+                record['peak_rss_growth_bytes'] = record['peak_rss_bytes'] - peak_before
+            if children_cpu_started is not None:
+                record['children_cpu_seconds'] = children_cpu_time() - children_cpu_started
+                record['peak_children_rss_bytes'] = peak_children_rss()
+            if self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+                record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                self.stages.append(record)
+
+    def merge(self, other, **attributes):
+        """Add the stages of another profile (e.g. the ingestion of one file), with extra attributes."""
+        with self._lock:
+            self.stages.extend({'stage': record['stage'], **attributes, **record} for record in other.stages)
+
+    def timings(self):
+        """Wall seconds per stage name, stages that ran more than once are summed."""
+        timings = {}
+        for record in self.stages:
+            timings[record['stage']] = timings.get(record['stage'], 0) + record['wall_seconds']
+        return timings
+
+    def write(self, output_dir, **summary):
+        """
+        Stop the optional mode and write the profile to output_dir/run_profile.json, the cProfile statistics go to
+        output_dir/run_profile.prof (open them with pstats or snakeviz).
+        Parameters:
+            output_dir (str): Directory of the run, next to output.txt
+            **summary: Extra top level entries, e.g. the compared files
+        Returns:
+            str: Path of the JSON profile
+        """
+        profile = {'started_at': self.started_at, **summary, 'profile_mode': self.mode,
+                   'total_wall_seconds': time.perf_counter() - self._started,
+                   'total_cpu_seconds': time.process_time() - self._cpu_started, 'peak_rss_bytes': peak_rss(),
+                   'total_children_cpu_seconds': (None if self._children_cpu_started is None
+                                                  else children_cpu_time() - self._children_cpu_started),
+                   'peak_children_rss_bytes': peak_children_rss(),
+                   'stages': self.stages}
+        if self._profiler is not None:
+            self._profiler.disable()
+            profile['cprofile_path'] = os.path.join(output_dir, CPROFILE_FILE)
+            self._profiler.dump_stats(profile['cprofile_path'])
+            self._profiler = None
+        if self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        profile_path = os.path.join(output_dir, PROFILE_FILE)
+        with open(profile_path, 'w') as profile_file:
+            json.dump(profile, profile_file, indent=2, default=str)
+        return profile_path
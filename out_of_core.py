@@ -0,0 +1,338 @@
+import functools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+import comparison
+import comparison_rules
+import csv_reader
+import output_sinks
+import profiling
+
+# Blocks spread over a file whose keys place the bucket boundaries, files up to SAMPLE_BLOCKS blocks are sampled
+# completely. The keys are parsed from the blocks alone, there is no pass over the whole file for them.
+SAMPLE_BLOCKS = 64
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+# Buckets per worker process, smaller buckets even out skewed key ranges between the workers
+BUCKETS_PER_WORKER = 4
+
+# Smallest byte range a file is split into for the worker processes, every range starts its own chunks (and their
+# dtype inference), smaller files are partitioned in one piece
+MIN_RANGE_SIZE = 32 * 1024 ** 2
+
+
+def compare_files(source, target, primary_key, output_dir, chunk_size, mode='hash', spill_dir=None, workers=1,
+                  output_format='csv', max_output_rows=None, rules=None, engine='pandas'):
+    """
+    Compare two files that do not fit in memory.
+    Both files are read in chunks of chunk_size rows and range partitioned on primary_key into on-disk buckets
+    (a sample sort: the bucket boundaries come from the keys of sample blocks of both files). Bucket i of the source
+    is then compared with bucket i of the target, so at most one bucket of each file is in memory. Since the
+    buckets cover consecutive key ranges, writing the bucket outputs one after the other gives the same files as
+    sorting and comparing the complete files in memory. Each bucket's output records go to the output files
+    (output_sinks) as soon as the bucket and all buckets before it are compared.
+    With more than one worker every step runs in the worker processes: each file is split into line aligned byte
+    ranges that are read and partitioned in parallel, the buckets are compared in parallel and their output
+    records are converted to csv text (or Arrow) there, this process only appends them to the output files.
+    Parameters:
+        source (tuple): (file_path, delimiter, encoding, read_options) of the Oracle source, read_options are the
+            keyword arguments for csv_reader.read_csv of its detected format (sniffing.read_options)
+        target (tuple): (file_path, delimiter, encoding, read_options) of the Datacloud target
+        primary_key (str or list): Key column(s), a composite key is partitioned on its first column, so all
+            records of a key still share a bucket
+        output_dir (str): Directory the output csv files are written to
+        chunk_size (int): Rows read at once, also the approximate number of rows per bucket
+        mode (str): 'hash' or 'merge', see comparison.classify_records
+        spill_dir (str): Directory for the buckets, defaults to the system temp directory
+        workers (int): Number of processes; with more than one, the files are partitioned and the bucket pairs
+            compared in parallel
+        output_format (str): Format of the output files, see output_sinks.OUTPUT_FORMATS
+        max_output_rows (int): Records written per output file, None for all; the counts cover every record
+        rules (dict): Column -> comparison rule, see comparison.compare_frames
+        engine (str): 'pandas' or 'duckdb', the engine every bucket is compared with (comparison.ENGINES)
+    Returns:
+        dict: Same statistics as comparison.compare_frames, without the output frames, plus 'outputs' (name ->
+            output_sinks.OutputSink.summary())
+    """
+    min_buckets = workers * BUCKETS_PER_WORKER if workers > 1 else 1
+    with tempfile.TemporaryDirectory(prefix='data_comparison_', dir=spill_dir) as work_dir:
+        files = [source, target]
+        columns = [file_columns(file) for file in files]
+        comparison_rules.check_columns(rules, *columns)
+        boundaries, key_kind = key_boundaries(files, primary_key, chunk_size, min_buckets, columns)
+        buckets = range(len(boundaries) + 1)
+        partition_args = (files, columns, primary_key, boundaries, key_kind, chunk_size, work_dir, workers)
+
+        sinks = output_sinks.open_sinks(output_dir, comparison.OUTPUT_FILES, output_format, max_output_rows,
+                                        comparison.typed_output_columns(primary_key))
+        try:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    source_buckets, target_buckets = partition_files(executor, *partition_args)
+                    # map yields in bucket order, earlier buckets are written while later ones are compared
+                    results = [write_bucket_outputs(result, sinks) for result in executor.map(
+                        compare_bucket, buckets, repeat(source_buckets), repeat(target_buckets), repeat(primary_key),
+                        repeat(mode), repeat(work_dir), repeat(rules), repeat(engine), repeat(output_format),
+                        repeat(max_output_rows))]
+            else:
+                # Reading and partitioning overlap in two threads, the C parser releases the GIL while it tokenizes
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    source_buckets, target_buckets = partition_files(executor, *partition_args)
+                results = [write_bucket_outputs(compare_bucket(bucket, source_buckets, target_buckets, primary_key,
+                                                               mode, rules=rules, engine=engine), sinks)
+                           for bucket in buckets]
+        finally:
+            for sink in sinks.values():
+                sink.close()
+    statistics = merge_results(results)
+    statistics['outputs'] = {name: sink.summary() for name, sink in sinks.items()}
+    return statistics
+
+
+def file_columns(file):
+    """Columns of a file as csv_reader.read_csv names them, from its first line."""
+    file_path, delimiter, encoding, read_options = file
+    return list(csv_reader.read_csv(file_path, delimiter, encoding, nrows=0, **read_options).columns)
+
+
+def range_options(read_options, byte_range, columns):
+    """read_csv options of a byte range of a file, ranges after the first one have no header line."""
+    if byte_range is None or byte_range[0] == 0:
+        return read_options
+    return {**read_options, 'header': None, 'names': columns}
+
+
+def file_ranges(file, workers):
+    """
+    Byte ranges (csv_reader.line_ranges) a file is read and partitioned in, one per worker and at least
+    MIN_RANGE_SIZE bytes each. [None] (the whole file in one piece) for one worker, small files and files that
+    cannot be split on newlines: quoted values may hold line breaks, UTF-16/32 newlines are more than one byte.
+    """
+    file_path, delimiter, encoding, read_options = file
+    num_ranges = min(workers, os.path.getsize(file_path) // MIN_RANGE_SIZE)
+    if num_ranges < 2 or 'quoting' in read_options or not csv_reader.splits_on_newline(encoding):
+        return [None]
+    return csv_reader.line_ranges(file_path, num_ranges)
+
+
+def sample_keys(file, partition_column, columns):
+    """
+    Keys of the partition column in SAMPLE_BLOCKS blocks spread evenly over a file (all keys of a smaller file or a
+    file that cannot be split on newlines, see file_ranges).
+    Returns:
+        list: Series of keys, one per block
+        float: Estimated number of records of the file
+    """
+    file_path, delimiter, encoding, read_options = file
+    size = os.path.getsize(file_path)
+    if (size <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE or 'quoting' in read_options
+            or not csv_reader.splits_on_newline(encoding)):
+        keys = [chunk[partition_column] for chunk in csv_reader.read_csv(
+            file_path, delimiter, encoding, chunksize=1 << 20, usecols=[partition_column], **read_options)]
+        return keys, sum(map(len, keys))
+
+    offsets = [size * number // SAMPLE_BLOCKS for number in range(SAMPLE_BLOCKS)]
+    starts = csv_reader.line_starts(file_path, offsets)
+    ends = csv_reader.line_starts(file_path, [offset + SAMPLE_BLOCK_SIZE for offset in offsets])
+    keys, sampled_bytes = [], 0
+    for byte_range in zip(starts, ends):
+        if byte_range[1] > byte_range[0]:
+            keys.append(csv_reader.read_csv(file_path, delimiter, encoding, byte_range=byte_range,
+                                            usecols=[partition_column],
+                                            **range_options(read_options, byte_range, columns))[partition_column])
+            sampled_bytes += byte_range[1] - byte_range[0]
+    return keys, sum(map(len, keys)) * size / max(sampled_bytes, 1)
+
+
+def key_boundaries(files, primary_key, chunk_size, min_buckets=1, columns=None):
+    """
+    Choose the bucket boundaries from a sample of the (first) primary_key column of all files (sample_keys).
+    Parameters:
+        files (list): (file_path, delimiter, encoding, read_options) of every file
+        primary_key (str or list): Key column(s)
+        chunk_size (int): Approximate number of rows per bucket of the largest file
+        min_buckets (int): Split into at least this many buckets, even when the files are smaller
+        columns (list): Columns of every file (file_columns), read from the files when not given
+    Returns:
+        ndarray: Sorted, unique upper bounds of all buckets but the last one
+        str: 'numeric' or 'text', how keys are compared when they are assigned to a bucket
+    """
+    partition_column = comparison.key_columns(primary_key)[0]
+    samples, max_rows = [], 0
+    for file, file_columns in zip(files, columns or [file_columns(file) for file in files]):
+        keys, num_rows = sample_keys(file, partition_column, file_columns)
+        samples += keys
+        max_rows = max(max_rows, num_rows)
+
+    # Blocks without records (e.g. a file with only its header) are object columns, they do not decide
+    key_kind = 'numeric' if all(pd.api.types.is_numeric_dtype(keys) for keys in samples if len(keys)) else 'text'
+    num_buckets = max(min_buckets, int(-(-max_rows // chunk_size)))
+    sample = np.sort(np.concatenate([_bucket_keys(keys.dropna(), key_kind) for keys in samples] or [np.array([])]))
+    if key_kind == 'numeric':
+        sample = sample[~np.isnan(sample)]
+    if num_buckets == 1 or not len(sample):
+        return sample[:0], key_kind
+    cut_points = [len(sample) * i // num_buckets for i in range(1, num_buckets)]
+    return np.unique(sample[cut_points]), key_kind
+
+
+def _bucket_keys(keys, key_kind):
+    if key_kind == 'numeric':
+        # A part of a file outside of the sample may still hold text keys, those are NaN and go to the last bucket
+        return pd.to_numeric(keys, errors='coerce').to_numpy(dtype='float64')
+    return keys.astype(str).to_numpy(dtype=object)
+
+
+def assign_buckets(keys, boundaries, key_kind):
+    """Return the bucket number of every key. Equal keys always share a bucket, null keys go to the last one."""
+    buckets = np.searchsorted(boundaries, _bucket_keys(keys, key_kind), side='right')
+    if key_kind == 'text':
+        buckets[keys.isna().to_numpy()] = len(boundaries)
+    return buckets
+
+
+def partition_range(file_path, delimiter, encoding, read_options, byte_range, columns, primary_key, boundaries,
+                    key_kind, chunk_size, work_dir):
+    """
+    Split a byte range of a file (the whole file for None) into key range buckets on disk.
+    Every chunk is split by bucket and each piece is pickled, so dtypes and the row numbers within the range (the
+    index) are kept exactly.
+    Returns:
+        dict: 'template' an empty frame with the dtypes of the range (None for an empty range), 'parts' bucket ->
+            list of pickle files and 'rows' the number of records of the range
+    """
+    os.makedirs(work_dir)
+    template, parts, num_rows = None, {}, 0
+    chunks = csv_reader.read_csv(file_path, delimiter, encoding, chunksize=chunk_size, byte_range=byte_range,
+                                 **range_options(read_options, byte_range, columns))
+    for chunk_number, chunk in enumerate(chunks):
+        # Same dtype promotion as concatenating all chunks of the file
+        template = chunk.iloc[:0] if template is None else pd.concat([template, chunk.iloc[:0]])
+        buckets = assign_buckets(chunk[comparison.key_columns(primary_key)[0]], boundaries, key_kind)
+        for bucket, part in chunk.groupby(buckets, sort=False):
+            part_path = os.path.join(work_dir, f'{bucket}_{chunk_number}.pkl')
+            part.to_pickle(part_path)
+            parts.setdefault(bucket, []).append(part_path)
+        num_rows += len(chunk)
+    return {'template': template, 'parts': parts, 'rows': num_rows}
+
+
+def partition_files(executor, files, columns, primary_key, boundaries, key_kind, chunk_size, work_dir, workers):
+    """
+    Partition every file (partition_range), one task per byte range (file_ranges) on executor.
+    Returns:
+        list: One merge_partitions result per file
+    """
+    ranges = [file_ranges(file, workers) for file in files]
+    partition_args = [(*file, byte_range, file_columns, primary_key, boundaries, key_kind, chunk_size,
+                       os.path.join(work_dir, f'{file_number}_{range_number}'))
+                      for file_number, (file, file_columns, file_ranges_) in enumerate(zip(files, columns, ranges))
+                      for range_number, byte_range in enumerate(file_ranges_)]
+    partitions = iter(executor.map(partition_range, *zip(*partition_args)))
+    return [merge_partitions([next(partitions) for _ in file_ranges_], file_columns)
+            for file_ranges_, file_columns in zip(ranges, columns)]
+
+
+def merge_partitions(partitions, columns):
+    """
+    Combine the partition_range results of the byte ranges of one file, in file order.
+    Returns:
+        dict: 'template' an empty frame with the dtypes of the whole file, 'parts' bucket -> list of (pickle file,
+            number of the first row of its range) in file order
+    """
+    templates = [partition['template'] for partition in partitions if partition['template'] is not None]
+    parts, first_row = {}, 0
+    for partition in partitions:
+        for bucket, part_paths in partition['parts'].items():
+            parts.setdefault(bucket, []).extend((part_path, first_row) for part_path in part_paths)
+        first_row += partition['rows']
+    return {'template': pd.concat(templates) if templates else pd.DataFrame(columns=columns, dtype=object),
+            'parts': parts}
+
+
+def load_bucket(partition, bucket, primary_key):
+    """Load one bucket of a partitioned file, sorted on primary_key like the in-memory path does."""
+    template = partition['template']
+    frames = []
+    for part_path, first_row in partition['parts'].get(bucket, []):
+        frames.append(pd.read_pickle(part_path))
+        # Row numbers of the file, as a chunked read of the whole file numbers them
+        frames[-1].index += first_row
+    df = pd.concat(frames) if frames else template
+    casts = {column_name: dtype for column_name, dtype in template.dtypes.items() if df[column_name].dtype != dtype}
+    if casts:
+        df = df.astype(casts)
+    return df.sort_values(by=primary_key, kind='stable')
+
+
+def compare_bucket(bucket, source_partition, target_partition, primary_key, mode, work_dir=None, rules=None,
+                   engine='pandas', output_format='csv', max_output_rows=None):
+    """
+    Compare bucket number 'bucket' of both files.
+    In a worker process (work_dir given) the output frames are written to work_dir, ready for the output files
+    (output_sinks.encode_part), and replaced by the part; the parent process appends them (write_bucket_outputs).
+    With max_output_rows no bucket adds more than that many records to a file, only those are pickled and the
+    parent writes them.
+    Returns:
+        dict: comparison.compare_frames result
+    """
+    df1 = load_bucket(source_partition, bucket, primary_key)
+    df2 = load_bucket(target_partition, bucket, primary_key)
+    result = comparison.compare_frames(df1, df2, primary_key, mode, rules=rules, engine=engine)
+    if work_dir is not None:
+        for name in comparison.OUTPUT_FILES:
+            frame = result.pop(name)
+            part_path = os.path.join(work_dir, f'{name}_{bucket}.part')
+            if max_output_rows is None:
+                result[name] = output_sinks.encode_part(frame, part_path, output_format,
+                                                        comparison.typed_output_columns(primary_key).get(name))
+            else:
+                frame.iloc[:max_output_rows].to_pickle(part_path)
+                result[name] = {'pickle': part_path, 'rows': len(frame)}
+    return result
+
+
+def write_bucket_outputs(result, sinks):
+    """Append the output records of a compare_bucket result to the sinks, returns the result without them."""
+    for name, sink in sinks.items():
+        part = result.pop(name)
+        if isinstance(part, pd.DataFrame):
+            sink.write(part)
+        elif 'pickle' in part:
+            sink.write(pd.read_pickle(part['pickle']), rows=part['rows'])
+            os.remove(part['pickle'])
+        else:
+            sink.write_part(part)
+    return result
+
+
+def merge_results(results):
+    """
+    Combine the compare_frames results of all buckets.
+    A key and every record with that key are in the same bucket, so counts per key or per record just add up.
+    """
+    def total(name):
+        return functools.reduce(lambda a, b: a + b, (result[name] for result in results))
+
+    mismatched_columns = []
+    for result in results:
+        mismatched_columns += [column for column in result['mismatched_columns'] if column not in mismatched_columns]
+
+    return {
+        'profile_source': profiling.merge_profiles([result['profile_source'] for result in results]),
+        'profile_target': profiling.merge_profiles([result['profile_target'] for result in results]),
+        'num_matching_records': total('num_matching_records'),
+        'num_unmatching_records': total('num_unmatching_records'),
+        'num_unmatched_data': total('num_unmatched_data'),
+        'num_oracle_only_records': total('num_oracle_only_records'),
+        'num_datacloud_only_records': total('num_datacloud_only_records'),
+        'num_present_in_both': total('num_present_in_both'),
+        'num_not_present_in_both': total('num_not_present_in_both'),
+        'mismatched_columns': mismatched_columns,
+        'frames_equal': all(result['frames_equal'] for result in results),
+    }
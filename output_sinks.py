@@ -0,0 +1,181 @@
+import gzip
+import io
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Output format -> extension added to the csv file names of comparison.OUTPUT_FILES
+OUTPUT_FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'csv.zst': '.csv.zst', 'parquet': '.parquet'}
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def output_path(output_dir, file_name, output_format='csv'):
+    """Path of an output file (a comparison.OUTPUT_FILES name such as 'unmatched_data.csv') in output_format."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format {output_format!r}, expected one of {tuple(OUTPUT_FORMATS)}')
+    return os.path.join(output_dir, os.path.splitext(file_name)[0] + OUTPUT_FORMATS[output_format])
+
+
+def check_format(output_format):
+    """Raise when output_format is unknown or its optional package is not installed."""
+    output_path('', 'check.csv', output_format)
+    if output_format == 'csv.zst' and zstandard is None:
+        raise ValueError('csv.zst output needs the zstandard package')
+    if output_format == 'parquet' and not PYARROW_AVAILABLE:
+        raise ValueError('parquet output needs pyarrow')
+
+
+def _open_text(path, output_format):
+    # newline='' and utf-8 like DataFrame.to_csv(path), so plain csv output is unchanged
+    if output_format == 'csv.gz':
+        # mtime=0: the same records always give the same bytes
+        raw = gzip.GzipFile(path, 'wb', compresslevel=GZIP_LEVEL, mtime=0)
+    elif output_format == 'csv.zst':
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'))
+    else:
+        return open(path, 'w', encoding='utf-8', newline='')
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def _to_arrow(df, typed_columns=None):
+    # Output frames mix numbers and 'old -> new' strings in object columns, those are written as the text the csv
+    # output has; numeric columns keep their type (the out-of-core buckets all have the dtypes of the whole file).
+    # With typed_columns only those keep their type, for columns that are numeric in some chunks and text in others
+    text = [column_name for column_name, dtype in df.dtypes.items()
+            if dtype == object or isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype))
+            or (typed_columns is not None and column_name not in typed_columns)]
+    df = df.copy()
+    for column_name in text:
+        df[column_name] = df[column_name].astype(object).map(str, na_action='ignore')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.cast(pa.schema([pa.field(field.name, pa.string()) if field.name in text else field
+                                 for field in table.schema]))
+
+
+def encode_part(df, path, output_format='csv', typed_columns=None):
+    """
+    Write the records of df to path ready to be appended to an output file (OutputSink.write_part): csv text
+    without the header for every csv format (the sink compresses it), an Arrow IPC file of the parquet table for
+    parquet. Meant for worker processes, the expensive to_csv / Arrow conversion then runs in parallel and the
+    process that owns the sink only copies. typed_columns as for OutputSink.
+    Returns:
+        dict: 'path', 'rows' and 'columns'
+    """
+    if output_format == 'parquet':
+        table = _to_arrow(df, typed_columns)
+        with pa.OSFile(path, 'wb') as part_file, pa.ipc.new_file(part_file, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        with _open_text(path, 'csv') as part_file:
+            df.to_csv(part_file, index=False, header=False)
+    return {'path': path, 'rows': len(df), 'columns': list(df.columns)}
+
+
+class OutputSink:
+    """
+    Output file that receives the records of one category chunk by chunk (per out-of-core bucket, or the whole
+    frame at once), so nothing has to be collected before it is written.
+    Parameters:
+        path (str): Path of the file
+        output_format (str): 'csv', 'csv.gz', 'csv.zst' or 'parquet'
+        max_rows (int): Write at most this many records, None for all; rows still counts every record
+        typed_columns (list): Columns that keep their numeric dtype in parquet, every other column is written as
+            text, None keeps the dtype of every numeric column. The parquet schema is fixed by the first chunk, so
+            columns that only hold text in some chunks (the 'old -> new' columns of unmatched_data) must be text
+            in all of them.
+    """
+
+    def __init__(self, path, output_format='csv', max_rows=None, typed_columns=None):
+        check_format(output_format)
+        self.path = path
+        self.output_format = output_format
+        self.max_rows = max_rows
+        self.typed_columns = typed_columns
+        self.rows = 0
+        self.written = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, df, rows=None):
+        """
+        Append the records of df, the first call also writes the header (even for an empty frame).
+        rows is the number of records df was cut from when the caller already cut it to max_rows, for the count.
+        """
+        self.rows += len(df) if rows is None else rows
+        if self.max_rows is not None and self.written + len(df) > self.max_rows:
+            df = df.iloc[:max(self.max_rows - self.written, 0)]
+        if self.output_format == 'parquet':
+            table = _to_arrow(df, self.typed_columns)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            first = self._file is None
+            if first:
+                self._file = _open_text(self.path, self.output_format)
+            if first or len(df):
+                df.to_csv(self._file, index=False, header=first)
+        self.written += len(df)
+
+    def write_part(self, part):
+        """Append a part written by encode_part in the format of this sink and remove it. Not with max_rows."""
+        if self.max_rows is not None:
+            raise ValueError('Encoded parts cannot be cut to max_rows, write the records instead')
+        self.rows += part['rows']
+        if self.output_format == 'parquet':
+            with pa.memory_map(part['path']) as part_file:
+                table = pa.ipc.open_file(part_file).read_all()
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            if self._file is None:
+                self._file = _open_text(self.path, self.output_format)
+                pd.DataFrame(columns=part['columns']).to_csv(self._file, index=False)
+            # Through the text layer, which keeps the header in front of the part and does not flush the compressor
+            with open(part['path'], encoding='utf-8', newline='') as part_file:
+                shutil.copyfileobj(part_file, self._file)
+        self.written += part['rows']
+        os.remove(part['path'])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def summary(self):
+        """'path', 'rows' (all records) and 'written' (records in the file)."""
+        return {'path': self.path, 'rows': self.rows, 'written': self.written}
+
+
+def open_sinks(output_dir, output_files, output_format='csv', max_rows=None, typed_columns=None):
+    """
+    One OutputSink per output (name -> file name, e.g. comparison.OUTPUT_FILES) in output_dir.
+    typed_columns maps an output name to the typed_columns of its sink (e.g. comparison.typed_output_columns).
+    """
+    typed_columns = typed_columns or {}
+    return {name: OutputSink(output_path(output_dir, file_name, output_format), output_format, max_rows,
+                             typed_columns.get(name))
+            for name, file_name in output_files.items()}
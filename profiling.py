@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass
+class FileProfile:
+    """
+    Statistics of one file that the report needs, gathered in one pass over each chunk (or bucket) of the file.
+    Profiles of consecutive chunks are combined with merge_profiles. Identical records and records with the same
+    key always land in the same out-of-core bucket, so per bucket duplicate and unique key counts add up.
+    """
+    num_records: int
+    columns: list
+    dtypes: list
+    null_count: pd.Series
+    num_duplicates: int
+    num_unique_keys: int
+    first_record: pd.DataFrame
+
+    @property
+    def datetime_column(self):
+        """Position of the first datetime64[ns] column, -1 when there is none."""
+        return next((index for index, dtype in enumerate(self.dtypes) if dtype == 'datetime64[ns]'), -1)
+
+    @property
+    def datetime_format(self):
+        """Format of the datetime column in the first record (the file is sorted on the key), None without one."""
+        if self.datetime_column == -1 or not len(self.first_record):
+            return None
+        values = pd.to_datetime(self.first_record.iloc[:, self.datetime_column], errors='coerce')
+        return values.dt.strftime('').iloc[0]
+
+
+def profile_frame(df, key_codes, row_hashes=None):
+    """
+    Profile a frame (a whole file, a chunk or a bucket) in one pass per statistic.
+    Parameters:
+        df (DataFrame): Records sorted on the key
+        key_codes (Series): Key of every record, the key column or comparison.key_codes of a composite key
+        row_hashes (Series): 64-bit hash per row (comparison.row_hashes) when the comparison already computed them,
+            duplicates are then counted on the hashes instead of comparing every column again
+    Returns:
+        FileProfile
+    """
+    if row_hashes is not None:
+        num_duplicates = len(row_hashes) - row_hashes.nunique()
+    else:
+        num_duplicates = int(df.duplicated().sum())
+    return FileProfile(num_records=len(df), columns=list(df.columns), dtypes=list(df.dtypes),
+                       null_count=df.isnull().sum(), num_duplicates=num_duplicates,
+                       num_unique_keys=key_codes.nunique(), first_record=df.iloc[:1])
+
+
+def merge_profiles(profiles):
+    """
+    Combine the profiles of consecutive buckets of one file.
+    The columns and dtypes are the ones of the last bucket, all buckets are cast to the dtypes of the whole file.
+    """
+    null_count = profiles[0].null_count
+    for profile in profiles[1:]:
+        null_count = null_count + profile.null_count
+    return FileProfile(num_records=sum(profile.num_records for profile in profiles),
+                       columns=profiles[-1].columns, dtypes=profiles[-1].dtypes, null_count=null_count,
+                       num_duplicates=sum(profile.num_duplicates for profile in profiles),
+                       num_unique_keys=sum(profile.num_unique_keys for profile in profiles),
+                       first_record=next((profile.first_record for profile in profiles if len(profile.first_record)),
+                                         profiles[0].first_record))
@@ -0,0 +1,114 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import comparison
+import csv_reader
+import sniffing
+
+# Text columns whose sampled values repeat this much (distinct / non-null values) are read as categoricals, e.g.
+# CURRENCY or CONSOLIDATED_ACCOUNTS. Anything more distinct (names, addresses, keys) becomes a pyarrow string.
+CATEGORY_MAX_SHARE = 0.2
+
+# pyarrow strings keep the characters of a column in one buffer plus offsets, instead of one Python object per value
+STRING_DTYPE = 'string[pyarrow]'
+
+
+def infer_dtypes(file_path, file_format, primary_key):
+    """
+    Choose compact dtypes for the text columns of a file from its head/middle/tail sample (sniffing.read_sample),
+    before the file itself is read.
+    Numeric columns keep the int64/float64 the parser infers, integers are narrowed per chunk by
+    downcast_integers. Nullable Int64/Float64 are not used: they take at least as much memory as float64 and would
+    change how the values are written to the output files.
+    Parameters:
+        file_path (str): Path of the file
+        file_format (dict): sniffing.sniff_file result of the file
+        primary_key (str or list): Key column(s), never categorical: a key column is compared on its own values and
+            mostly unique
+    Returns:
+        dict: column -> 'category' or STRING_DTYPE, the dtype argument of csv_reader.read_csv
+    """
+    sample = csv_reader.read_csv(io.BytesIO(sniffing.read_sample(file_path)), file_format['delimiter'],
+                                 file_format['encoding'], **sniffing.read_options(file_format))
+    keys = comparison.key_columns(primary_key)
+    dtypes = {}
+    for column_name in sample.columns:
+        if sample[column_name].dtype != object:
+            continue
+        values = sample[column_name].dropna()
+        if column_name not in keys and len(values) and values.nunique() <= CATEGORY_MAX_SHARE * len(values):
+            dtypes[column_name] = 'category'
+        elif csv_reader.PYARROW_AVAILABLE:
+            dtypes[column_name] = STRING_DTYPE
+    return dtypes
+
+
+def downcast_integers(df):
+    """Narrow the int64 columns of a frame to the smallest integer dtype that holds their values."""
+    for column_name in df.columns[(df.dtypes == np.int64).to_numpy()]:
+        df[column_name] = pd.to_numeric(df[column_name], downcast='integer')
+    return df
+
+
+def concat_chunks(chunks):
+    """
+    Concatenate the chunks of one file. Every chunk has its own categories, pd.concat would turn those columns
+    back into objects, so each categorical column gets the union of the categories of all chunks first.
+    """
+    chunks = list(chunks)
+    for column_name in chunks[0].columns if len(chunks) > 1 else []:
+        if all(isinstance(chunk[column_name].dtype, pd.CategoricalDtype) for chunk in chunks):
+            categories = chunks[0][column_name].cat.categories
+            for chunk in chunks[1:]:
+                categories = categories.union(chunk[column_name].cat.categories)
+            for chunk in chunks:
+                chunk[column_name] = chunk[column_name].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _is_compact(dtype):
+    return isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype))
+
+
+def _to_object(values):
+    # Missing values as NaN, like the object columns pandas infers (pyarrow strings give pd.NA)
+    return values.astype(object).where(values.notna().to_numpy(), np.nan)
+
+
+def harmonize(df1, df2):
+    """
+    Give the common columns of both frames identical dtypes, so row hashes, merges and DataFrame.equals compare
+    the same values as with the dtypes pandas infers. Each file chooses its compact dtypes from its own sample:
+        - categoricals get the union of the categories of both files
+        - a categorical on one side and a pyarrow string on the other become pyarrow strings
+        - integers are widened to the larger of both dtypes
+        - a compact column facing any other dtype goes back to objects, comparison.row_hashes handles the rest
+    Returns:
+        DataFrame, DataFrame: df1 and df2 with the common dtypes
+    """
+    casts1, casts2 = {}, {}
+    for column_name in df1.columns.intersection(df2.columns):
+        dtype1, dtype2 = df1[column_name].dtype, df2[column_name].dtype
+        if dtype1 == dtype2:
+            continue
+        if isinstance(dtype1, pd.CategoricalDtype) and isinstance(dtype2, pd.CategoricalDtype):
+            casts1[column_name] = casts2[column_name] = pd.CategoricalDtype(
+                dtype1.categories.union(dtype2.categories))
+        elif _is_compact(dtype1) and _is_compact(dtype2):
+            casts1[column_name] = casts2[column_name] = STRING_DTYPE
+        elif dtype1.kind in 'iu' and dtype2.kind in 'iu':
+            casts1[column_name] = casts2[column_name] = np.result_type(dtype1, dtype2)
+        else:
+            if _is_compact(dtype1):
+                casts1[column_name] = object
+            if _is_compact(dtype2):
+                casts2[column_name] = object
+
+    def cast(df, casts):
+        for column_name, dtype in casts.items():
+            df[column_name] = _to_object(df[column_name]) if dtype is object else df[column_name].astype(dtype)
+        return df
+
+    return cast(df1, casts1), cast(df2, casts2)
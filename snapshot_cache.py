@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+import csv_reader
+
+# Column the (sorted) row numbers are kept in, Feather only stores a default index
+INDEX_COLUMN = '__row_number__'
+
+HASH_BLOCK_SIZE = 1 << 22
+
+
+def file_fingerprint(file_path):
+    """
+    Identify the current content of a file.
+    Returns:
+        dict: Absolute path, size, mtime (ns) and blake2b hash of the content
+    """
+    stat = os.stat(file_path)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            content_hash.update(block)
+    return {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'content_hash': content_hash.hexdigest()}
+
+
+def cache_key(fingerprint, settings):
+    """Key of a cache entry, the parsed frame also depends on the read settings (primary_key, chunk_size, ...)."""
+    payload = json.dumps({'file': fingerprint, 'settings': settings}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load(cache_dir, fingerprint, settings):
+    """
+    Load a parsed file from the cache.
+    The Feather file is memory-mapped, so nothing is parsed and numeric columns are not even copied.
+    Returns:
+        DataFrame, dict: The frame and the entry metadata (format, settings, ...), or (None, None) on a miss
+    """
+    if not PYARROW_AVAILABLE or not cache_dir:
+        return None, None
+    key = cache_key(fingerprint, settings)
+    data_path, meta_path = _entry_paths(cache_dir, key)
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        table = feather.read_table(data_path, memory_map=True)
+    except (OSError, ValueError, pa.ArrowException):
+        return None, None
+
+    # String columns are only stored as such by the compact dtypes (schema.py), they were pyarrow strings
+    with pd.option_context('mode.string_storage', 'pyarrow'):
+        df = csv_reader.table_to_pandas(table).set_index(INDEX_COLUMN)
+    df.index.name = None
+    meta['last_used'] = time.time()
+    _write_json(meta_path, meta)
+    return df, meta
+
+
+def store(cache_dir, fingerprint, settings, df, file_format, max_bytes):
+    """
+    Save a parsed frame with the detected format of its file (sniffing.sniff_file), then evict least recently
+    used entries until the cache is back under max_bytes. Frames pyarrow cannot convert (mixed-type columns) are not cached.
+    Returns:
+        bool: True if the frame was cached
+    """
+    if not PYARROW_AVAILABLE or not cache_dir:
+        return False
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cache_key(fingerprint, settings)
+    data_path, meta_path = _entry_paths(cache_dir, key)
+    try:
+        table = pa.Table.from_pandas(df.rename_axis(INDEX_COLUMN).reset_index(), preserve_index=False)
+    except (pa.ArrowException, ValueError):
+        return False
+
+    # Write under a temporary name first, a concurrent run never sees half a file
+    temp_path = f'{data_path}.{os.getpid()}.tmp'
+    feather.write_feather(table, temp_path, compression='uncompressed')
+    os.replace(temp_path, data_path)
+    _write_json(meta_path, {'file': fingerprint, 'settings': settings, 'format': file_format,
+                            'bytes': os.path.getsize(data_path), 'last_used': time.time()})
+    evict(cache_dir, max_bytes)
+    return True
+
+
+def evict(cache_dir, max_bytes):
+    """Delete least recently used entries until the cache holds at most max_bytes."""
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith('.json'):
+            try:
+                with open(os.path.join(cache_dir, file_name)) as meta_file:
+                    meta = json.load(meta_file)
+            except (OSError, ValueError):
+                continue
+            entries.append((meta.get('last_used', 0), meta.get('bytes', 0), file_name[:-len('.json')]))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in _entry_paths(cache_dir, key):
+            if os.path.exists(path):
+                os.remove(path)
+        total -= size
+
+
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, f'{key}.feather'), os.path.join(cache_dir, f'{key}.json')
+
+
+def _write_json(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file, default=str)
+    os.replace(temp_path, path)
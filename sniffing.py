@@ -0,0 +1,175 @@
+import codecs
+import csv
+import os
+import re
+from collections import Counter
+
+# Bytes read from the head, the middle and the tail of a file. Files up to three blocks are read completely.
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+# Tried in this order, the first one that decodes the whole sample wins. ISO-8859-1 decodes any byte, so files
+# that are not UTF-8 are read as ISO-8859-1 like before; the rest only matter when it is removed from the list.
+ENCODINGS = ["UTF-8", "ISO-8859-1", "Windows-1251", "Windows-1252", "GB2312", "Shift JIS", "EUC-KR", "ISO-8859-9",
+             "Windows-1254", "EUC-JP", "Big5"]
+
+# Used when the sample decodes as UTF-8 but a part of the file outside of it does not
+FALLBACK_ENCODING = 'ISO-8859-1'
+
+DELIMITERS = [',', '\t', ';', '|*|', '|', ':', ' ', '~', '`', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '-',
+              '_', '=', '+', '[', ']', '{', '}', '\\', '/', '<', '>', '?']
+
+# Preferred over the other candidates when both split the lines consistently, '_' or '-' also occur on every line of
+# a header like CS_COMPANY_ID|BUSINESS_NAME|...
+COMMON_DELIMITERS = (',', '\t', ';', '|*|', '|')
+
+# Share of the sample lines that must have the most common number of delimiters for it to count as consistent
+MIN_CONSISTENCY = 0.9
+
+# Share of the non-empty values of a column that must be quoted before the file is read with quoting
+MIN_QUOTED_SHARE = 0.5
+
+# Changes whenever the detection can give a different result for the same file, cached parses depend on it
+SNIFFER_VERSION = 1
+
+_NUMBER = re.compile(r'^[+-]?(\d+([.,]\d*)?|[.,]\d+)([eE][+-]?\d+)?$')
+
+
+def read_sample(file_path, block_size=SAMPLE_BLOCK_SIZE):
+    """
+    Read complete lines from the head, the middle and the tail of a file.
+    Returns:
+        bytes: The sampled lines, the first line of the file first
+    """
+    with open(file_path, 'rb') as file:
+        def read_block(offset, length):
+            file.seek(offset)
+            return file.read(length)
+
+        return sample_blocks(read_block, os.path.getsize(file_path), block_size)
+
+
+def sample_blocks(read_block, size, block_size=SAMPLE_BLOCK_SIZE):
+    """
+    Complete lines from the head, the middle and the tail of a file of size bytes, read with read_block(offset,
+    length) (a local file in read_sample, ranged GETs of an S3 object in downloadcode.read_s3_sample).
+    Returns:
+        bytes: The sampled lines, the first line of the file first
+    """
+    if size <= 3 * block_size:
+        return read_block(0, size)
+    blocks = []
+    for offset in (0, size // 2 - block_size // 2, size - block_size):
+        block = read_block(offset, block_size)
+        if offset:
+            # Drop the partial first line, it started before the block
+            block = block[block.find(b'\n') + 1:]
+        if offset + block_size < size:
+            block = block[:block.rfind(b'\n') + 1]
+        blocks.append(block)
+    return b''.join(blocks)
+
+
+def detect_encoding(sample, encodings=ENCODINGS):
+    """Return the first encoding of encodings that decodes the sample, a UTF-8 byte order mark wins."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    for encoding in encodings:
+        try:
+            sample.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        return encoding
+    return FALLBACK_ENCODING
+
+
+def detect_delimiter(lines, delimiters=DELIMITERS):
+    """
+    Return the delimiter that splits the sample lines most consistently.
+    Every candidate is counted on every line. Candidates whose most common count per line is not zero and occurs on
+    at least MIN_CONSISTENCY of the lines qualify; the longest qualifying delimiter wins, so '|*|' beats the '|' and
+    '*' it is made of, then a common delimiter, then the one with most fields.
+    """
+    text = '\n'.join(lines)
+    best, best_rank = None, None
+    for delimiter in delimiters:
+        if text.count(delimiter) < len(lines):
+            continue
+        counts = Counter(line.count(delimiter) for line in lines)
+        fields, lines_with_fields = counts.most_common(1)[0]
+        consistency = lines_with_fields / len(lines)
+        if fields == 0 or consistency < MIN_CONSISTENCY:
+            continue
+        rank = (len(delimiter), delimiter in COMMON_DELIMITERS, fields, consistency)
+        if best_rank is None or rank > best_rank:
+            best, best_rank = delimiter, rank
+    return best or ','
+
+
+def detect_header(rows):
+    """
+    Return False only when the first row looks like data: columns whose sampled values are all numbers vote for a
+    header when the first row has text there and against it when the first row has a number as well.
+    """
+    header, data = rows[0], [row for row in rows[1:] if len(row) == len(rows[0])]
+    votes = 0
+    for position, name in enumerate(header):
+        values = [row[position] for row in data if row[position]]
+        if values and all(_NUMBER.match(value) for value in values):
+            votes += -1 if _NUMBER.match(name) else 1
+    return votes >= 0
+
+
+def detect_quoting(rows):
+    """Return csv.QUOTE_MINIMAL when some column is quoted on most rows, csv.QUOTE_NONE otherwise."""
+    quoted, filled = Counter(), Counter()
+    for row in rows[1:]:
+        for position, value in enumerate(row):
+            if value:
+                filled[position] += 1
+                if len(value) > 1 and value[0] == value[-1] == '"':
+                    quoted[position] += 1
+    if any(quoted[position] >= MIN_QUOTED_SHARE * filled[position] for position in quoted):
+        return csv.QUOTE_MINIMAL
+    return csv.QUOTE_NONE
+
+
+def sniff_file(file_path, encodings=ENCODINGS, delimiters=DELIMITERS):
+    """
+    Detect the format of a delimited file from one sample of its head, middle and tail.
+    The work is bounded by the sample size, not the file size, and is meant to be done once per file: the result
+    is passed on to the reader, the out-of-core partitioning and the report.
+    Parameters:
+        file_path (str): Path of the file
+        encodings (list): Candidate encodings, in order of preference
+        delimiters (list): Candidate delimiters
+    Returns:
+        dict: 'encoding', 'delimiter', 'has_header', 'quoting' (csv.QUOTE_* constant) and 'line_terminator'
+    """
+    return sniff_sample(read_sample(file_path), encodings, delimiters)
+
+
+def sniff_sample(sample, encodings=ENCODINGS, delimiters=DELIMITERS):
+    """Detect the format of a delimited file from its sample (read_sample), see sniff_file."""
+    encoding = detect_encoding(sample, encodings)
+    text = sample.decode(encoding, errors='replace')
+    line_terminator = '\r\n' if '\r\n' in text else '\n'
+    # Not splitlines(), it also breaks on characters such as \x85 that are plain data in ISO-8859-1
+    lines = [line.rstrip('\r') for line in text.split('\n') if line.strip()]
+    if not lines:
+        return {'encoding': encoding, 'delimiter': ',', 'has_header': True, 'quoting': csv.QUOTE_NONE,
+                'line_terminator': line_terminator}
+
+    delimiter = detect_delimiter(lines, delimiters)
+    rows = [line.split(delimiter) for line in lines]
+    return {'encoding': encoding, 'delimiter': delimiter, 'has_header': detect_header(rows),
+            'quoting': detect_quoting(rows), 'line_terminator': line_terminator}
+
+
+def read_options(file_format):
+    """Keyword arguments for csv_reader.read_csv that follow the detected header and quoting of a file."""
+    options = {}
+    if not file_format.get('has_header', True):
+        options['header'] = None
+    if file_format.get('quoting', csv.QUOTE_NONE) != csv.QUOTE_NONE:
+        options['quoting'] = file_format['quoting']
+    return options
@@ -0,0 +1,24 @@
+import os
+
+import pandas as pd
+
+import batch_runner
+
+
+def fake_run_pair(pair, output_dir):
+    if pair['name'] == 'crash':
+        os._exit(9)
+    return {'name': pair['name'], 'source': pair['source'], 'target': pair['target'], 'status': 'ok', 'error': ''}
+
+
+def test_dead_worker_fails_only_its_pair(tmp_path, monkeypatch):
+    # The pair processes are forked, so they run the patched run_pair
+    monkeypatch.setattr(batch_runner, 'run_pair', fake_run_pair)
+    pairs = [{'name': name, 'source': str(tmp_path / f'{name}_s.csv'), 'target': str(tmp_path / f'{name}_t.csv'),
+              'memory_mb': 1, 'options': {}} for name in ('first', 'crash', 'last')]
+    summary = batch_runner.run_batch(pairs, str(tmp_path), memory_budget=2 * 1024 ** 2, cpus=2, verbose=False)
+    assert summary['name'].tolist() == ['first', 'crash', 'last']
+    assert summary['status'].tolist() == ['ok', 'failed', 'ok']
+    assert 'code 9' in summary.loc[1, 'error']
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / batch_runner.SUMMARY_FILE).fillna(''), summary.fillna(''),
+                                  check_dtype=False)
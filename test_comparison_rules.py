@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+import Data_Comparison
+
+RULES = {
+    'REVENUE': {'type': 'numeric', 'atol': 0.01},
+    'PROFIT_AFTER_TAX': {'type': 'numeric', 'rtol': 0.000001},
+    'FINANCIAL_YEAR': {'type': 'date', 'formats': ['%d-%m-%Y', '%Y-%m-%d']},
+    'BUSINESS_NAME': {'type': 'string', 'strip': True, 'casefold': True},
+}
+
+# ID, source values, target values and whether the record must still be reported as changed
+CASES = [
+    (1, ['100', '5', '31-12-2023', 'CAFÉ'], ['100.0', '5', '31-12-2023', 'CAFÉ'], False),
+    (2, ['10.004', '5', '31-12-2023', 'CAFÉ'], ['10.01', '5', '31-12-2023', 'CAFÉ'], False),
+    (3, ['10.00', '5', '31-12-2023', 'CAFÉ'], ['10.011', '5', '31-12-2023', 'CAFÉ'], True),
+    (4, ['7', '1000000', '31-12-2023', 'CAFÉ'], ['7', '1000000.5', '31-12-2023', 'CAFÉ'], False),
+    (5, ['7', '1000000', '31-12-2023', 'CAFÉ'], ['7', '1000003', '31-12-2023', 'CAFÉ'], True),
+    (6, ['7', '5', '31-12-2023', 'CAFÉ'], ['7', '5', '2023-12-31', 'CAFÉ'], False),
+    (7, ['7', '5', '31-12-2023', 'CAFÉ'], ['7', '5', '2023-12-30', 'CAFÉ'], True),
+    (8, ['7', '5', '31-12-2023', ' Café '], ['7', '5', '31-12-2023', 'CAFÉ'], False),
+    (9, ['7', '5', '31-12-2023', 'Café'], ['7', '5', '31-12-2023', 'Cafe'], True),
+    (10, ['7', '5', '31-12-2023', 'CAFÉ'], ['7', '5', '31-12-2023', 'CAFÉ'], False),
+]
+
+COLUMNS = ['ID', 'REVENUE', 'PROFIT_AFTER_TAX', 'FINANCIAL_YEAR', 'BUSINESS_NAME']
+
+
+@pytest.fixture
+def pair(tmp_path):
+    for file_name, values in [('source.csv', 1), ('target.csv', 2)]:
+        lines = ['|'.join(COLUMNS)] + ['|'.join([str(case[0]), *case[values]]) for case in CASES]
+        (tmp_path / file_name).write_bytes(('\n'.join(lines) + '\n').encode('ISO-8859-1'))
+    return str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+
+
+@pytest.mark.parametrize('options', [{}, {'out_of_core': True, 'chunk_size': 4}, {'engine': 'duckdb'}],
+                         ids=['in_memory', 'out_of_core', 'duckdb'])
+def test_rules_match_within_tolerances_and_formats(tmp_path, pair, options):
+    result = Data_Comparison.compare(*pair, key='ID', output_dir=str(tmp_path / 'out'), rules=RULES, verbose=False,
+                                     **options)
+    changed = [case[0] for case in CASES if case[3]]
+    assert result['num_matching_records'] == len(CASES) - len(changed)
+    assert (result['num_oracle_only_records'], result['num_datacloud_only_records']) == (0, 0)
+    assert pd.read_csv(tmp_path / 'out' / 'unmatched_data.csv')['ID'].tolist() == changed
+
+
+@pytest.mark.parametrize('options', [{}, {'out_of_core': True}], ids=['in_memory', 'out_of_core'])
+def test_rule_of_unknown_column_raises(tmp_path, pair, options):
+    with pytest.raises(ValueError, match='REVNUE'):
+        Data_Comparison.compare(*pair, key='ID', output_dir=str(tmp_path / 'out'), verbose=False, **options,
+                                rules={'REVNUE': {'type': 'numeric', 'atol': 0.01}})
@@ -0,0 +1,81 @@
+import csv
+import io
+import re
+
+import pandas as pd
+import pytest
+
+import csv_reader
+
+ROWS = [f'K{i:03d}|*|NAME {i}|*|{i}' for i in range(40)]
+
+
+def write_pair_file(path, rows):
+    path.write_bytes(('ID|*|NAME|*|VALUE\n' + '\n'.join(rows) + '\n').encode('latin-1'))
+    return str(path)
+
+
+def expected(path):
+    return pd.read_csv(path, sep=re.escape('|*|'), engine='python', encoding='latin-1', on_bad_lines='skip',
+                       index_col=False, quoting=csv.QUOTE_NONE)
+
+
+@pytest.fixture
+def substitute_file(tmp_path):
+    # Far enough into the file that the C parser hands out chunks before it reads the substitute byte
+    rows = [f'K{i:06d}|*|NAME {i}|*|{i}' for i in range(100000)]
+    return write_pair_file(tmp_path / 'substitute.csv', rows[:-5] + ['K900|*|SUB\x1fSTITUTE|*|1'] + rows[-5:])
+
+
+def test_translated_read_matches_python_engine(tmp_path):
+    path = write_pair_file(tmp_path / 'plain.csv', ROWS)
+    pd.testing.assert_frame_equal(csv_reader.read_csv(path, '|*|', 'latin-1'), expected(path))
+
+
+def test_substitute_byte_unchunked(substitute_file):
+    pd.testing.assert_frame_equal(csv_reader.read_csv(substitute_file, '|*|', 'latin-1'), expected(substitute_file))
+
+
+def test_substitute_byte_chunked(substitute_file):
+    chunks = list(csv_reader.read_csv(substitute_file, '|*|', 'latin-1', chunksize=25000))
+    assert all(len(chunk) for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected(substitute_file))
+
+
+def test_substitute_byte_in_stream_raises(substitute_file):
+    with open(substitute_file, 'rb') as stream:
+        with pytest.raises(csv_reader.SubstituteDelimiterInData):
+            list(csv_reader.read_csv(io.BufferedReader(stream), '|*|', 'latin-1', chunksize=25000))
+
+
+@pytest.mark.parametrize('chunksize', [None, 1000])
+def test_undecodable_file_is_named(tmp_path, chunksize):
+    path = tmp_path / 'latin.csv'
+    path.write_bytes(b'ID|NAME\n' + b''.join(b'%d|caf\xc3\xa9\n' % i for i in range(100000)) + b'5|caf\xe9\n')
+    with pytest.raises(csv_reader.UndecodableFile) as error:
+        result = csv_reader.read_csv(str(path), '|', 'UTF-8', chunksize=chunksize)
+        if chunksize:
+            list(result)
+    assert (error.value.file_path, error.value.encoding) == (str(path), 'UTF-8')
+
+
+@pytest.mark.parametrize('delimiter', ['|', '|*|'])
+@pytest.mark.parametrize('chunksize', [None, 9000])
+def test_byte_ranges_read_like_the_whole_file(tmp_path, delimiter, chunksize):
+    rows = [f'K{i:06d}|*|NAME {i}|*|{i}'.replace('|*|', delimiter) for i in range(30000)]
+    # The substitute byte in the last range sends that range to the python engine
+    rows[-3] = rows[-3].replace('NAME', 'SUB\x1fSTITUTE')
+    path = tmp_path / 'ranges.csv'
+    path.write_bytes((delimiter.join(['ID', 'NAME', 'VALUE']) + '\n' + '\n'.join(rows) + '\n').encode('latin-1'))
+    ranges = csv_reader.line_ranges(str(path), 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == path.stat().st_size
+    assert all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+
+    frames = []
+    for number, byte_range in enumerate(ranges):
+        options = {} if number == 0 else {'header': None, 'names': ['ID', 'NAME', 'VALUE']}
+        result = csv_reader.read_csv(str(path), delimiter, 'latin-1', chunksize=chunksize, byte_range=byte_range,
+                                     **options)
+        frames += list(result) if chunksize else [result]
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), csv_reader.read_csv(str(path), delimiter,
+                                                                                          'latin-1'))
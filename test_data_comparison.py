@@ -0,0 +1,74 @@
+import filecmp
+import os
+import re
+import sys
+
+import pytest
+
+import Data_Comparison
+import out_of_core
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import generate_data  # noqa: E402
+
+OUTPUTS = ('output.txt', 'unmatched_data.csv', 'oracle_only_records.csv', 'datacloud_only_records.csv')
+
+# Every variant must write the same output files as the in-memory pandas hash comparison
+VARIANTS = {
+    'merge': {'mode': 'merge'},
+    'out_of_core': {'out_of_core': True},
+    'workers': {'workers': 2},
+    'compact_dtypes': {'compact_dtypes': True},
+    'cache': {'cache_dir': 'cache'},
+    'duckdb': {'engine': 'duckdb'},
+}
+
+
+def shorten_keys(path):
+    # Drop the last digit of every key, so ten records share a key
+    with open(path, encoding=generate_data.ENCODING, newline='') as pair_file:
+        text = pair_file.read()
+    with open(path, 'w', encoding=generate_data.ENCODING, newline='') as pair_file:
+        pair_file.write(re.sub(r'^(BE\d{7})\d', r'\1', text, flags=re.MULTILINE))
+
+
+@pytest.fixture(scope='module', params=['pipe', 'multi', 'duplicate_keys', 'composite_key'])
+def pair(request, tmp_path_factory):
+    delimiter = '|*|' if request.param == 'multi' else '|'
+    pair = generate_data.generate_pair(str(tmp_path_factory.mktemp(request.param)), 3000, delimiter=delimiter,
+                                       duplicate_rate=0.01, seed=1)
+    if request.param == 'duplicate_keys':
+        shorten_keys(pair['source'])
+        shorten_keys(pair['target'])
+    pair['key'] = ['CS_COMPANY_ID', 'ADDRESS_TYPE'] if request.param == 'composite_key' else 'CS_COMPANY_ID'
+    pair['reference'] = os.path.join(os.path.dirname(pair['source']), 'reference')
+    Data_Comparison.compare(pair['source'], pair['target'], key=pair['key'], output_dir=pair['reference'],
+                            chunk_size=500, verbose=False)
+    return pair
+
+
+@pytest.mark.parametrize('variant', VARIANTS)
+def test_variant_matches_in_memory_comparison(pair, variant, tmp_path, monkeypatch):
+    # Small byte ranges, so the workers also read and partition the files in parallel
+    monkeypatch.setattr(out_of_core, 'MIN_RANGE_SIZE', 64 * 1024)
+    options = dict(VARIANTS[variant])
+    if 'cache_dir' in options:
+        options['cache_dir'] = str(tmp_path / options['cache_dir'])
+    runs = 2 if 'cache_dir' in options else 1
+    for run in range(runs):
+        output_dir = tmp_path / f'run{run}'
+        Data_Comparison.compare(pair['source'], pair['target'], key=pair['key'], output_dir=str(output_dir),
+                                chunk_size=500, verbose=False, **options)
+    for name in OUTPUTS:
+        assert filecmp.cmp(os.path.join(pair['reference'], name), output_dir / name, shallow=False), name
+
+
+@pytest.mark.parametrize('mode', ['hash', 'merge'])
+def test_permuted_columns_match_like_a_merge(tmp_path, mode):
+    (tmp_path / 'source.csv').write_text('ID|A|B\n1|x|y\n2|p|q\n3|m|n\n')
+    (tmp_path / 'target.csv').write_text('ID|B|A\n1|y|x\n2|q|p\n3|n|CHANGED\n')
+    result = Data_Comparison.compare(str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv'), key='ID',
+                                     output_dir=str(tmp_path / 'out'), mode=mode, verbose=False)
+    assert (result['num_matching_records'], result['num_unmatching_records']) == (2, 2)
+    assert (result['num_oracle_only_records'], result['num_datacloud_only_records']) == (0, 0)
@@ -0,0 +1,86 @@
+import filecmp
+import os
+import sys
+
+import boto3
+import moto
+import pandas as pd
+import pytest
+
+import Data_Comparison
+import downloadcode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import generate_data  # noqa: E402
+
+BUCKET = 'datacomparisonbucket'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in [('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1')]:
+        monkeypatch.setenv(name, value)
+    downloadcode.reset_client()
+    with moto.mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    downloadcode.reset_client()
+
+
+def record_ranges(client):
+    # Range of every GetObject call of the client, None for a whole object
+    ranges = []
+    client.meta.events.register('provide-client-params.s3.GetObject',
+                                lambda params, **kwargs: ranges.append(params.get('Range')))
+    return ranges
+
+
+def test_ranged_download_of_several_parts(s3, tmp_path):
+    body = bytes(range(256)) * 24 * 1024
+    s3.put_object(Bucket=BUCKET, Key='MyDataComp/file.bin', Body=body)
+    ranges = record_ranges(downloadcode.get_client())
+    stats = downloadcode.download_s3_file(BUCKET, 'MyDataComp/file.bin', str(tmp_path / 'file.bin'),
+                                          part_size=1024 ** 2, max_concurrency=4)
+    assert (tmp_path / 'file.bin').read_bytes() == body
+    assert stats['bytes'] == len(body) and len(ranges) == 6
+
+
+def test_failed_download_returns_none(s3, tmp_path):
+    links = [{'bucket_name': BUCKET, 's3_key': 'MyDataComp/missing.csv', 'local_path': str(tmp_path / 'missing.csv')}]
+    assert downloadcode.download_files(links) == [None]
+
+
+@pytest.mark.parametrize('delimiter', ['|', '|*|'])
+def test_streamed_csv_matches_local_read(s3, tmp_path, delimiter):
+    rows = [delimiter.join([f'BE{i:08d}', f'CAFÉ {i}', str(i)]) for i in range(5000)]
+    body = (delimiter.join(['CS_COMPANY_ID', 'BUSINESS_NAME', 'REVENUE']) + '\n' + '\n'.join(rows) + '\n')
+    (tmp_path / 'file.csv').write_bytes(body.encode('ISO-8859-1'))
+    s3.upload_file(str(tmp_path / 'file.csv'), BUCKET, 'MyDataComp/file.csv')
+    ranges = record_ranges(downloadcode.get_client())
+    df, throughput = downloadcode.read_s3_csv(BUCKET, 'MyDataComp/file.csv', delimiter, 'ISO-8859-1',
+                                              part_size=16 * 1024, parts_in_flight=3)
+    pd.testing.assert_frame_equal(df, downloadcode.csv_reader.read_csv(str(tmp_path / 'file.csv'), delimiter,
+                                                                       'ISO-8859-1'))
+    assert throughput['bytes'] == len(body.encode('ISO-8859-1'))
+    assert len(ranges) == -(-throughput['bytes'] // (16 * 1024))
+
+
+@pytest.mark.parametrize('delimiter', ['|', '|*|'])
+def test_compare_streams_s3_sources(s3, tmp_path, delimiter):
+    pair = generate_data.generate_pair(str(tmp_path / 'pair'), 3000, delimiter=delimiter, seed=2)
+    # The substitute byte sends the |*| target through the download fallback
+    if delimiter == '|*|':
+        with open(pair['target'], 'a', encoding=generate_data.ENCODING) as target_file:
+            target_file.write(delimiter.join(['BE99999999', 'SUB\x1fSTITUTE'] + [''] * 11) + '\n')
+    for name in ('source', 'target'):
+        s3.upload_file(pair[name], BUCKET, f'MyDataComp/{name}.csv')
+    ranges = record_ranges(downloadcode.get_client())
+    Data_Comparison.compare(f's3://{BUCKET}/MyDataComp/source.csv', f's3://{BUCKET}/MyDataComp/target.csv',
+                            output_dir=str(tmp_path / 's3'), verbose=False)
+    Data_Comparison.compare(pair['source'], pair['target'], output_dir=str(tmp_path / 'local'), verbose=False)
+    assert ranges
+    for name in ('output.txt', 'unmatched_data.csv', 'oracle_only_records.csv', 'datacloud_only_records.csv'):
+        assert filecmp.cmp(tmp_path / 's3' / name, tmp_path / 'local' / name, shallow=False), name
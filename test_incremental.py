@@ -0,0 +1,36 @@
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Data_Comparison
+
+OUTPUTS = ('output.txt', 'unmatched_data.csv', 'oracle_only_records.csv', 'datacloud_only_records.csv')
+
+
+def write_file(path, seed, num_records=400):
+    # Composite key with an empty part on every 7th record, several records per key
+    rng = np.random.default_rng(seed)
+    numbers = np.arange(num_records)
+    pd.DataFrame({'ID': numbers % 150,
+                  'TYPE': np.where(numbers % 7 == 0, '', np.where(numbers % 2, 'A', 'B')),
+                  'VALUE': rng.integers(0, 3, num_records)}).to_csv(path, sep='|', index=False)
+
+
+@pytest.mark.parametrize('compact_dtypes', [False, True])
+def test_index_dir_matches_full_comparison(tmp_path, compact_dtypes):
+    source, target = tmp_path / 'source.csv', tmp_path / 'target.csv'
+    write_file(source, 1)
+    write_file(target, 2)
+
+    def compare(output_dir, **options):
+        Data_Comparison.compare(str(source), str(target), key=['ID', 'TYPE'], output_dir=str(tmp_path / output_dir),
+                                compact_dtypes=compact_dtypes, verbose=False, **options)
+
+    compare('first', index_dir=str(tmp_path / 'index'))
+    write_file(target, 3)
+    compare('incremental', index_dir=str(tmp_path / 'index'))
+    compare('full')
+    for name in OUTPUTS:
+        assert filecmp.cmp(tmp_path / 'incremental' / name, tmp_path / 'full' / name, shallow=False), name
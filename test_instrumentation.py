@@ -0,0 +1,35 @@
+import json
+import os
+import sys
+
+import pytest
+
+import Data_Comparison
+import instrumentation
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import generate_data  # noqa: E402
+
+
+@pytest.mark.skipif(instrumentation.resource is None, reason='needs the resource module')
+def test_profile_of_a_workers_run(tmp_path):
+    pair = generate_data.generate_pair(str(tmp_path / 'pair'), 3000, seed=3)
+    result = Data_Comparison.compare(pair['source'], pair['target'], output_dir=str(tmp_path / 'out'),
+                                     chunk_size=500, workers=2, verbose=False)
+    assert result.profile_path == str(tmp_path / 'out' / instrumentation.PROFILE_FILE)
+    with open(result.profile_path) as profile_file:
+        profile = json.load(profile_file)
+
+    stages = {record['stage']: record for record in profile['stages']}
+    assert {'detect', 'out-of-core comparison', 'report write'} <= stages.keys()
+    assert all(record['wall_seconds'] >= 0 and record['cpu_seconds'] >= 0 for record in profile['stages'])
+    assert all(record['children_cpu_seconds'] >= 0 and record['peak_children_rss_bytes'] >= 0
+               for record in profile['stages'])
+    # The worker processes finish inside the out-of-core stage, their usage is there from then on
+    workers = stages['out-of-core comparison']
+    assert workers['rows'] == 3000 + result.target_profile.num_records
+    assert workers['children_cpu_seconds'] > 0 and workers['peak_children_rss_bytes'] > 0
+    assert profile['total_children_cpu_seconds'] >= workers['children_cpu_seconds']
+    assert profile['peak_children_rss_bytes'] >= workers['peak_children_rss_bytes']
+    assert profile['total_wall_seconds'] >= workers['wall_seconds']
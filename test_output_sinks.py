@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Data_Comparison
+import output_sinks
+
+FORMATS = ['csv', 'csv.gz', pytest.param('csv.zst', marks=pytest.mark.skipif(
+    output_sinks.zstandard is None, reason='needs zstandard')), 'parquet']
+
+
+def buckets():
+    # The first bucket has no changes, later ones have 'old -> new' text in the numeric VALUE column
+    return [pd.DataFrame({'ID': np.arange(start, start + 100), 'NAME': [f'NAME {i}' for i in range(100)],
+                          'VALUE': np.arange(100) if start == 0 else [f'{i} -> {i + 1}' for i in range(100)]})
+            for start in range(0, 400, 100)]
+
+
+def read_output(path, output_format):
+    if output_format == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def expected_output(frames, output_format):
+    expected = pd.concat(frames, ignore_index=True).astype({'NAME': str, 'VALUE': str})
+    return expected if output_format == 'parquet' else expected.astype(str)
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+@pytest.mark.parametrize('encoded', [False, True])
+def test_buckets_round_trip(tmp_path, output_format, encoded):
+    path = output_sinks.output_path(str(tmp_path), 'unmatched_data.csv', output_format)
+    with output_sinks.OutputSink(path, output_format, typed_columns=['ID']) as sink:
+        for number, frame in enumerate(buckets()):
+            if encoded:
+                sink.write_part(output_sinks.encode_part(frame, str(tmp_path / f'{number}.part'), output_format,
+                                                         ['ID']))
+            else:
+                sink.write(frame)
+    assert sink.summary() == {'path': path, 'rows': 400, 'written': 400}
+    assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+    pd.testing.assert_frame_equal(read_output(path, output_format), expected_output(buckets(), output_format))
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_max_rows_cuts_the_file_but_counts_every_record(tmp_path, output_format):
+    path = output_sinks.output_path(str(tmp_path), 'unmatched_data.csv', output_format)
+    with output_sinks.OutputSink(path, output_format, max_rows=150, typed_columns=['ID']) as sink:
+        for frame in buckets():
+            sink.write(frame)
+    assert (sink.rows, sink.written) == (400, 150)
+    pd.testing.assert_frame_equal(read_output(path, output_format),
+                                  expected_output(buckets(), output_format).iloc[:150])
+
+
+@pytest.mark.parametrize('options', [{'out_of_core': True}, {'workers': 2}])
+def test_parquet_outputs_of_buckets_match_in_memory(tmp_path, options):
+    # Only the last keys change, so the first buckets have no 'old -> new' text in VALUE
+    ids = np.arange(3000)
+    pd.DataFrame({'ID': ids, 'VALUE': ids}).to_csv(tmp_path / 'source.csv', sep='|', index=False)
+    pd.DataFrame({'ID': ids, 'VALUE': np.where(ids >= 2900, ids + 1, ids)}).to_csv(tmp_path / 'target.csv', sep='|',
+                                                                                   index=False)
+
+    def compare(output_dir, **options):
+        Data_Comparison.compare(str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv'), key='ID',
+                                output_dir=str(tmp_path / output_dir), chunk_size=500, output_format='parquet',
+                                verbose=False, **options)
+
+    compare('in_memory')
+    compare('buckets', **options)
+    for file_name in ('unmatched_data.parquet', 'oracle_only_records.parquet', 'datacloud_only_records.parquet'):
+        pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'buckets' / file_name),
+                                      pd.read_parquet(tmp_path / 'in_memory' / file_name))
+    unmatched_data = pd.read_parquet(tmp_path / 'buckets' / 'unmatched_data.parquet')
+    assert len(unmatched_data) == 100 and unmatched_data['VALUE'].iloc[0] == '2900 -> 2901'
@@ -0,0 +1,82 @@
+import csv
+
+import pytest
+
+import Data_Comparison
+import sniffing
+
+HEADER = 'CS_COMPANY_ID|BUSINESS_NAME|REVENUE\n'
+ROWS = ''.join(f'BE{i:08d}|CAFE {i}|{i * 10}\n' for i in range(50))
+
+
+def large(head, tail, rows=20000):
+    # Head and tail blocks of a file larger than three sample blocks, the middle is plain ASCII
+    middle = ''.join(f'BE{i:08d}|NAME {i}|{i}\n' for i in range(rows))
+    return head + middle.encode('ascii') + tail
+
+
+# File content and the format sniff_file must detect: encoding, delimiter, has_header, quoting
+CASES = {
+    'utf-8': ((HEADER + ROWS + 'BE99999999|CAFÉ|1\n').encode('utf-8'),
+              ('UTF-8', '|', True, csv.QUOTE_NONE)),
+    'latin-1': ((HEADER + ROWS + 'BE99999999|CAFÉ|1\n').encode('ISO-8859-1'),
+                ('ISO-8859-1', '|', True, csv.QUOTE_NONE)),
+    'utf-8 bom': (b'\xef\xbb\xbf' + (HEADER + ROWS).encode('utf-8'),
+                  ('utf-8-sig', '|', True, csv.QUOTE_NONE)),
+    'multi-character delimiter': ((HEADER + ROWS).replace('|', '|*|').encode('ascii'),
+                                  ('UTF-8', '|*|', True, csv.QUOTE_NONE)),
+    'pipes in the values of |*|': ((HEADER + ROWS).replace('|', '|*|').replace('CAFE', 'A|B').encode('ascii'),
+                                   ('UTF-8', '|*|', True, csv.QUOTE_NONE)),
+    'comma': ((HEADER + ROWS).replace('|', ',').encode('ascii'),
+              ('UTF-8', ',', True, csv.QUOTE_NONE)),
+    'no header': (ROWS.replace('BE', '').encode('ascii'),
+                  ('UTF-8', '|', False, csv.QUOTE_NONE)),
+    'quoted': ((HEADER + ''.join(f'BE{i:08d}|"CAFE, {i}"|{i}\n' for i in range(50))).encode('ascii'),
+               ('UTF-8', '|', True, csv.QUOTE_MINIMAL)),
+    'quote in a few values': ((HEADER + ROWS + 'BE99999999|"QUOTED"|1\n').encode('ascii'),
+                              ('UTF-8', '|', True, csv.QUOTE_NONE)),
+    'head utf-8, tail latin-1': (large(HEADER.encode('utf-8'), 'BE99999999|CAFÉ|1\n'.encode('ISO-8859-1')),
+                                 ('ISO-8859-1', '|', True, csv.QUOTE_NONE)),
+    'head |, tail |*|': (large(HEADER.encode('ascii'), (HEADER + ROWS).replace('|', '|*|').encode('ascii')),
+                         ('UTF-8', '|', True, csv.QUOTE_NONE)),
+}
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_sniff_file(tmp_path, name):
+    content, (encoding, delimiter, has_header, quoting) = CASES[name]
+    path = tmp_path / 'file.csv'
+    path.write_bytes(content)
+    file_format = sniffing.sniff_file(str(path))
+    assert (file_format['encoding'], file_format['delimiter'], file_format['has_header'],
+            file_format['quoting']) == (encoding, delimiter, has_header, quoting)
+
+
+def test_sample_has_whole_lines_of_head_middle_and_tail(tmp_path):
+    path = tmp_path / 'file.csv'
+    path.write_bytes(large(HEADER.encode('ascii'), b'BE99999999|TAIL|1\n'))
+    sample = sniffing.read_sample(str(path), block_size=4096)
+    lines = sample.decode('ascii').split('\n')
+    assert lines[0] == HEADER.strip() and lines[-2] == 'BE99999999|TAIL|1' and lines[-1] == ''
+    assert all(line.count('|') == 2 for line in lines[:-1])
+    assert len(sample) <= 3 * 4096
+
+
+def test_crlf_line_terminator(tmp_path):
+    path = tmp_path / 'file.csv'
+    path.write_bytes((HEADER + ROWS).replace('\n', '\r\n').encode('ascii'))
+    file_format = sniffing.sniff_file(str(path))
+    assert (file_format['line_terminator'], file_format['delimiter']) == ('\r\n', '|')
+
+
+def test_byte_outside_the_sample_falls_back_to_latin_1(tmp_path):
+    # A quarter into the file, between the sampled blocks: the sample decodes as UTF-8, the read switches to
+    # ISO-8859-1
+    latin = 'BE99999999|CAFÉ|1\n'.encode('ISO-8859-1')
+    rows = ''.join(f'BE{i:08d}|NAME {i}|{i}\n' for i in range(20000)).encode('ascii')
+    path = tmp_path / 'file.csv'
+    path.write_bytes(HEADER.encode('ascii') + rows + latin + 3 * rows)
+    assert sniffing.sniff_file(str(path))['encoding'] == 'UTF-8'
+    ingested = Data_Comparison.ingest_file(str(path), primary_key='CS_COMPANY_ID', chunk_size=5000)
+    assert ingested['encoding'] == sniffing.FALLBACK_ENCODING
+    assert 'CAFÉ' in ingested['df']['BUSINESS_NAME'].tolist()